@@ -0,0 +1,406 @@
+# *****************************************************************************
+# * | File        :	  ui.py
+# * | Author      :   NetStark
+# * | Function    :   UI rendering for the e-Paper screens
+# * | Info        :
+# *----------------
+# * | This version:   V1.0
+# * | Date        :   2026-10-18
+# # | Info        :   text run cache, reusable canvas and widgets for main.py
+# -----------------------------------------------------------------------------
+#
+# FreeType only runs the first time a string is drawn in a given font. The
+# result is kept as a 1-bit mask cropped to its ink, and drawing it again is
+# a masked paste into a canvas that is cleared and reused for every frame.
+#
+# Screens are built from widgets that remember what they last drew: a redraw
+# only touches the widgets, or list rows, whose text changed, and reports
+# their boxes so an unchanged screen is not sent to the display at all.
+#
+# With a Packer, the static labels of a screen (title, key hints) are drawn
+# and packed by the driver's getbuffer() once per panel. A redraw then only
+# packs the boxes that changed and merges them into the packed frame.
+#
+# The canvas is then kept in the panel's own memory layout (portrait on most
+# small panels) while screens are still laid out landscape: text runs are
+# rotated once when cached, and packing a frame is a tobytes() of the canvas
+# with no per-frame rotate.
+#
+
+import abc
+import logging
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageDraw
+from .waveshare_epd import epdbuffer
+
+logger = logging.getLogger(__name__)
+
+
+def font_key(font):
+    # fonts loaded twice from the same file and size share their runs
+    path = getattr(font, 'path', None)
+    if path is None:
+        return id(font)
+    return (path, getattr(font, 'index', 0), getattr(font, 'size', None))
+
+
+class TextCache:
+    '''
+    Rasterized text runs keyed by (font, size, string), least recently used
+    ones dropped past max_runs. A run is (dx, dy, mask): a '1' mask with
+    ink at 255, to paste at the text position moved by (dx, dy). mask is
+    None for text without ink. Runs for a portrait canvas are cached
+    separately, with the mask already turned by ROTATE_90.
+    '''
+
+    def __init__(self, max_runs=512):
+        self.max_runs = max_runs
+        self.runs = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, font, text, rotate=False):
+        key = (font_key(font), text, rotate)
+        with self.lock:
+            run = self.runs.get(key)
+            if run is not None:
+                self.runs.move_to_end(key)
+                self.hits += 1
+                return run
+        run = self.render(font, text)
+        if rotate and run[2] is not None:
+            run = (run[0], run[1], run[2].transpose(Image.ROTATE_90))
+        with self.lock:
+            self.misses += 1
+            self.runs[key] = run
+            while len(self.runs) > self.max_runs:
+                self.runs.popitem(last=False)
+        return run
+
+    @staticmethod
+    def render(font, text):
+        # same glyphs as ImageDraw.text() on a '1' image (no antialiasing)
+        left, top, right, bottom = font.getbbox(text, mode='1')
+        if right <= left or bottom <= top:
+            return (0, 0, None)
+        mask = Image.new('1', (right - left, bottom - top), 0)
+        ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255)
+        return (left, top, mask)
+
+    def stats(self):
+        return {"runs": len(self.runs), "hits": self.hits, "misses": self.misses}
+
+
+class Canvas:
+    '''
+    A '1' frame reused for every screen. Hold it with `with canvas:` while
+    composing (button callbacks and refresher threads share it), then hand
+    frame() to the display, which gets its own copy.
+
+    Coordinates are always in `size`, the landscape layout of the screens.
+    Given a packer that can pack regions, the image itself is in the
+    panel's memory layout, rows padded to whole bytes, and frame() returns
+    the packed buffer instead of an image.
+    '''
+
+    def __init__(self, size, cache=None, packer=None):
+        self.size = tuple(size)
+        self.cache = cache if cache is not None else TextCache()
+        self.packer = packer if packer is not None and packer.regions else None
+        if self.packer is None:
+            self.panel = self.size
+            self.image = Image.new('1', self.size, 255)
+        else:
+            self.panel = (self.packer.width, self.packer.height)
+            self.image = Image.new('1', (self.packer.linewidth * 8, self.packer.height), 255)
+        self.rotate = self.panel != self.size
+        self.lock = threading.RLock()
+        # Screen whose widgets are on the canvas, None after a full clear()
+        self.owner = None
+
+    def __enter__(self):
+        self.lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+    def rect(self, box):
+        # a box of the layout on the image
+        if not self.rotate:
+            return tuple(box)
+        return epdbuffer.panel_rect(tuple(box), self.size, *self.panel)
+
+    def clear(self, box=None):
+        # white, the whole canvas or the (x0, y0, x1, y1) box
+        if box is None:
+            self.image.paste(255, (0, 0) + self.image.size)
+            self.owner = None
+        else:
+            self.image.paste(255, self.rect(box))
+
+    def text(self, xy, text, font, clip=None):
+        # clip: (x0, y0, x1, y1) box the ink is kept inside
+        dx, dy, mask = self.cache.get(font, text, self.rotate)
+        if mask is None:
+            return
+        x, y = xy[0] + dx, xy[1] + dy
+        if self.rotate:
+            w, h = mask.height, mask.width
+        else:
+            w, h = mask.size
+        box = self.rect((x, y, x + w, y + h))
+        if clip is None:
+            clip = (0, 0) + self.size
+        clip = self.rect(clip)
+        cut = (max(box[0], clip[0]), max(box[1], clip[1]),
+               min(box[2], clip[2]), min(box[3], clip[3]))
+        if cut[2] <= cut[0] or cut[3] <= cut[1]:
+            return
+        if cut != box:
+            mask = mask.crop((cut[0] - box[0], cut[1] - box[1],
+                              cut[2] - box[0], cut[3] - box[1]))
+        self.image.paste(0, cut, mask)
+
+    def frame(self):
+        if self.packer is not None:
+            return self.packer.pack(self)
+        return self.image.copy()
+
+
+class Label:
+    '''
+    One line of text in a fixed box, drawn at `offset` from its top left
+    corner. Headers and footers.
+    '''
+
+    def __init__(self, box, font, text="", offset=(10, 0)):
+        self.box = tuple(box)
+        self.font = font
+        self.text = text
+        self.offset = offset
+        self.shown = None
+
+    def render(self, canvas, full=False):
+        # boxes redrawn, empty when the text did not change
+        if not full and self.shown == self.text:
+            return []
+        canvas.clear(self.box)
+        canvas.text((self.box[0] + self.offset[0], self.box[1] + self.offset[1]),
+                    self.text, self.font, clip=self.box)
+        self.shown = self.text
+        return [self.box]
+
+
+class Rows(abc.ABC):
+    '''
+    Lines of text stacked in a box, row_height pixels apart. Subclasses
+    give what should be shown with lines(); render() only redraws the rows
+    that differ from what is on the canvas.
+    '''
+
+    def __init__(self, box, font, row_height, offset=(10, 0)):
+        self.box = tuple(box)
+        self.font = font
+        self.row_height = row_height
+        self.offset = offset
+        self.count = max(1, (self.box[3] - self.box[1]) // row_height)
+        self.shown = None
+
+    @abc.abstractmethod
+    def lines(self):
+        # one string per row, at most self.count of them
+        return []
+
+    def row_box(self, i):
+        y = self.box[1] + i * self.row_height
+        return (self.box[0], y, self.box[2], y + self.row_height)
+
+    def render(self, canvas, full=False):
+        lines = list(self.lines())[:self.count]
+        lines += [""] * (self.count - len(lines))
+        if full or self.shown is None:
+            self.shown = [None] * self.count
+        boxes = []
+        for i, line in enumerate(lines):
+            if line == self.shown[i]:
+                continue
+            box = self.row_box(i)
+            canvas.clear(box)
+            canvas.text((box[0] + self.offset[0], box[1] + self.offset[1]),
+                        line, self.font, clip=box)
+            boxes.append(box)
+        self.shown = lines
+        return boxes
+
+
+class ListView(Rows):
+    '''
+    A scrolling list with a cursor. Items go through fmt() and get a "> "
+    mark on the cursor row; as many rows as fit in the box are shown.
+    '''
+
+    def __init__(self, box, font, items=(), row_height=18, fmt=str, offset=(10, 0)):
+        super().__init__(box, font, row_height, offset)
+        self.fmt = fmt
+        self.set_items(items)
+
+    def set_items(self, items):
+        self.items = list(items)
+        self.cursor = 0
+        self.start = 0
+
+    def move(self, delta, wrap=False):
+        n = len(self.items)
+        if not n:
+            return
+        if wrap:
+            self.cursor = (self.cursor + delta) % n
+        else:
+            self.cursor = max(0, min(n - 1, self.cursor + delta))
+        if self.cursor < self.start:
+            self.start = self.cursor
+        elif self.cursor >= self.start + self.count:
+            self.start = self.cursor - self.count + 1
+
+    def selected(self):
+        return self.items[self.cursor] if self.items else None
+
+    def lines(self):
+        end = min(self.start + self.count, len(self.items))
+        return [("> " if i == self.cursor else "  ") + self.fmt(self.items[i])
+                for i in range(self.start, end)]
+
+
+class LogView(Rows):
+    '''
+    The last lines of a growing list of strings, like a command output.
+    '''
+
+    def __init__(self, box, font, lines, row_height=12, max_lines=None,
+                 max_chars=40, offset=(10, 0)):
+        super().__init__(box, font, row_height, offset)
+        if max_lines is not None:
+            self.count = min(self.count, max_lines)
+        self.source = lines
+        self.max_chars = max_chars
+
+    def lines(self):
+        return [line[:self.max_chars] for line in self.source[-self.count:]]
+
+
+class Packer:
+    '''
+    Packs canvas content into frame buffers of one driver. pack() is the
+    driver's getbuffer(). When that is the plain epdbuffer.pack_1bit()
+    layout, checked once on a probe frame, `regions` is True and
+    pack_region() packs a single box; templates keeps the packed static
+    layers of the screens.
+    '''
+
+    def __init__(self, epd, size):
+        self.epd = epd
+        self.size = tuple(size)
+        self.width = epd.width
+        self.height = epd.height
+        self.linewidth = epdbuffer.linewidth(self.width)
+        self.templates = {}
+        white = bytes(epd.getbuffer(Image.new('1', self.size, 255)))
+        self.invert = white[:1] == b'\x00'
+        probe = Image.effect_noise(self.size, 100).convert('1')
+        expected = epdbuffer.pack_1bit(probe, self.width, self.height, self.invert)
+        self.regions = expected is not None and bytes(epd.getbuffer(probe)) == bytes(expected)
+        if not self.regions:
+            logger.info("%s: no region packing, whole frames are packed",
+                        type(epd).__module__)
+
+    def pack(self, canvas):
+        # the whole canvas, a plain copy of its rows when it is in panel layout
+        if canvas.packer is None:
+            return bytes(self.epd.getbuffer(canvas.image))
+        buf = canvas.image.tobytes('raw', '1')
+        return buf.translate(epdbuffer.INVERT_TABLE) if self.invert else buf
+
+    def pack_region(self, canvas, box):
+        # (panel window, packed rows) of one box of the canvas
+        if canvas.packer is None:
+            return epdbuffer.pack_1bit_region(canvas.image, self.width, self.height,
+                                              box, self.invert)
+        x0, y0, x1, y1 = canvas.rect(box)
+        bx0, bx1 = epdbuffer.window_bytes(max(x0, 0), min(x1, self.width))
+        y0, y1 = max(y0, 0), min(y1, self.height)
+        buf = canvas.image.crop((bx0 * 8, y0, bx1 * 8, y1)).tobytes('raw', '1')
+        if self.invert:
+            buf = buf.translate(epdbuffer.INVERT_TABLE)
+        return (bx0 * 8, y0, min(bx1 * 8, self.width), y1), buf
+
+    def merge(self, a, b):
+        return epdbuffer.merge(a, b, self.invert)
+
+    def template(self, labels, cache):
+        # packed frame of the static labels, built once per set of labels
+        key = tuple((l.box, l.offset, l.text, font_key(l.font)) for l in labels)
+        packed = self.templates.get(key)
+        if packed is None:
+            layer = Canvas(self.size, cache, self)
+            for label in labels:
+                label.render(layer, True)
+            packed = self.templates[key] = self.pack(layer)
+        return packed
+
+
+class Screen:
+    '''
+    Widgets drawn together on a canvas. render() redraws what changed and
+    returns (frame, boxes): frame is None when nothing did. The canvas is
+    repainted from scratch when `full` is set or another screen drew on it
+    since.
+
+    `static` labels never change. With a packer that can pack regions they
+    stay off the canvas: the frame returned is then already packed, the
+    static template merged with the packed boxes that were redrawn.
+    '''
+
+    def __init__(self, canvas, *widgets, static=(), packer=None):
+        self.canvas = canvas
+        self.widgets = list(widgets)
+        self.static = list(static)
+        self.packer = packer if packer is not None and packer.regions else None
+        self.buf = None
+
+    def render(self, full=False):
+        with self.canvas as canvas:
+            if full or canvas.owner is not self:
+                canvas.clear()
+                canvas.owner = self
+                full = True
+            widgets = self.widgets if self.packer else self.static + self.widgets
+            boxes = []
+            for widget in widgets:
+                boxes += widget.render(canvas, full)
+            if self.packer is None:
+                return (canvas.frame() if boxes else None), boxes
+            if full:
+                boxes += [label.box for label in self.static]
+            if not boxes:
+                return None, boxes
+            return self.pack(canvas, boxes, full), boxes
+
+    def pack(self, canvas, boxes, full):
+        packer = self.packer
+        static = packer.template(self.static, canvas.cache)
+        if full or self.buf is None or canvas.rotate:
+            # on a portrait panel a layout row spans every panel row, one
+            # tobytes() of the whole canvas is cheaper than cutting them
+            self.buf = bytearray(packer.merge(static, packer.pack(canvas)))
+            return bytes(self.buf)
+        lw = packer.linewidth
+        for box in boxes:
+            rect, data = packer.pack_region(canvas, box)
+            data = packer.merge(epdbuffer.region(static, lw, *rect), data)
+            epdbuffer.put_region(self.buf, lw, *rect, data)
+        return bytes(self.buf)
+
+### END OF FILE ###
@@ -0,0 +1,141 @@
+# *****************************************************************************
+# * | File        :	  __init__.py
+# * | Author      :   NetStark
+# * | Function    :   Panel registry
+# * | Info        :
+# *----------------
+# * | This version:   V1.0
+# * | Date        :   2026-10-18
+# # | Info        :   maps panel names to driver modules and capabilities
+# -----------------------------------------------------------------------------
+#
+# Nothing is imported here: the driver module of a panel (and epdconfig with
+# it) is only loaded by load() / create(), so picking a panel or sizing a
+# layout from its capabilities costs no hardware probing.
+#
+
+import importlib
+from collections import namedtuple
+
+DEFAULT_PANEL = 'epd2in13_V4'
+
+
+class Panel(namedtuple('Panel', 'name width height colors partial fast gray4')):
+    '''
+    Capabilities of a panel, in the driver's own orientation.
+        width, height : resolution as EPD_WIDTH / EPD_HEIGHT of the driver
+        colors        : 2 black/white, 3 black/white/red or yellow,
+                        4, 6 and 7 for the ACeP / Spectra panels
+        partial       : the driver has a partial refresh
+        fast          : the driver has a fast refresh mode
+        gray4         : the driver has display_4Gray()
+    '''
+    __slots__ = ()
+
+    @property
+    def size(self):
+        # landscape canvas size, getbuffer() turns it to the panel itself
+        return max(self.width, self.height), min(self.width, self.height)
+
+
+PANELS = {p.name: p for p in [
+    #     name               width height colors partial fast  gray4
+    Panel('epd1in54',          200, 200, 2, True,  False, False),
+    Panel('epd1in54_V2',       200, 200, 2, True,  False, False),
+    Panel('epd1in54b',         200, 200, 3, False, False, False),
+    Panel('epd1in54b_V2',      200, 200, 3, False, False, False),
+    Panel('epd1in54c',         152, 152, 3, False, False, False),
+    Panel('epd1in64g',         168, 168, 4, False, False, False),
+    Panel('epd2in13',          122, 250, 2, True,  False, False),
+    Panel('epd2in13_V2',       122, 250, 2, True,  False, False),
+    Panel('epd2in13_V3',       122, 250, 2, True,  False, False),
+    Panel('epd2in13_V4',       122, 250, 2, True,  True,  False),
+    Panel('epd2in13b_V3',      104, 212, 3, False, False, False),
+    Panel('epd2in13b_V4',      122, 250, 3, False, False, False),
+    Panel('epd2in13bc',        104, 212, 3, False, False, False),
+    Panel('epd2in13d',         104, 212, 2, True,  False, False),
+    Panel('epd2in13g',         122, 250, 4, False, False, False),
+    Panel('epd2in15b',         160, 296, 3, False, False, False),
+    Panel('epd2in15g',         160, 296, 4, False, False, False),
+    Panel('epd2in36g',         168, 296, 4, False, False, False),
+    Panel('epd2in66',          152, 296, 2, False, False, False),
+    Panel('epd2in66b',         152, 296, 3, False, False, False),
+    Panel('epd2in66g',         184, 360, 4, False, False, False),
+    Panel('epd2in7',           176, 264, 2, False, False, True),
+    Panel('epd2in7_V2',        176, 264, 2, True,  True,  True),
+    Panel('epd2in7b',          176, 264, 3, False, False, False),
+    Panel('epd2in7b_V2',       176, 264, 3, False, False, False),
+    Panel('epd2in9',           128, 296, 2, True,  False, False),
+    Panel('epd2in9_V2',        128, 296, 2, True,  True,  True),
+    Panel('epd2in9b_V3',       128, 296, 3, False, False, False),
+    Panel('epd2in9b_V4',       128, 296, 3, True,  True,  False),
+    Panel('epd2in9bc',         128, 296, 3, False, False, False),
+    Panel('epd2in9d',          128, 296, 2, True,  False, False),
+    Panel('epd3in0g',          168, 400, 4, False, False, False),
+    Panel('epd3in52',          240, 360, 2, False, False, False),
+    Panel('epd3in7',           280, 480, 2, False, False, True),
+    Panel('epd4in01f',         640, 400, 7, False, False, False),
+    Panel('epd4in2',           400, 300, 2, True,  False, True),
+    Panel('epd4in26',          800, 480, 2, True,  True,  True),
+    Panel('epd4in2_V2',        400, 300, 2, True,  True,  True),
+    Panel('epd4in2b_V2',       400, 300, 3, False, False, False),
+    Panel('epd4in2b_V2_old',   400, 300, 3, False, False, False),
+    Panel('epd4in2bc',         400, 300, 3, False, False, False),
+    Panel('epd4in37g',         512, 368, 4, False, False, False),
+    Panel('epd5in65f',         600, 448, 7, False, False, False),
+    Panel('epd5in79',          792, 272, 2, True,  True,  True),
+    Panel('epd5in79b',         792, 272, 3, False, False, False),
+    Panel('epd5in79g',         792, 272, 4, False, False, False),
+    Panel('epd5in83',          600, 448, 2, False, False, False),
+    Panel('epd5in83_V2',       648, 480, 2, True,  True,  True),
+    Panel('epd5in83b_V2',      648, 480, 3, False, False, False),
+    Panel('epd5in83bc',        600, 448, 3, False, False, False),
+    Panel('epd7in3e',          800, 480, 6, False, False, False),
+    Panel('epd7in3f',          800, 480, 7, False, False, False),
+    Panel('epd7in3g',          800, 480, 4, False, False, False),
+    Panel('epd7in5',           640, 384, 2, False, False, False),
+    Panel('epd7in5_HD',        880, 528, 2, False, False, False),
+    Panel('epd7in5_V2',        800, 480, 2, True,  True,  True),
+    Panel('epd7in5_V2_old',    800, 480, 2, True,  True,  False),
+    Panel('epd7in5b_HD',       880, 528, 3, False, False, False),
+    Panel('epd7in5b_V2',       800, 480, 3, True,  True,  False),
+    Panel('epd7in5b_V2_old',   800, 480, 3, False, False, False),
+    Panel('epd7in5bc',         640, 384, 3, False, False, False),
+    Panel('epd13in3b',         960, 680, 3, True,  False, False),
+    Panel('epd13in3k',         960, 680, 2, True,  False, True),
+]}
+
+
+def panel(name=DEFAULT_PANEL):
+    '''
+    function : Capabilities of a panel, without loading its driver
+    parameter:
+        name : driver module name, e.g. 'epd2in13_V4'
+    return   : Panel, raises ValueError for unknown names
+    '''
+    try:
+        return PANELS[name]
+    except KeyError:
+        raise ValueError("unknown panel %r" % name) from None
+
+
+def load(name=DEFAULT_PANEL):
+    '''
+    function : Import the driver module of a panel, on first use only
+    parameter:
+        name : driver module name
+    return   : the driver module
+    '''
+    return importlib.import_module('.' + panel(name).name, __name__)
+
+
+def create(name=DEFAULT_PANEL):
+    '''
+    function : Instantiate the EPD class of a panel
+    parameter:
+        name : driver module name
+    return   : EPD object, init() not called yet
+    '''
+    return load(name).EPD()
+
+### END OF FILE ###
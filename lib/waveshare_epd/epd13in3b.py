@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 960
@@ -77,15 +78,12 @@ class EPD:
     def send_data2(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.SPI.writebytes2(data)
+        epdconfig.spi_writebyte2(data)
         epdconfig.digital_write(self.cs_pin, 1)
 
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 1):
-            busy = epdconfig.digital_read(self.busy_pin)
-            epdconfig.delay_ms(20)
+        epdconfig.wait_busy(1)
         epdconfig.delay_ms(20)
         logger.debug("e-Paper busy release")
 
@@ -156,78 +154,46 @@ class EPD:
 
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
+        buf = epdbuffer.pack_1bit(image, self.width, self.height)
+        if buf is None:
+            return [0xFF] * (int(self.width/8) * self.height)
         return buf
 
     def Clear(self):
         self.send_command(0x24)
-        self.send_data2([0xFF] * (int(self.width/8) * self.height))
+        self.send_data2(epdbuffer.fill(0xFF, int(self.width/8) * self.height))
         self.send_command(0x26)
-        self.send_data2([0x00] * (int(self.width/8) * self.height))
+        self.send_data2(epdbuffer.fill(0x00, int(self.width/8) * self.height))
 
         self.TurnOnDisplay()
 
     def Clear_Base(self):
         self.send_command(0x24)
-        self.send_data2([0xFF] * (int(self.width/8) * self.height))
+        self.send_data2(epdbuffer.fill(0xFF, int(self.width/8) * self.height))
         self.send_command(0x26)
-        self.send_data2([0x00] * (int(self.width/8) * self.height))
+        self.send_data2(epdbuffer.fill(0x00, int(self.width/8) * self.height))
 
         self.TurnOnDisplay()
         self.send_command(0x26)
-        self.send_data2([0xFF] * (int(self.width/8) * self.height))
+        self.send_data2(epdbuffer.fill(0xFF, int(self.width/8) * self.height))
     
     def display(self, blackimage, ryimage):
-        if(self.width % 8 == 0):
-            Width = self.width // 8
-        else:
-            Width = self.width // 8 +1
-        Height = self.height
         if (blackimage != None):
             self.send_command(0x24)
             self.send_data2(blackimage)        
         if (ryimage != None):
-            for j in range(Height):
-                for i in range(Width):
-                    ryimage[i + j * Width] = ~ryimage[i + j * Width]
+            ryimage = epdbuffer.invert(ryimage)
             self.send_command(0x26)
             self.send_data2(ryimage)
 
         self.TurnOnDisplay()
 
     def display_Base(self, blackimage, ryimage):
-        if(self.width % 8 == 0):
-            Width = self.width // 8
-        else:
-            Width = self.width // 8 +1
-        Height = self.height
         if (blackimage != None):
             self.send_command(0x24)
             self.send_data2(blackimage)        
         if (ryimage != None):
-            for j in range(Height):
-                for i in range(Width):
-                    ryimage[i + j * Width] = ~ryimage[i + j * Width]
+            ryimage = epdbuffer.invert(ryimage)
             self.send_command(0x26)
             self.send_data2(ryimage)
 
@@ -236,6 +202,27 @@ class EPD:
         self.send_command(0x26)
         self.send_data2(blackimage)
 
+    def displayPartBaseImage(self, image):
+        '''
+        function : Full refresh of a black image, red left blank, that also
+                   becomes the base of display_region()
+        parameter:
+            image : Image data
+        '''
+        self.display_Base(image, epdbuffer.fill(0xFF, len(image)))
+
+    def loadPartBaseImage(self, image):
+        '''
+        function : Load a base image for display_region() without refreshing
+        parameter:
+            image : Image data
+        '''
+        self.set_window(0, 0, self.width, self.height)
+        self.send_command(0x24)
+        self.send_data2(image)
+        self.send_command(0x26)
+        self.send_data2(image)
+
     def display_Partial(self, Image, Xstart, Ystart, Xend, Yend):
         if((Xstart % 8 + Xend % 8 == 8 & Xstart % 8 > Xend % 8) | Xstart % 8 + Xend % 8 == 0 | (Xend - Xstart)%8 == 0):
             Xstart = Xstart // 8
@@ -251,7 +238,6 @@ class EPD:
             Width = self.width // 8
         else:
             Width = self.width // 8 +1
-        Height = self.height
 
         Xend -= 1
         Yend -= 1
@@ -277,18 +263,50 @@ class EPD:
         self.send_data(Ystart & 0xff)
         self.send_data((Ystart>>8) & 0x01)
 
+        window = epdbuffer.region(Image, Width, Xstart * 8, Ystart, (Xend + 1) * 8, Yend + 1)
         self.send_command(0x24) 
-        for j in range(Height):
-            for i in range(Width):
-                if((j > Ystart-1) & (j < (Yend + 1)) & (i > Xstart-1) & (i < (Xend + 1))):
-                    self.send_data(Image[i + j * Width])
+        self.send_data2(window)
         self.TurnOnDisplay_Part()
 
         self.send_command(0x26) 
-        for j in range(Height):
-            for i in range(Width):
-                if((j > Ystart-1) & (j < (Yend + 1)) & (i > Xstart-1) & (i < (Xend + 1))):
-                    self.send_data(Image[i + j * Width])
+        self.send_data2(window)
+
+    # Partial refresh of the window x0 <= x < x1, y0 <= y < y1 (panel
+    # orientation, x widened to whole bytes). Only the window is sent.
+    def display_region(self, image, x0, y0, x1, y1):
+        self.send_command(0x3C)
+        self.send_data(0x80)
+        self.set_window(x0, y0, x1, y1)
+
+        window = epdbuffer.region(image, epdbuffer.linewidth(self.width), x0, y0, x1, y1)
+        self.send_command(0x24)
+        self.send_data2(window)
+        self.TurnOnDisplay_Part()
+
+        self.send_command(0x26)
+        self.send_data2(window)
+
+    def set_window(self, x0, y0, x1, y1):
+        bx0, bx1 = epdbuffer.window_bytes(x0, x1)
+        Xstart, Xend, Yend = bx0 * 8, bx1 * 8 - 1, y1 - 1
+
+        self.send_command(0x44)
+        self.send_data(Xstart & 0xff)
+        self.send_data((Xstart >> 8) & 0x03)
+        self.send_data(Xend & 0xff)
+        self.send_data((Xend >> 8) & 0x03)
+        self.send_command(0x45)
+        self.send_data(y0 & 0xff)
+        self.send_data((y0 >> 8) & 0x03)
+        self.send_data(Yend & 0xff)
+        self.send_data((Yend >> 8) & 0x03)
+
+        self.send_command(0x4E)
+        self.send_data(Xstart & 0xff)
+        self.send_data((Xstart >> 8) & 0x03)
+        self.send_command(0x4F)
+        self.send_data(y0 & 0xff)
+        self.send_data((y0 >> 8) & 0x03)
 
     def sleep(self):
         self.send_command(0x10) # DEEP_SLEEP
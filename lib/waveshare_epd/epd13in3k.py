@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 960
@@ -42,6 +43,9 @@ GRAY4  = 0x00 #Blackest
 
 logger = logging.getLogger(__name__)
 
+# init scripts by mode, see EPD.script()
+_SCRIPTS = {}
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -122,15 +126,12 @@ class EPD:
     def send_data2(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.SPI.writebytes2(data)
+        epdconfig.spi_writebyte2(data)
         epdconfig.digital_write(self.cs_pin, 1)
 
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 1):
-            busy = epdconfig.digital_read(self.busy_pin)
-            epdconfig.delay_ms(20)
+        epdconfig.wait_busy(1)
         epdconfig.delay_ms(20)
         logger.debug("e-Paper busy release")
 
@@ -152,218 +153,91 @@ class EPD:
         self.send_command(0x20) #Activate Display Update Sequence
         self.ReadBusy()
 
-    def Lut(self, LUT):
-        self.send_command(0x32)
-        for i in range(105):
-            self.send_data(LUT[i])
-
-        self.send_command(0x03) 
-        self.send_data(LUT[105])
-
-        self.send_command(0x04)  
-        self.send_data(LUT[106])
-        self.send_data(LUT[107]) 
-        self.send_data(LUT[108])
+    @staticmethod
+    def _lut_steps(LUT):
+        return [
+            (0x32, LUT[0:105]),
+            (0x03, LUT[105:106]),
+            (0x04, LUT[106:109]),
+            (0x2C, LUT[109:110]),
+        ]
+
+    def _steps(self, mode):
+        # register writes of each mode, compiled once by script()
+        setup = [
+            ('busy', 1),
+            (0x12, None),   #SWRESET
+            ('busy', 1),
+            (0x0C, [0xAE, 0xC7, 0xC3, 0xC0, 0x80]),
+            (0x01, [0xA7, 0x02, 0x00]),
+            (0x11, 0x03),
+            (0x44, [0x00, 0x00, 0xBF, 0x03]),
+            (0x45, [0x00, 0x00, 0xA7, 0x02]),
+            (0x3C, 0x05),
+            (0x18, 0x80),
+            (0x4E, [0x00, 0x00]),
+            (0x4F, [0x00, 0x00]),
+        ]
+        if mode == 'full':
+            return setup
+        if mode == 'partial':
+            return [(0x3C, 0x80)] + self._lut_steps(self.Lut_Partial) + [
+                (0x37, [0x00, 0x00, 0x00, 0x00, 0x00, 0x40, 0x00, 0x00, 0x00, 0x00]),
+                (0x3C, 0x80),
+                (0x22, 0xC0),
+                (0x20, None),
+                ('busy', 1),
+            ]
+        if mode == '4gray':
+            setup[8] = (0x3C, 0x00)
+            return setup + self._lut_steps(self.LUT_DATA_4Gray) + [('busy', 1)]
+        raise ValueError("unknown mode %r" % mode)
+
+    def script(self, mode):
+        '''
+        function : Init script of a mode, compiled on first use
+        parameter:
+            mode : 'full', 'partial' or '4gray'
+        '''
+        script = _SCRIPTS.get(mode)
+        if script is None:
+            script = _SCRIPTS[mode] = epdconfig.compile_script(self._steps(mode))
+        return script
 
-        self.send_command(0x2C)
-        self.send_data(LUT[109])
+    def Lut(self, LUT):
+        epdconfig.send_sequence(self._lut_steps(LUT))
         
     def init(self):
         
         # EPD hardware init start
         self.reset()
-        self.ReadBusy()
-
-        self.send_command(0x12) #SWRESET
-        self.ReadBusy()
-
-        self.send_command(0x0C) 
-        self.send_data(0xAE)
-        self.send_data(0xC7)  
-        self.send_data(0xC3)
-        self.send_data(0xC0)
-        self.send_data(0x80)
-
-        self.send_command(0x01) 
-        self.send_data(0xA7)
-        self.send_data(0x02)  
-        self.send_data(0x00)
-
-        self.send_command(0x11)
-        self.send_data(0x03)
-
-        self.send_command(0x44) 
-        self.send_data(0x00)
-        self.send_data(0x00)  
-        self.send_data(0xBF)
-        self.send_data(0x03) 
-        
-        self.send_command(0x45) 
-        self.send_data(0x00)
-        self.send_data(0x00)  
-        self.send_data(0xA7)
-        self.send_data(0x02)
-
-        self.send_command(0x3C) 
-        self.send_data(0x05)
-
-        self.send_command(0x18) 
-        self.send_data(0x80)
-
-        self.send_command(0x4E) 
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0x4F) 
-        self.send_data(0x00)
-        self.send_data(0x00) 
-
+        epdconfig.run_script(self.script('full'), self.ReadBusy)
         # EPD hardware init end
         return 0
 
     def init_Part(self):
         self.reset()
+        epdconfig.run_script(self.script('partial'), self.ReadBusy)
 
-        self.send_command(0x3C)    
-        self.send_data(0x80)
-
-        self.Lut(self.Lut_Partial)
-
-        self.send_command(0x37) 
-        self.send_data(0x00)  
-        self.send_data(0x00)  
-        self.send_data(0x00)  
-        self.send_data(0x00)  
-        self.send_data(0x00) 
-        self.send_data(0x40)  
-        self.send_data(0x00)  
-        self.send_data(0x00)   
-        self.send_data(0x00)  
-        self.send_data(0x00)  
-
-        self.send_command(0x3C) 
-        self.send_data(0x80)   
-
-        self.send_command(0x22) 
-        self.send_data(0xC0)   
-        self.send_command(0x20) 
-
-        self.ReadBusy()
     def init_4GRAY(self):
         self.reset()
-
-        self.ReadBusy()   
-        self.send_command(0x12)
-        self.ReadBusy()   
-
-        self.send_command(0x0C)   
-        self.send_data(0xAE)
-        self.send_data(0xC7)
-        self.send_data(0xC3)
-        self.send_data(0xC0)
-        self.send_data(0x80)
-
-        self.send_command(0x01) 
-        self.send_data(0xA7)
-        self.send_data(0x02)  
-        self.send_data(0x00)
-
-        self.send_command(0x11)
-        self.send_data(0x03) 
-
-        self.send_command(0x44) 
-        self.send_data(0x00)
-        self.send_data(0x00)  
-        self.send_data(0xBF)
-        self.send_data(0x03) 
-        
-        self.send_command(0x45) 
-        self.send_data(0x00)
-        self.send_data(0x00)  
-        self.send_data(0xA7)
-        self.send_data(0x02)
-
-        self.send_command(0x3C)
-        self.send_data(0x00)
-
-        self.send_command(0x18) 
-        self.send_data(0x80)
-        
-        self.send_command(0x4E) 
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0x4F) 
-        self.send_data(0x00)
-        self.send_data(0x00) 
-
-        self.Lut(self.LUT_DATA_4Gray)
-        
-        self.ReadBusy()
+        epdconfig.run_script(self.script('4gray'), self.ReadBusy)
 
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
+        buf = epdbuffer.pack_1bit(image, self.width, self.height)
+        if buf is None:
+            return [0xFF] * (int(self.width/8) * self.height)
         return buf
 
     def getbuffer_4Gray(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
-        image_monocolor = image.convert('L')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i=0
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((x + (y * self.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
-                        
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = self.height - x - 1
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((newx + (newy * self.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6) 
+        buf = epdbuffer.pack_4gray(image, self.width, self.height)
+        if buf is None:
+            return [0xFF] * (int(self.width / 4) * self.height)
         return buf
 
     def Clear(self):
-        buf = [0xFF] * (int(self.width/8) * self.height)
+        buf = epdbuffer.fill(0xFF, int(self.width/8) * self.height)
         self.send_command(0x24)
         self.send_data2(buf)
 
@@ -384,6 +258,29 @@ class EPD:
 
         self.TurnOnDisplay()
 
+    def displayPartBaseImage(self, image):
+        '''
+        function : Full refresh that also becomes the base of display_region()
+        parameter:
+            image : Image data
+        '''
+        self.display_Base(image)
+        self.init_Part()
+
+    def loadPartBaseImage(self, image):
+        '''
+        function : Load a base image for display_region() without refreshing
+                   and switch to the partial waveform
+        parameter:
+            image : Image data
+        '''
+        self.init_Part()
+        self.set_window(0, 0, self.width, self.height)
+        self.send_command(0x24)
+        self.send_data2(image)
+        self.send_command(0x26)
+        self.send_data2(image)
+
     def display_Base_color(self, color):
         if(self.width % 8 == 0):
             Width = self.width // 8
@@ -391,14 +288,10 @@ class EPD:
             Width = self.width // 8 +1
         Height = self.height
         self.send_command(0x24)   #Write Black and White image to RAM
-        for j in range(Height):
-            for i in range(Width):
-                self.send_data(color)
+        self.send_data2(epdbuffer.fill(color, Height * Width))
                 
         self.send_command(0x26)  #Write Black and White image to RAM
-        for j in range(Height):
-            for i in range(Width):
-                self.send_data(color)
+        self.send_data2(epdbuffer.fill(color, Height * Width))
         # self.TurnOnDisplay()
 
     def display_Partial(self, Image, Xstart, Ystart, Xend, Yend):
@@ -416,7 +309,6 @@ class EPD:
             Width = self.width // 8
         else:
             Width = self.width // 8 +1
-        Height = self.height
 
         Xend -= 1
         Yend -= 1
@@ -440,77 +332,49 @@ class EPD:
         self.send_data((Ystart>>8) & 0x01)
 
         self.send_command(0x24)  
-        for j in range(Height):
-            for i in range(Width):
-                if((j > Ystart-1) & (j < (Yend + 1)) & (i > Xstart-1) & (i < (Xend + 1))):
-                    self.send_data(Image[i + j * Width])
+        self.send_data2(epdbuffer.region(Image, Width, Xstart * 8, Ystart, (Xend + 1) * 8, Yend + 1))
+        self.TurnOnDisplay_Part()
+
+    # Partial refresh of the window x0 <= x < x1, y0 <= y < y1 (panel
+    # orientation, x widened to whole bytes) after init_Part(). Only the
+    # window is sent.
+    def display_region(self, image, x0, y0, x1, y1):
+        self.set_window(x0, y0, x1, y1)
+        self.send_command(0x24)
+        self.send_data2(epdbuffer.region(image, epdbuffer.linewidth(self.width), x0, y0, x1, y1))
         self.TurnOnDisplay_Part()
+
+    def set_window(self, x0, y0, x1, y1):
+        bx0, bx1 = epdbuffer.window_bytes(x0, x1)
+        Xstart, Xend, Yend = bx0 * 8, bx1 * 8 - 1, y1 - 1
+
+        self.send_command(0x44)
+        self.send_data(Xstart & 0xff)
+        self.send_data((Xstart >> 8) & 0x03)
+        self.send_data(Xend & 0xff)
+        self.send_data((Xend >> 8) & 0x03)
+        self.send_command(0x45)
+        self.send_data(y0 & 0xff)
+        self.send_data((y0 >> 8) & 0x03)
+        self.send_data(Yend & 0xff)
+        self.send_data((Yend >> 8) & 0x03)
+
+        self.send_command(0x4E)
+        self.send_data(Xstart & 0xff)
+        self.send_data((Xstart >> 8) & 0x03)
+        self.send_command(0x4F)
+        self.send_data(y0 & 0xff)
+        self.send_data((y0 >> 8) & 0x03)
     
     def display_4Gray(self, image):
+        plane1, plane2 = epdbuffer.split_4gray(image, self.width, self.height,
+                                               (1, 0, 1, 0), (1, 1, 0, 0))
         self.send_command(0x24)
-        for i in range(0, 81600): 
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x01  
-                    elif(temp2 == 0x80): 
-                        temp3 |= 0x01 
-                    else: #0x40
-                        temp3 |= 0x00 
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0): 
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00): 
-                        temp3 |= 0x01
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x01
-                    else :   #0x40
-                        temp3 |= 0x00	
-                    if(j!=1 or k!=1):				
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
-            
-        self.send_command(0x26)	       
-        for i in range(0, 81600): 
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x01
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00
-                    else: #0x40
-                        temp3 |= 0x01 
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0): 
-                        temp3 |= 0x00
-                    elif(temp2 == 0x00): 
-                        temp3 |= 0x01
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00 
-                    else:    #0x40
-                            temp3 |= 0x01	
-                    if(j!=1 or k!=1):					
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
-        
+        self.send_data2(plane1)
+
+        self.send_command(0x26)
+        self.send_data2(plane2)
+
         self.TurnOnDisplay_4GRAY()
 
 
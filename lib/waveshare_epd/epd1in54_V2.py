@@ -29,6 +29,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 200
@@ -121,8 +122,7 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):
-            epdconfig.delay_ms(20)
+        epdconfig.wait_busy(1)
         logger.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
@@ -142,21 +142,13 @@ class EPD:
         self.send_data2(lut)
             
     def set_lut(self, lut):
-        self.lut(lut)
-        
-        self.send_command(0x3f)
-        self.send_data(lut[153])
-        
-        self.send_command(0x03)
-        self.send_data(lut[154])
-        
-        self.send_command(0x04)
-        self.send_data(lut[155])
-        self.send_data(lut[156])
-        self.send_data(lut[157])
-        
-        self.send_command(0x2c)
-        self.send_data(lut[158])
+        epdconfig.send_sequence([
+            (0x32, lut), # WRITE_LUT_REGISTER
+            (0x3f, lut[153:154]),
+            (0x03, lut[154:155]),
+            (0x04, lut[155:158]),
+            (0x2c, lut[158:159]),
+        ])
       
     def SetWindows(self, Xstart, Ystart, Xend, Yend):
         self.send_command(0x44) # SET_RAM_X_ADDRESS_START_END_POSITION
@@ -251,30 +243,14 @@ class EPD:
             linewidth = int(self.width/8) + 1
 
         self.send_command(0x24)
-        self.send_data2([color] * self.height * linewidth)
+        self.send_data2(epdbuffer.fill(color, self.height * linewidth))
                 
         self.TurnOnDisplay()
         
     def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
+        buf = epdbuffer.pack_1bit(image, self.width, self.height)
+        if buf is None:
+            return [0xFF] * (int(self.width/8) * self.height)
         return buf
 
     def display(self, image):
@@ -29,7 +29,9 @@
 
 
 import logging
+from PIL import Image
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -113,8 +115,7 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)    
+        epdconfig.wait_busy(1)  # busy while BUSY reads 1
 
     def TurnOnDisplay(self):
         self.send_command(0x22)
@@ -167,22 +168,14 @@ class EPD:
             self.send_command(0x2C)     #VCOM Voltage
             self.send_data(0x55)    #
 
-            self.send_command(0x03)
-            self.send_data(self.lut_full_update[70])
-
-            self.send_command(0x04) #
-            self.send_data(self.lut_full_update[71])
-            self.send_data(self.lut_full_update[72])
-            self.send_data(self.lut_full_update[73])
-
-            self.send_command(0x3A)     #Dummy Line
-            self.send_data(self.lut_full_update[74])
-            self.send_command(0x3B)     #Gate time
-            self.send_data(self.lut_full_update[75])
-
-            self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_full_update[count])
+            lut = self.lut_full_update
+            epdconfig.send_sequence([
+                (0x03, lut[70:71]),
+                (0x04, lut[71:74]),
+                (0x3A, lut[74:75]),     #Dummy Line
+                (0x3B, lut[75:76]),     #Gate time
+                (0x32, lut[0:70]),
+            ])
 
             self.send_command(0x4E)   # set RAM x address count to 0
             self.send_data(0x00)
@@ -196,9 +189,7 @@ class EPD:
 
             self.ReadBusy()
 
-            self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_partial_update[count])
+            epdconfig.send_sequence([(0x32, self.lut_partial_update[0:70])])
 
             self.send_command(0x37)
             self.send_data(0x00)
@@ -219,33 +210,19 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-         
-        buf = [0xFF] * (linewidth * self.height)
         image_monocolor = image.convert('1')
         imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        
+
         if(imwidth == self.width and imheight == self.height):
             logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):                    
-                    if pixels[x, y] == 0:
-                        x = imwidth - x
-                        buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
+            # columns are mirrored and shifted right by one: x -> width - x
+            img = image_monocolor.transpose(Image.FLIP_LEFT_RIGHT)
+            return epdbuffer.pack_1bit_image(img, x=1)
         elif(imwidth == self.height and imheight == self.width):
             logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        newy = imwidth - newy - 1
-                        buf[int(newx / 8) + newy*linewidth] &= ~(0x80 >> (y % 8))
-        return buf   
+            img = image_monocolor.transpose(Image.TRANSPOSE)
+            return epdbuffer.pack_1bit_image(img)
+        return [0xFF] * (epdbuffer.linewidth(self.width) * self.height)   
         
         
     def display(self, image):
@@ -287,13 +264,8 @@ class EPD:
             linewidth = int(self.width/8) + 1
         # logger.debug(linewidth)
         
-        buf = [0x00] * self.height * linewidth
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                buf[i + j * linewidth] = color
-
         self.send_command(0x24)
-        self.send_data2(buf)
+        self.send_data2(epdbuffer.fill(color, self.height * linewidth))
                 
         # self.send_command(0x26)
         # for j in range(0, self.height):
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -93,8 +94,7 @@ class EPD:
     '''
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(10)  
+        epdconfig.wait_busy(1)  # busy while BUSY reads 1
         logger.debug("e-Paper busy release")
 
     '''
@@ -137,16 +137,13 @@ class EPD:
         yend : End position of Y-axis
     '''
     def SetWindow(self, x_start, y_start, x_end, y_end):
-        self.send_command(0x44) # SET_RAM_X_ADDRESS_START_END_POSITION
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data((x_start>>3) & 0xFF)
-        self.send_data((x_end>>3) & 0xFF)
-        
-        self.send_command(0x45) # SET_RAM_Y_ADDRESS_START_END_POSITION
-        self.send_data(y_start & 0xFF)
-        self.send_data((y_start >> 8) & 0xFF)
-        self.send_data(y_end & 0xFF)
-        self.send_data((y_end >> 8) & 0xFF)
+        epdconfig.send_sequence([
+            # SET_RAM_X_ADDRESS_START_END_POSITION
+            # x point must be the multiple of 8 or the last 3 bits will be ignored
+            (0x44, [(x_start>>3) & 0xFF, (x_end>>3) & 0xFF]),
+            # SET_RAM_Y_ADDRESS_START_END_POSITION
+            (0x45, [y_start & 0xFF, (y_start >> 8) & 0xFF, y_end & 0xFF, (y_end >> 8) & 0xFF]),
+        ])
 
     '''
     function : Set Cursor
@@ -155,13 +152,13 @@ class EPD:
         y : Y-axis starting position
     '''
     def SetCursor(self, x, y):
-        self.send_command(0x4E) # SET_RAM_X_ADDRESS_COUNTER
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data(x & 0xFF)
-        
-        self.send_command(0x4F) # SET_RAM_Y_ADDRESS_COUNTER
-        self.send_data(y & 0xFF)
-        self.send_data((y >> 8) & 0xFF)
+        epdconfig.send_sequence([
+            # SET_RAM_X_ADDRESS_COUNTER
+            # x point must be the multiple of 8 or the last 3 bits will be ignored
+            (0x4E, [x & 0xFF]),
+            # SET_RAM_Y_ADDRESS_COUNTER
+            (0x4F, [y & 0xFF, (y >> 8) & 0xFF]),
+        ])
     
     '''
     function : Initialize the e-Paper register
@@ -177,26 +174,19 @@ class EPD:
         self.send_command(0x12)  #SWRESET
         self.ReadBusy() 
 
-        self.send_command(0x01) #Driver output control      
-        self.send_data(0xf9)
-        self.send_data(0x00)
-        self.send_data(0x00)
-    
-        self.send_command(0x11) #data entry mode       
-        self.send_data(0x03)
+        epdconfig.send_sequence([
+            (0x01, [0xf9, 0x00, 0x00]), #Driver output control
+            (0x11, [0x03]),             #data entry mode
+        ])
 
         self.SetWindow(0, 0, self.width-1, self.height-1)
         self.SetCursor(0, 0)
         
-        self.send_command(0x3c)
-        self.send_data(0x05)
-
-        self.send_command(0x21) #  Display update control
-        self.send_data(0x00)
-        self.send_data(0x80)
-    
-        self.send_command(0x18)
-        self.send_data(0x80)
+        epdconfig.send_sequence([
+            (0x3c, [0x05]),
+            (0x21, [0x00, 0x80]),       #  Display update control
+            (0x18, [0x80]),
+        ])
         
         self.ReadBusy()
         
@@ -215,27 +205,26 @@ class EPD:
         self.send_command(0x12)  #SWRESET
         self.ReadBusy() 
 
-        self.send_command(0x18) # Read built-in temperature sensor
-        self.send_command(0x80)
-
-        self.send_command(0x11) # data entry mode       
-        self.send_data(0x03)    
+        epdconfig.send_sequence([
+            (0x18, None),           # Read built-in temperature sensor
+            (0x80, None),
+            (0x11, [0x03]),         # data entry mode
+        ])
 
         self.SetWindow(0, 0, self.width-1, self.height-1)
         self.SetCursor(0, 0)
         
-        self.send_command(0x22) # Load temperature value
-        self.send_data(0xB1)	
-        self.send_command(0x20)
+        epdconfig.send_sequence([
+            (0x22, [0xB1]),         # Load temperature value
+            (0x20, None),
+        ])
         self.ReadBusy()
 
-        self.send_command(0x1A) # Write to temperature register
-        self.send_data(0x64)
-        self.send_data(0x00)
-                        
-        self.send_command(0x22) # Load temperature value
-        self.send_data(0x91)	
-        self.send_command(0x20)
+        epdconfig.send_sequence([
+            (0x1A, [0x64, 0x00]),   # Write to temperature register
+            (0x22, [0x91]),         # Load temperature value
+            (0x20, None),
+        ])
         self.ReadBusy()
         
         return 0
@@ -245,19 +234,11 @@ class EPD:
         image : Image data
     '''
     def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
+        buf = epdbuffer.pack_1bit(image, self.width, self.height)
+        if buf is None:
             logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
             # return a blank buffer
             return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
         return buf
         
     '''
@@ -307,6 +288,40 @@ class EPD:
         self.send_data2(image)  
         self.TurnOnDisplayPart()
 
+    '''
+    function : Partial refresh of a window, only the window is sent
+    parameter:
+        image : Image data from getbuffer()
+        x0, y0 : top left corner of the window, in panel orientation
+        x1, y1 : bottom right corner of the window, excluded
+                 x is widened to whole bytes
+    '''
+    def display_region(self, image, x0, y0, x1, y1):
+        linewidth = epdbuffer.linewidth(self.width)
+        bx0, bx1 = epdbuffer.window_bytes(x0, x1)
+
+        epdconfig.digital_write(self.reset_pin, 0)
+        epdconfig.delay_ms(1)
+        epdconfig.digital_write(self.reset_pin, 1)
+
+        self.send_command(0x3C) # BorderWavefrom
+        self.send_data(0x80)
+
+        self.send_command(0x01) # Driver output control
+        self.send_data(0xF9)
+        self.send_data(0x00)
+        self.send_data(0x00)
+
+        self.send_command(0x11) # data entry mode
+        self.send_data(0x03)
+
+        self.SetWindow(bx0 * 8, y0, bx1 * 8 - 1, y1 - 1)
+        self.SetCursor(bx0, y0) # the RAM X counter counts bytes
+
+        self.send_command(0x24) # WRITE_RAM
+        self.send_data2(epdbuffer.region(image, linewidth, x0, y0, x1, y1))
+        self.TurnOnDisplayPart()
+
     '''
     function : Refresh a base image
     parameter:
@@ -320,6 +335,22 @@ class EPD:
         self.send_data2(image)  
         self.TurnOnDisplay()
     
+    '''
+    function : Load a base image for partial refresh without refreshing,
+               to go back to partial refresh after display_fast()
+    parameter:
+        image : Image data
+    '''
+    def loadPartBaseImage(self, image):
+        self.SetWindow(0, 0, self.width - 1, self.height - 1)
+        self.SetCursor(0, 0)
+
+        self.send_command(0x24)
+        self.send_data2(image)
+
+        self.send_command(0x26)
+        self.send_data2(image)
+
     '''
     function : Clear screen
     parameter:
@@ -332,7 +363,7 @@ class EPD:
         # logger.debug(linewidth)
         
         self.send_command(0x24)
-        self.send_data2([color] * int(self.height * linewidth))  
+        self.send_data2(epdbuffer.fill(color, int(self.height * linewidth)))  
         self.TurnOnDisplay()
 
     '''
@@ -346,5 +377,36 @@ class EPD:
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
 
+    '''
+    function : Enter deep sleep and return at once. SPI and the module
+               power stay on, wake() brings the controller back.
+    parameter:
+    '''
+    def deep_sleep(self):
+        self.send_command(0x10) #enter deep sleep, mode 1 keeps the RAM
+        self.send_data(0x01)
+
+    '''
+    function : Leave deep_sleep() without a full init(): a reset pulse,
+               the registers init() sets and the partial base image
+    parameter:
+        image : base image for partial refresh, from getbuffer()
+    '''
+    def wake(self, image):
+        # only a hardware reset leaves deep sleep, no SWRESET needed after it
+        epdconfig.digital_write(self.reset_pin, 0)
+        epdconfig.delay_ms(1)
+        epdconfig.digital_write(self.reset_pin, 1)
+        self.ReadBusy()
+
+        epdconfig.send_sequence([
+            (0x01, [0xf9, 0x00, 0x00]), #Driver output control
+            (0x11, [0x03]),             #data entry mode
+            (0x3c, [0x05]),
+            (0x21, [0x00, 0x80]),       #  Display update control
+            (0x18, [0x80]),
+        ])
+        self.loadPartBaseImage(image)
+
 ### END OF FILE ###
 
@@ -30,6 +30,7 @@
 import logging
 from multiprocessing.reduction import recv_handle
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 240
@@ -224,25 +225,17 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      #  0: busy, 1: idle
-            epdconfig.delay_ms(5) 
+        epdconfig.wait_busy(0)  # busy while BUSY reads 0
         logger.debug("e-Paper busy release")
 
     def lut(self) :
-        self.send_command(0x20)        # vcom
-        self.send_data2(self.lut_vcom[:42])
-            
-        self.send_command(0x21)        # ww --
-        self.send_data2(self.lut_ww[:42])
-            
-        self.send_command(0x22)        # bw r
-        self.send_data2(self.lut_bw[:42])
-            
-        self.send_command(0x23)        # wb w
-        self.send_data2(self.lut_bb[:42])
-            
-        self.send_command(0x24)        # bb b
-        self.send_data2(self.lut_wb[:42])
+        epdconfig.send_sequence([
+            (0x20, self.lut_vcom[:42]),    # vcom
+            (0x21, self.lut_ww[:42]),      # ww --
+            (0x22, self.lut_bw[:42]),      # bw r
+            (0x23, self.lut_bb[:42]),      # wb w
+            (0x24, self.lut_wb[:42]),      # bb b
+        ])
 
     def refresh(self):
         self.send_command(0x17)
@@ -252,59 +245,35 @@ class EPD:
 
     # LUT download
     def lut_GC(self):
-        self.send_command(0x20);        # vcom
-        self.send_data2(self.lut_R20_GC[:56])
-            
-        self.send_command(0x21);        # red not use
-        self.send_data2(self.lut_R21_GC[:42])
-            
-        self.send_command(0x24);        # bb b
-        self.send_data2(self.lut_R24_GC[:42])
-        
+        # bw r and wb w swap on every call
         if(self.Flag == 0) :
-            self.send_command(0x22);    # bw r
-            self.send_data2(self.lut_R22_GC[:56])
-                
-            self.send_command(0x23);    # wb w
-            self.send_data2(self.lut_R23_GC[:42])
-            self.Flag = 1
-
+            bw, wb = self.lut_R22_GC, self.lut_R23_GC
         else :
-            self.send_command(0x22);    # bw r
-            self.send_data2(self.lut_R23_GC[:56])
-
-            self.send_command(0x23);    # wb w
-            self.send_data2(self.lut_R22_GC[:42])
-            self.Flag = 0
+            bw, wb = self.lut_R23_GC, self.lut_R22_GC
+        self.Flag ^= 1
+        epdconfig.send_sequence([
+            (0x20, self.lut_R20_GC[:56]),  # vcom
+            (0x21, self.lut_R21_GC[:42]),  # red not use
+            (0x24, self.lut_R24_GC[:42]),  # bb b
+            (0x22, bw[:56]),               # bw r
+            (0x23, wb[:42]),               # wb w
+        ])
 
     # LUT download        
     def lut_DU(self):
-        self.send_command(0x20);      # vcom
-        self.send_data2(self.lut_R20_DU[:56])
-            
-        self.send_command(0x21);     # red not use
-        self.send_data2(self.lut_R21_DU[:42])
-            
-        self.send_command(0x24);    # bb b
-        self.send_data2(self.lut_R24_DU[:42])
-        
+        # bw r and wb w swap on every call
         if(self.Flag == 0) :
-            self.send_command(0x22);      # bw r
-            self.send_data2(self.lut_R22_DU[:56])
-                
-            self.send_command(0x23);     # wb w
-            self.send_data2(self.lut_R23_DU[:42])
-                
-            self.Flag = 1
-            
+            bw, wb = self.lut_R22_DU, self.lut_R23_DU
         else :
-            self.send_command(0x22);    # bw r
-            self.send_data2(self.lut_R23_DU[:56])
-                
-            self.send_command(0x23);   # wb w
-            self.send_data2(self.lut_R22_DU[:42])
-                
-            self.Flag = 0
+            bw, wb = self.lut_R23_DU, self.lut_R22_DU
+        self.Flag ^= 1
+        epdconfig.send_sequence([
+            (0x20, self.lut_R20_DU[:56]),  # vcom
+            (0x21, self.lut_R21_DU[:42]),  # red not use
+            (0x24, self.lut_R24_DU[:42]),  # bb b
+            (0x22, bw[:56]),               # bw r
+            (0x23, wb[:42]),               # wb w
+        ])
         
                 
     def init(self):
@@ -352,27 +321,9 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
+        buf = epdbuffer.pack_1bit(image, self.width, self.height)
+        if buf is None:
+            return [0xFF] * (int(self.width/8) * self.height)
         return buf
 
     def display(self, image):
@@ -445,7 +396,7 @@ class EPD:
         
     def Clear(self):
         self.send_command(0x13);		     # Transfer new data
-        self.send_data2([0xFF] * int(self.width * self.height / 8))
+        self.send_data2(epdbuffer.fill(0xFF, int(self.width * self.height / 8)))
         self.lut_GC()
         self.refresh()
 
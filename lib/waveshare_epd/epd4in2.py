@@ -30,8 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 from PIL import Image
-import RPi.GPIO as GPIO
 
 # Display resolution
 EPD_WIDTH  = 400
@@ -44,6 +44,9 @@ GRAY4 = 0x00  # Blackest
 
 logger = logging.getLogger(__name__)
 
+# init / LUT scripts by mode, see EPD.script()
+_SCRIPTS = {}
+
 
 class EPD:
     def __init__(self):
@@ -57,7 +60,8 @@ class EPD:
         self.GRAY2 = GRAY2
         self.GRAY3 = GRAY3  # gray
         self.GRAY4 = GRAY4  # Blackest
-        self.DATA = [0x00] * 15000
+        # last window data written to the new-data RAM, used as old data
+        self.DATA = bytearray(epdbuffer.linewidth(EPD_WIDTH) * EPD_HEIGHT)
 
     lut_vcom0 = [
         0x00, 0x08, 0x08, 0x00, 0x00, 0x02,
@@ -252,101 +256,84 @@ class EPD:
 
     def ReadBusy(self):
         self.send_command(0x71)
-        while epdconfig.digital_read(self.busy_pin) == 0:  # 0: idle, 1: busy
-            self.send_command(0x71)
-            epdconfig.delay_ms(100)
+        epdconfig.wait_busy(0, poll=lambda: self.send_command(0x71), poll_ms=100)  # busy while BUSY reads 0
+
+    def _steps(self, mode):
+        # register writes of each mode, compiled once by script()
+        power = [
+            (0x01, [0x03, 0x00, 0x2b, 0x2b]),  # POWER SETTING: VDS_EN VDG_EN, VCOM_HV VGHL_LV, VDH, VDL
+            (0x06, [0x17, 0x17, 0x17]),  # boost soft start
+            (0x04, None),  # POWER_ON
+            ('busy', 0),
+        ]
+        panel = [
+            (0x00, 0xbf),  # panel setting: KW-BF   KWR-AF  BWROTP 0f
+            (0x30, 0x3c),  # PLL setting: 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
+            (0x61, [0x01, 0x90, 0x01, 0x2c]),  # resolution setting: 400 x 300
+            (0x82, 0x12),  # vcom_DC setting
+            (0x50, 0x97),  # VCOM AND DATA INTERVAL SETTING: 97white border 77black border
+        ]
+        if mode == 'lut':
+            return [
+                (0x20, self.lut_vcom0),  # vcom
+                (0x21, self.lut_ww),     # ww --
+                (0x22, self.lut_bw),     # bw r
+                (0x23, self.lut_bb),     # wb w
+                (0x24, self.lut_wb),     # bb b
+            ]
+        if mode == 'lut_partial':
+            return [
+                (0x20, self.EPD_4IN2_Partial_lut_vcom1),
+                (0x21, self.EPD_4IN2_Partial_lut_ww1),
+                (0x22, self.EPD_4IN2_Partial_lut_bw1),
+                (0x23, self.EPD_4IN2_Partial_lut_wb1),
+                (0x24, self.EPD_4IN2_Partial_lut_bb1),
+            ]
+        if mode == 'lut_4gray':
+            return [
+                (0x20, self.EPD_4IN2_4Gray_lut_vcom),  # vcom
+                (0x21, self.EPD_4IN2_4Gray_lut_ww),    # red not use
+                (0x22, self.EPD_4IN2_4Gray_lut_bw),    # bw r
+                (0x23, self.EPD_4IN2_4Gray_lut_wb),    # wb w
+                (0x24, self.EPD_4IN2_4Gray_lut_bb),    # bb b
+                (0x25, self.EPD_4IN2_4Gray_lut_ww),    # vcom
+            ]
+        if mode == 'full':
+            return power + panel + self._steps('lut')
+        if mode == 'partial':
+            return power + panel[:-1] + [(0x50, 0x07)] + self._steps('lut_partial')
+        if mode == '4gray':
+            power[0] = (0x01, [0x03, 0x00, 0x2b, 0x2b, 0x13])  # VGH=20V,VGL=-20V, VDH=15V, VDL=-15V
+            panel[0] = (0x00, 0x3f)  # KW-3f   KWR-2F BWROTP 0f BWOTP 1f
+            return power + panel
+        raise ValueError("unknown mode %r" % mode)
+
+    def script(self, mode):
+        '''
+        function : Init / LUT script of a mode, compiled on first use
+        parameter:
+            mode : 'full', 'partial', '4gray', 'lut', 'lut_partial' or 'lut_4gray'
+        '''
+        script = _SCRIPTS.get(mode)
+        if script is None:
+            script = _SCRIPTS[mode] = epdconfig.compile_script(self._steps(mode))
+        return script
 
     def set_lut(self):
-        self.send_command(0x20)  # vcom
-        self.send_data2(self.lut_vcom0)
-
-        self.send_command(0x21)  # ww --
-        self.send_data2(self.lut_ww)
-
-        self.send_command(0x22)  # bw r
-        self.send_data2(self.lut_bw)
-
-        self.send_command(0x23)  # wb w
-        self.send_data2(self.lut_bb)
-
-        self.send_command(0x24)  # bb b
-        self.send_data2(self.lut_wb)
+        epdconfig.run_script(self.script('lut'))
 
     def Partial_SetLut(self):
-        self.send_command(0x20)
-        self.send_data2(self.EPD_4IN2_Partial_lut_vcom1)
-
-        self.send_command(0x21)
-        self.send_data2(self.EPD_4IN2_Partial_lut_ww1)
-
-        self.send_command(0x22)
-        self.send_data2(self.EPD_4IN2_Partial_lut_bw1)
-
-        self.send_command(0x23)
-        self.send_data2(self.EPD_4IN2_Partial_lut_wb1)
-
-        self.send_command(0x24)
-        self.send_data2(self.EPD_4IN2_Partial_lut_bb1)
+        epdconfig.run_script(self.script('lut_partial'))
 
     def Gray_SetLut(self):
-        self.send_command(0x20)  # vcom
-        self.send_data2(self.EPD_4IN2_4Gray_lut_vcom)
-
-        self.send_command(0x21)  # red not use
-        self.send_data2(self.EPD_4IN2_4Gray_lut_ww)
-
-        self.send_command(0x22)  # bw r
-        self.send_data2(self.EPD_4IN2_4Gray_lut_bw)
-
-        self.send_command(0x23)  # wb w
-        self.send_data2(self.EPD_4IN2_4Gray_lut_wb)
-
-        self.send_command(0x24)  # bb b
-        self.send_data2(self.EPD_4IN2_4Gray_lut_bb)
-
-        self.send_command(0x25)  # vcom
-        self.send_data2(self.EPD_4IN2_4Gray_lut_ww)
+        epdconfig.run_script(self.script('lut_4gray'))
 
     def init(self):
         if epdconfig.module_init() != 0:
             return -1
         # EPD hardware init start
         self.reset()
-
-        self.send_command(0x01)  # POWER SETTING
-        self.send_data(0x03)  # VDS_EN, VDG_EN
-        self.send_data(0x00)  # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
-        self.send_data(0x2b)  # VDH
-        self.send_data(0x2b)  # VDL
-
-        self.send_command(0x06)  # boost soft start
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_data(0x17)
-
-        self.send_command(0x04)  # POWER_ON
-        self.ReadBusy()
-
-        self.send_command(0x00)  # panel setting
-        self.send_data(0xbf)  # KW-BF   KWR-AF  BWROTP 0f
-
-        self.send_command(0x30)  # PLL setting
-        self.send_data(0x3c)  # 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
-
-        self.send_command(0x61)  # resolution setting
-        self.send_data(0x01)
-        self.send_data(0x90)  # 128
-        self.send_data(0x01)
-        self.send_data(0x2c)
-
-        self.send_command(0x82)  # vcom_DC setting
-        self.send_data(0x12)
-
-        self.send_command(0X50)  # VCOM AND DATA INTERVAL SETTING
-        self.send_data(
-            0x97)  # 97white border 77black border  VBDF 17|D7 VBDW 97 VBDB 57  VBDF F7 VBDW 77 VBDB 37  VBDR B7
-
-        self.set_lut()
+        epdconfig.run_script(self.script('full'), self.ReadBusy)
         # EPD hardware init end
         return 0
 
@@ -355,41 +342,7 @@ class EPD:
             return -1
         # EPD hardware init start
         self.reset()
-
-        self.send_command(0x01)  # POWER SETTING
-        self.send_data(0x03)  # VDS_EN, VDG_EN
-        self.send_data(0x00)  # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
-        self.send_data(0x2b)  # VDH
-        self.send_data(0x2b)  # VDL
-
-        self.send_command(0x06)  # boost soft start
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_data(0x17)
-
-        self.send_command(0x04)  # POWER_ON
-        self.ReadBusy()
-
-        self.send_command(0x00)  # panel setting
-        self.send_data(0xbf)  # KW-BF   KWR-AF  BWROTP 0f
-
-        self.send_command(0x30)  # PLL setting
-        self.send_data(0x3c)  # 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
-
-        self.send_command(0x61)  # resolution setting
-        self.send_data(0x01)
-        self.send_data(0x90)  # 128
-        self.send_data(0x01)
-        self.send_data(0x2c)
-
-        self.send_command(0x82)  # vcom_DC setting
-        self.send_data(0x12)
-
-        self.send_command(0X50)  # VCOM AND DATA INTERVAL SETTING
-        self.send_data(
-            0x07)  # 97white border 77black border  VBDF 17|D7 VBDW 97 VBDB 57  VBDF F7 VBDW 77 VBDB 37  VBDR B7
-
-        self.Partial_SetLut()
+        epdconfig.run_script(self.script('partial'), self.ReadBusy)
         # EPD hardware init end
         return 0
 
@@ -398,103 +351,18 @@ class EPD:
             return -1
         # EPD hardware init start
         self.reset()
-
-        self.send_command(0x01)  # POWER SETTING
-        self.send_data(0x03)
-        self.send_data(0x00)  # VGH=20V,VGL=-20V
-        self.send_data(0x2b)  # VDH=15V
-        self.send_data(0x2b)  # VDL=-15V
-        self.send_data(0x13)
-
-        self.send_command(0x06)  # booster soft start
-        self.send_data(0x17)  # A
-        self.send_data(0x17)  # B
-        self.send_data(0x17)  # C
-
-        self.send_command(0x04)
-        self.ReadBusy()
-
-        self.send_command(0x00)  # panel setting
-        self.send_data(0x3f)  # KW-3f   KWR-2F BWROTP 0f BWOTP 1f
-
-        self.send_command(0x30)  # PLL setting
-        self.send_data(0x3c)  # 100hz
-
-        self.send_command(0x61)  # resolution setting
-        self.send_data(0x01)  # 400
-        self.send_data(0x90)
-        self.send_data(0x01)  # 300
-        self.send_data(0x2c)
-
-        self.send_command(0x82)  # vcom_DC setting
-        self.send_data(0x12)
-
-        self.send_command(0X50)  # VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x97)
+        epdconfig.run_script(self.script('4gray'), self.ReadBusy)
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
+        buf = epdbuffer.pack_1bit(image, self.width, self.height)
+        if buf is None:
+            return [0xFF] * (int(self.width/8) * self.height)
         return buf
 
     def getbuffer_4Gray(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
-        image_monocolor = image.convert('L')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i = 0
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0xC0:
-                        pixels[x, y] = 0x80
-                    elif pixels[x, y] == 0x80:
-                        pixels[x, y] = 0x40
-                    i = i + 1
-                    if i % 4 == 0:
-                        buf[int((x + (y * self.width)) / 4)] = (
-                                    (pixels[x - 3, y] & 0xc0) | (pixels[x - 2, y] & 0xc0) >> 2 | (
-                                        pixels[x - 1, y] & 0xc0) >> 4 | (pixels[x, y] & 0xc0) >> 6)
-
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = x
-                    if pixels[x, y] == 0xC0:
-                        pixels[x, y] = 0x80
-                    elif pixels[x, y] == 0x80:
-                        pixels[x, y] = 0x40
-                    i = i + 1
-                    if i % 4 == 0:
-                        buf[int((newx + (newy * self.width)) / 4)] = (
-                                    (pixels[x, y - 3] & 0xc0) | (pixels[x, y - 2] & 0xc0) >> 2 | (
-                                        pixels[x, y - 1] & 0xc0) >> 4 | (pixels[x, y] & 0xc0) >> 6)
-
+        buf = epdbuffer.pack_4gray(image, self.width, self.height, Image.TRANSPOSE)
+        if buf is None:
+            return [0xFF] * (int(self.width / 4) * self.height)
         return buf
 
     def display(self, image):
@@ -506,7 +374,7 @@ class EPD:
         self.send_command(0x92)
         self.set_lut()
         self.send_command(0x10)
-        self.send_data2([0xFF] * int(self.width * linewidth))
+        self.send_data2(epdbuffer.fill(0xFF, int(self.width * linewidth)))
 
         self.send_command(0x13)
         self.send_data2(image)
@@ -514,54 +382,51 @@ class EPD:
         self.send_command(0x12)
         self.ReadBusy()
 
-    def EPD_4IN2_PartialDisplay(self, X_start, Y_start, X_end, Y_end, Image):
-        # EPD_WIDTH       = 400
-        # EPD_HEIGHT      = 300
-
-        if EPD_WIDTH % 8 != 0:
-            Width = int(EPD_WIDTH / 8) + 1
-        else:
-            Width = int(EPD_WIDTH / 8)
-        Height = EPD_HEIGHT
+    def displayPartBaseImage(self, image):
+        '''
+        function : Full refresh that also becomes the base of display_region()
+        parameter:
+            image : Image data
+        '''
+        self.display(image)
+        self.loadPartBaseImage(image)
+
+    def loadPartBaseImage(self, image):
+        '''
+        function : Load a base image for display_region() without refreshing
+                   and switch to the partial waveform
+        parameter:
+            image : Image data
+        '''
+        self.init_Partial()
+        # display_region() keeps the old frame inverted, like it sends it
+        self.DATA[:] = epdbuffer.invert(image)
 
-        if X_start % 8 != 0:
-            X_start = int(X_start / 8) + 1
-        else:
-            X_start = int(X_start / 8)
-        if X_end % 8 != 0:
-            X_end = int(X_end / 8) + 1
-        else:
-            X_end = int(X_end / 8)
+    def EPD_4IN2_PartialDisplay(self, X_start, Y_start, X_end, Y_end, Image):
+        self.display_region(Image, X_start, Y_start, X_end, Y_end)
 
-        buf = [0x00] * (Y_end - Y_start) * (X_end - X_start)
+    def display_region(self, image, x0, y0, x1, y1):
+        # Partial refresh of the window x0 <= x < x1, y0 <= y < y1, in panel
+        # orientation, after init_Partial(). x is widened to whole bytes.
+        linewidth = epdbuffer.linewidth(self.width)
+        bx0, bx1 = epdbuffer.window_bytes(x0, x1)
+        x_start, x_end, y_end = bx0 * 8, bx1 * 8 - 1, y1 - 1
 
         self.send_command(0x91)  # This command makes the display enter partial mode
         self.send_command(0x90)  # resolution setting
-        self.send_data(int(X_start * 8 / 256))
-        self.send_data(int(X_start * 8 % 256))  # x-start
-
-        self.send_data(int(X_end * 8 / 256))
-        self.send_data(int(X_end * 8 % 256) - 1)  # x-end
-
-        self.send_data(int(Y_start / 256))
-        self.send_data(int(Y_start % 256))  # y-start
-
-        self.send_data(int(Y_end / 256))
-        self.send_data(int(Y_end % 256) - 1)  # y-end
-        self.send_data(0x28)
+        self.send_data2([x_start >> 8, x_start & 0xff,  # x-start
+                         x_end >> 8, x_end & 0xff,  # x-end
+                         y0 >> 8, y0 & 0xff,  # y-start
+                         y_end >> 8, y_end & 0xff,  # y-end
+                         0x28])
 
+        new = epdbuffer.invert(epdbuffer.region(image, linewidth, x0, y0, x1, y1))
         self.send_command(0x10)  # writes Old data to SRAM for programming
-        for j in range(0, Y_end - Y_start):
-            for i in range(0, X_end - X_start):
-                buf[j * (X_end - X_start) + i] = self.DATA[(Y_start + j) * Width + X_start + i]
-        self.send_data2(buf)
+        self.send_data2(epdbuffer.region(self.DATA, linewidth, x0, y0, x1, y1))
 
         self.send_command(0x13)  # writes New data to SRAM.
-        for j in range(0, Y_end - Y_start):
-            for i in range(0, X_end - X_start):
-                buf[j * (X_end - X_start) + i] = ~Image[(Y_start + j) * Width + X_start + i]
-                self.DATA[(Y_start + j) * Width + X_start + i] = ~Image[(Y_start + j) * Width + X_start / 8 + i]
-        self.send_data2(buf)
+        self.send_data2(new)
+        epdbuffer.put_region(self.DATA, linewidth, x0, y0, x1, y1, new)
 
         self.send_command(0x12)  # DISPLAY REFRESH
         epdconfig.delay_ms(200)  # The delay here is necessary, 200uS at least!!!
@@ -570,80 +435,13 @@ class EPD:
     def display_4Gray(self, image):
         self.send_command(0x92)
         self.set_lut()
+        plane1, plane2 = epdbuffer.split_4gray(image, self.width, self.height,
+                                               (0, 0, 1, 1), (0, 1, 0, 1))
         self.send_command(0x10)
-
-        if self.width % 8 == 0:
-            linewidth = int(self.width / 8)
-        else:
-            linewidth = int(self.width / 8) + 1
-
-        buf = [0x00] * self.height * linewidth
-
-        for i in range(0, int(EPD_WIDTH * EPD_HEIGHT / 8)):  # EPD_WIDTH * EPD_HEIGHT / 4
-            temp3 = 0
-            for j in range(0, 2):
-                temp1 = image[i * 2 + j]
-                for k in range(0, 2):
-                    temp2 = temp1 & 0xC0
-                    if temp2 == 0xC0:
-                        temp3 |= 0x01  # white
-                    elif temp2 == 0x00:
-                        temp3 |= 0x00  # black
-                    elif temp2 == 0x80:
-                        temp3 |= 0x01  # gray1
-                    else:  # 0x40
-                        temp3 |= 0x00  # gray2
-                    temp3 <<= 1
-
-                    temp1 <<= 2
-                    temp2 = temp1 & 0xC0
-                    if temp2 == 0xC0:  # white
-                        temp3 |= 0x01
-                    elif temp2 == 0x00:  # black
-                        temp3 |= 0x00
-                    elif temp2 == 0x80:
-                        temp3 |= 0x01  # gray1
-                    else:  # 0x40
-                        temp3 |= 0x00  # gray2
-                    if j != 1 or k != 1:
-                        temp3 <<= 1
-                    temp1 <<= 2
-            buf[i] = temp3
-        self.send_data2(buf)
+        self.send_data2(plane1)
 
         self.send_command(0x13)
-
-        for i in range(0, int(EPD_WIDTH * EPD_HEIGHT / 8)):  # 5808*4  46464
-            temp3 = 0
-            for j in range(0, 2):
-                temp1 = image[i * 2 + j]
-                for k in range(0, 2):
-                    temp2 = temp1 & 0xC0
-                    if temp2 == 0xC0:
-                        temp3 |= 0x01  # white
-                    elif temp2 == 0x00:
-                        temp3 |= 0x00  # black
-                    elif temp2 == 0x80:
-                        temp3 |= 0x00  # gray1
-                    else:  # 0x40
-                        temp3 |= 0x01  # gray2
-                    temp3 <<= 1
-
-                    temp1 <<= 2
-                    temp2 = temp1 & 0xC0
-                    if temp2 == 0xC0:  # white
-                        temp3 |= 0x01
-                    elif temp2 == 0x00:  # black
-                        temp3 |= 0x00
-                    elif temp2 == 0x80:
-                        temp3 |= 0x00  # gray1
-                    else:  # 0x40
-                        temp3 |= 0x01  # gray2
-                    if j != 1 or k != 1:
-                        temp3 <<= 1
-                    temp1 <<= 2
-            buf[i] = temp3
-        self.send_data2(buf)
+        self.send_data2(plane2)
 
         self.Gray_SetLut()
         self.send_command(0x12)
@@ -658,10 +456,10 @@ class EPD:
             linewidth = int(self.width / 8) + 1
 
         self.send_command(0x10)
-        self.send_data2([0xff] * int(self.height * linewidth))
+        self.send_data2(epdbuffer.fill(0xff, int(self.height * linewidth)))
 
         self.send_command(0x13)
-        self.send_data2([0xff] * int(self.height * linewidth))
+        self.send_data2(epdbuffer.fill(0xff, int(self.height * linewidth)))
 
         self.send_command(0x12)
         self.ReadBusy()
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 792
@@ -42,6 +43,9 @@ GRAY4  = 0x00 #Blackest
 
 logger = logging.getLogger(__name__)
 
+# init / LUT scripts by mode, see EPD.script()
+_SCRIPTS = {}
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -127,8 +131,7 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      #  0: idle, 1: busy
-            epdconfig.delay_ms(200)
+        epdconfig.wait_busy(1)  # busy while BUSY reads 1
         logger.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
@@ -159,72 +162,78 @@ class EPD:
         epdconfig.delay_ms(100)	        # The delay here is necessary, 200uS at least!!!     
         self.ReadBusy()                 # waiting for the electronic paper IC to release the idle signal
 
-    def EPD_5in79_Lut(self):
-        self.send_command(0x32)
-        self.send_data2(self.LUT_DATA_4Gray[:227])
-        self.send_command(0x3f) 
-        self.send_data(self.LUT_DATA_4Gray[227])
-
-        self.send_command(0x03)     
-        self.send_data(self.LUT_DATA_4Gray[228])
-
-        self.send_command(0x04)   
-        self.send_data(self.LUT_DATA_4Gray[229]) 
-        self.send_data(self.LUT_DATA_4Gray[230]) 
-        self.send_data(self.LUT_DATA_4Gray[231])   
+    def _steps(self, mode):
+        # register writes of each mode, compiled once by script()
+        power_on = [
+            ('busy', 1),            # waiting for the electronic paper IC to release the idle signal
+            (0x12, None),           # POWER ON
+            ('busy', 1),
+        ]
+        ram = [
+            (0x11, 0x01),
+            (0x44, [0x00, 0x31]),   # Set Ram X- address Start / End position: 0, 400/8-1
+            (0x45, [0x0f, 0x01, 0x00, 0x00]),   # Set Ram Y- address Start / End position: 300-1, 0
+            (0x4e, 0x00),
+            (0x4f, [0x0f, 0x01]),
+            ('busy', 1),
+            (0x91, 0x00),
+            (0xC4, [0x31, 0x00]),   # same for the second controller, X reversed
+            (0xC5, [0x0f, 0x01, 0x00, 0x00]),
+            (0xCE, 0x31),
+            (0xCF, [0x0f, 0x01]),
+        ]
+        if mode == 'lut':
+            lut = self.LUT_DATA_4Gray
+            return [
+                (0x32, lut[0:227]),
+                (0x3f, lut[227:228]),
+                (0x03, lut[228:229]),
+                (0x04, lut[229:232]),
+                (0x2C, lut[232:233]),
+            ]
+        if mode == 'full':
+            return power_on + ram + [('busy', 1)]
+        if mode == 'fast':
+            return power_on + [
+                (0x18, 0x80),
+                (0x22, 0xB1),
+                (0x20, None),
+                ('busy', 1),
+                (0x1A, [0x64, 0x00]),
+                (0x22, 0x91),
+                (0x20, None),
+                ('busy', 1),
+            ] + ram + [('busy', 1)]
+        if mode == 'partial':
+            return power_on + [(0x3C, 0x80)]
+        if mode == '4gray':
+            return power_on + [
+                (0x0C, [0x8B, 0x9C, 0xA6, 0x0F]),
+                (0x3C, 0x81),
+                ('busy', 1),
+            ] + ram + self._steps('lut')
+        raise ValueError("unknown mode %r" % mode)
+
+    def script(self, mode):
+        '''
+        function : Init / LUT script of a mode, compiled on first use
+        parameter:
+            mode : 'full', 'fast', 'partial', '4gray' or 'lut'
+        '''
+        script = _SCRIPTS.get(mode)
+        if script is None:
+            script = _SCRIPTS[mode] = epdconfig.compile_script(self._steps(mode))
+        return script
 
-        self.send_command(0x2C) 
-        self.send_data(self.LUT_DATA_4Gray[232]) 
+    def EPD_5in79_Lut(self):
+        epdconfig.run_script(self.script('lut'))
 
     def init(self):
         if (epdconfig.module_init() != 0):
             return -1
             
         self.reset()
-        self.ReadBusy()             # waiting for the electronic paper IC to release the idle signal
-        self.send_command(0x12)     # POWER ON
-        self.ReadBusy()             # waiting for the electronic paper IC to release the idle signal
-
-        self.send_command(0x11)
-        self.send_data(0x01)
-
-        self.send_command(0x44)	    #  Set Ram X- address Start / End position
-        self.send_data(0x00)        #  XStart, POR = 00h
-        self.send_data(0x31)        # 400/8-1
-        self.send_command(0x45)     #  Set Ram Y- address  Start / End position 
-        self.send_data(0x0f)  
-        self.send_data(0x01)        # 300-1	
-        self.send_data(0x00)        #  YEnd L
-        self.send_data(0x00)        #  YEnd H 
-
-        self.send_command(0x4e)	 						 
-        self.send_data(0x00)	
-        self.send_command(0x4f)	 
-        self.send_data(0x0f)  
-        self.send_data(0x01) 	
-
-        self.ReadBusy()   
-
-        self.send_command(0x91)
-        self.send_data(0x00)
-
-        self.send_command(0xC4)     #  Set Ram X- address Start / End position
-        self.send_data(0x31)        #  XStart, POR = 00h
-        self.send_data(0x00)        # 400/8-1
-        self.send_command(0xC5)     #  Set Ram Y- address  Start / End position 
-        self.send_data(0x0f)  
-        self.send_data(0x01)        # 300-1	
-        self.send_data(0x00)        # YEnd L
-        self.send_data(0x00)        # YEnd H 
-
-        self.send_command(0xCE)	 						 
-        self.send_data(0x31)	
-        self.send_command(0xCF)	 
-        self.send_data(0x0f)  
-        self.send_data(0x01)
-
-        self.ReadBusy()   
-
+        epdconfig.run_script(self.script('full'), self.ReadBusy)
         return 0
 
     def init_Fast(self):
@@ -232,67 +241,7 @@ class EPD:
             return -1
             
         self.reset()
-        self.ReadBusy()
-        self.send_command(0x12)
-        self.ReadBusy()
-
-        self.send_command(0x18)
-        self.send_data(0x80)	
-
-        self.send_command(0x22)
-        self.send_data(0xB1)		
-        self.send_command(0x20)	
-        self.ReadBusy()   
-
-        self.send_command(0x1A)
-        self.send_data(0x64)		
-        self.send_data(0x00)	
-                
-        self.send_command(0x22)
-        self.send_data(0x91)		
-        self.send_command(0x20)	
-        self.ReadBusy()   
-
-        self.send_command(0x11)
-        self.send_data(0x01)
-
-        self.send_command(0x44)
-        self.send_data(0x00)
-        self.send_data(0x31)
-        self.send_command(0x45)
-        self.send_data(0x0f)  
-        self.send_data(0x01)
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0x4e)	 						 
-        self.send_data(0x00)	
-        self.send_command(0x4f)	 
-        self.send_data(0x0f)  
-        self.send_data(0x01) 	
-
-        self.ReadBusy()   
-
-        self.send_command(0x91)
-        self.send_data(0x00)
-
-        self.send_command(0xC4)
-        self.send_data(0x31)
-        self.send_data(0x00)
-        self.send_command(0xC5)
-        self.send_data(0x0f)  
-        self.send_data(0x01)
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0xCe)	 						 
-        self.send_data(0x31)	
-        self.send_command(0xCf)	 
-        self.send_data(0x0f)  
-        self.send_data(0x01)
-
-        self.ReadBusy()   
-
+        epdconfig.run_script(self.script('fast'), self.ReadBusy)
         return 0
     
     def init_Partial(self):
@@ -300,13 +249,7 @@ class EPD:
             return -1
             
         self.reset()
-        self.ReadBusy()
-        self.send_command(0x12)
-        self.ReadBusy() 
-
-        self.send_command(0x3C)
-        self.send_data(0x80)
-
+        epdconfig.run_script(self.script('partial'), self.ReadBusy)
         return 0
     
     def init_4Gray(self):
@@ -314,120 +257,19 @@ class EPD:
             return -1
             
         self.reset()
-        self.ReadBusy()   
-        self.send_command(0x12) 
-        self.ReadBusy() 
-
-        self.send_command(0x0C)     
-        self.send_data(0x8B)    
-        self.send_data(0x9C)    
-        self.send_data(0xA6)    
-        self.send_data(0x0F)
-
-        self.send_command(0x3C)
-        self.send_data(0x81)
-
-        self.ReadBusy()	
-
-        self.send_command(0x11)
-        self.send_data(0x01)
-
-        self.send_command(0x44)
-        self.send_data(0x00)
-        self.send_data(0x31)
-        self.send_command(0x45)
-        self.send_data(0x0f)  
-        self.send_data(0x01)
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0x4e)	 						 
-        self.send_data(0x00)	
-        self.send_command(0x4f)	 
-        self.send_data(0x0f)  
-        self.send_data(0x01) 	
-
-        self.ReadBusy()   
-
-        self.send_command(0x91)
-        self.send_data(0x00)
-
-        self.send_command(0xC4)
-        self.send_data(0x31)
-        self.send_data(0x00)
-        self.send_command(0xC5)
-        self.send_data(0x0f)  
-        self.send_data(0x01)
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0xCe)	 						 
-        self.send_data(0x31)	
-        self.send_command(0xCf)	 
-        self.send_data(0x0f)  
-        self.send_data(0x01)
-
-        self.EPD_5in79_Lut()
+        epdconfig.run_script(self.script('4gray'), self.ReadBusy)
         return 0
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
+        buf = epdbuffer.pack_1bit(image, self.width, self.height)
+        if buf is None:
+            return [0xFF] * (int(self.width/8) * self.height)
         return buf
     
     def getbuffer_4Gray(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
-        image_monocolor = image.convert('L')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i=0
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((x + (y * self.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
-                        
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = self.height - x - 1
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((newx + (newy * self.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6) 
+        buf = epdbuffer.pack_4gray(image, self.width, self.height)
+        if buf is None:
+            return [0xFF] * (int(self.width / 4) * self.height)
         return buf
 
     def display(self, imageblack):
@@ -438,13 +280,13 @@ class EPD:
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 : i * Width1+Width])
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.send_command(0xA4)
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 + Width - 1 : i * Width1 + Width * 2 - 1])
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.TurnOnDisplay()
 
@@ -456,13 +298,13 @@ class EPD:
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 : i * Width1+Width])
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.send_command(0xA4)
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 + Width - 1 : i * Width1 + Width * 2 - 1])
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.TurnOnDisplay()
 
@@ -479,22 +321,22 @@ class EPD:
         Width1 =int(self.width / 8)
         
         self.send_command(0x24)
-        self.send_data2([color] * 13600)
+        self.send_data2(epdbuffer.fill(color, 13600))
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.send_command(0xA4)
-        self.send_data2([color] * 13600)
+        self.send_data2(epdbuffer.fill(color, 13600))
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.TurnOnDisplay()
 
         self.send_command(0x26)
-        self.send_data2([color] * 13600)
+        self.send_data2(epdbuffer.fill(color, 13600))
 
         self.send_command(0xA6)
-        self.send_data2([color] * 13600)
+        self.send_data2(epdbuffer.fill(color, 13600))
 
     def display_Fast(self, imageblack):
         Width =int(self.width / 16)+1
@@ -504,13 +346,13 @@ class EPD:
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 : i * Width1+Width])
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.send_command(0xA4)
         for i in range(self.height):
             self.send_data2(imageblack[i * Width1 + Width - 1 : i * Width1 + Width * 2 - 1])
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.TurnOnDisplay_Fast()
     
@@ -572,105 +414,48 @@ class EPD:
 
 
     def display_4Gray(self, image):
-        Width =int(self.width / 16)+1
-        Width1 =int(self.width / 8)
+        # the panel is driven as two 400 px halves by two controllers,
+        # the second one starts 8 px before the middle of the row
+        Width = int(self.width / 16) + 1
+        Width1 = int(self.width / 8)
+
+        plane1, plane2 = epdbuffer.split_4gray(image, self.width, self.height,
+                                               (0, 1, 0, 1), (0, 0, 1, 1))
+        master1 = bytearray()
+        master2 = bytearray()
+        slave1 = bytearray()
+        slave2 = bytearray()
+        for j in range(self.height):
+            row = j * Width1
+            master1 += plane1[row : row + Width]
+            master2 += plane2[row : row + Width]
+            slave1 += plane1[row + Width - 1 : row + Width1]
+            slave2 += plane2[row + Width - 1 : row + Width1]
 
         self.send_command(0x24)
-        for j in range(self.height):   
-            for i in range(Width):
-                temp3=0
-                for o in range(0, 2):
-                    temp1 = image[(j * Width1 + i)*2+o]
-                    for k in range(0, 4):
-                        temp2 = temp1&0xC0 
-                        if(temp2 == 0xC0):
-                            temp3 |= 0x01
-                        elif(temp2 == 0x00):
-                            temp3 |= 0x00  
-                        elif(temp2 == 0x80): 
-                            temp3 |= 0x00 
-                        else: #0x40
-                            temp3 |= 0x01 
-                        if(o!=1 or k!=3):
-                            temp3 <<= 1
-                        temp1 <<= 2
-                self.send_data(temp3)
-            
-        self.send_command(0x26)	       
-        for j in range(self.height):   
-            for i in range(Width):
-                temp3=0
-                for o in range(0, 2):
-                    temp1 = image[(j * Width1 + i)*2+o]
-                    for k in range(0, 4):
-                        temp2 = temp1&0xC0 
-                        if(temp2 == 0xC0):
-                            temp3 |= 0x01
-                        elif(temp2 == 0x00):
-                            temp3 |= 0x00  
-                        elif(temp2 == 0x80): 
-                            temp3 |= 0x01 
-                        else: #0x40
-                            temp3 |= 0x00 
-                        if(o!=1 or k!=3):
-                            temp3 <<= 1
-                        temp1 <<= 2
-                self.send_data(temp3)
+        self.send_data2(master1)
+
+        self.send_command(0x26)
+        self.send_data2(master2)
 
         self.send_command(0xA4)
-        for j in range(self.height):   
-            for i in range(Width):
-                temp3=0
-                for o in range(0, 2):
-                    temp1 = image[(j * Width1 + i + Width - 1)*2+o]
-                    for k in range(0, 4):
-                        temp2 = temp1&0xC0 
-                        if(temp2 == 0xC0):
-                            temp3 |= 0x01
-                        elif(temp2 == 0x00):
-                            temp3 |= 0x00  
-                        elif(temp2 == 0x80): 
-                            temp3 |= 0x00 
-                        else: #0x40
-                            temp3 |= 0x01 
-                        if(o!=1 or k!=3):
-                            temp3 <<= 1
-                        temp1 <<= 2
-                self.send_data(temp3)
-            
-        self.send_command(0xA6)	       
-        for j in range(self.height):   
-            for i in range(Width):
-                temp3=0
-                for o in range(0, 2):
-                    temp1 = image[(j * Width1 + i + Width - 1)*2+o]
-                    for k in range(0, 4):
-                        temp2 = temp1&0xC0 
-                        if(temp2 == 0xC0):
-                            temp3 |= 0x01
-                        elif(temp2 == 0x00):
-                            temp3 |= 0x00  
-                        elif(temp2 == 0x80): 
-                            temp3 |= 0x01 
-                        else: #0x40
-                            temp3 |= 0x00 
-                        if(o!=1 or k!=3):
-                            temp3 <<= 1
-                        temp1 <<= 2
-                self.send_data(temp3)
-        
+        self.send_data2(slave1)
+
+        self.send_command(0xA6)
+        self.send_data2(slave2)
+
         self.TurnOnDisplay_4GRAY()
 
     def Clear(self):
         self.send_command(0x24)
-        self.send_data2([0xFF] * 13600)
+        self.send_data2(epdbuffer.fill(0xFF, 13600))
         self.send_command(0X26)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.send_command(0xA4)
-        self.send_data2([0xFF] * 13600)
+        self.send_data2(epdbuffer.fill(0xFF, 13600))
         self.send_command(0xA6)
-        self.send_data2([0x00] * 13600)
+        self.send_data2(epdbuffer.fill(0x00, 13600))
 
         self.TurnOnDisplay()
 
@@ -0,0 +1,396 @@
+# *****************************************************************************
+# * | File        :	  epdbuffer.py
+# * | Author      :   NetStark
+# * | Function    :   Image to panel buffer packing
+# * | Info        :
+# *----------------
+# * | This version:   V1.0
+# * | Date        :   2026-10-18
+# # | Info        :   shared by the getbuffer() of every driver
+# -----------------------------------------------------------------------------
+#
+# All packing is done by PIL in C (convert / transpose / tobytes), so building
+# a frame costs a few bulk passes over the image instead of one Python
+# iteration per pixel.
+#
+
+import logging
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# byte -> byte lookup used with bytes.translate() to flip every bit
+INVERT_TABLE = bytes(0xFF - i for i in range(256))
+
+
+def linewidth(width, bits=1):
+    # bytes per row of a panel `width` pixels wide at `bits` bits per pixel
+    return (width * bits + 7) // 8
+
+
+_fills = {}
+
+
+def fill(value, size):
+    '''
+    function : Constant frame for Clear() and friends
+    parameter:
+        value : byte repeated over the whole frame
+        size  : frame length in bytes
+    return   : immutable bytes, built on first use and shared afterwards
+    '''
+    key = (value & 0xFF, int(size))
+    frame = _fills.get(key)
+    if frame is None:
+        frame = bytes(key[:1]) * key[1]
+        _fills[key] = frame
+    return frame
+
+
+def invert(buf):
+    '''
+    function : Invert every bit of a buffer
+    parameter:
+        buf : bytes, bytearray or list of 0..255 values
+    return   : new bytearray, the input is left untouched
+    '''
+    return bytearray(buf).translate(INVERT_TABLE)
+
+
+def to_panel(image, width, height, mode='1', rotate=Image.ROTATE_90):
+    '''
+    function : Convert an image to `mode` and turn it into panel orientation
+    parameter:
+        image  : PIL image, either width x height or height x width
+        width  : panel width
+        height : panel height
+        mode   : PIL mode to convert to, None keeps the image mode
+        rotate : transpose applied to height x width images
+    return   : image of size width x height, None on wrong dimensions
+    '''
+    if mode is not None and image.mode != mode:
+        image = image.convert(mode)
+    imwidth, imheight = image.size
+    if imwidth == width and imheight == height:
+        return image
+    if imwidth == height and imheight == width:
+        # ROTATE_90 is the newx = y, newy = height - x - 1 of the old loops
+        return image.transpose(rotate)
+    return None
+
+
+def pack_1bit_image(image, x=0):
+    '''
+    function : Pack a mode '1' image row by row, MSB first, 1 = white
+    parameter:
+        image : mode '1' image already in panel orientation
+        x     : number of white columns inserted before the image
+    return   : bytearray, rows padded with white bits up to a full byte
+    '''
+    imwidth, imheight = image.size
+    if x or imwidth % 8:
+        canvas = Image.new('1', (linewidth(imwidth + x) * 8, imheight), 1)
+        canvas.paste(image, (x, 0))
+        image = canvas
+    return bytearray(image.tobytes('raw', '1'))
+
+
+def pack_1bit(image, width, height, invert=False):
+    '''
+    function : Build a 1 bit per pixel panel buffer
+    parameter:
+        image  : PIL image in any mode, landscape or portrait
+        width  : panel width
+        height : panel height
+        invert : True for panels where 1 = black
+    return   : bytearray of linewidth(width) * height bytes,
+               None if the image does not fit the panel
+    '''
+    img = to_panel(image, width, height)
+    if img is None:
+        return None
+    buf = pack_1bit_image(img)
+    if invert:
+        buf = buf.translate(INVERT_TABLE)
+    return buf
+
+
+def pack_indexed(image, bits):
+    '''
+    function : Pack a palette index image at 1, 2, 4 or 8 bits per pixel
+    parameter:
+        image : mode 'P' image already in panel orientation
+        bits  : bits per pixel, the first pixel lands in the high bits
+    return   : bytearray, rows padded with zero bits up to a full byte
+    '''
+    if bits == 8:
+        return bytearray(image.tobytes('raw', 'P'))
+    return bytearray(image.tobytes('raw', 'P;%d' % bits))
+
+
+def pack_1bit_levels(image, width, height, bits, black, white):
+    '''
+    function : Build a buffer of a mono image for panels using more than
+               one bit per pixel
+    parameter:
+        image  : PIL image in any mode, landscape or portrait
+        bits   : bits per pixel of the panel (2 or 4)
+        black  : pixel value sent for black
+        white  : pixel value sent for white
+    return   : bytearray, None if the image does not fit the panel
+    '''
+    img = to_panel(image, width, height)
+    if img is None:
+        return None
+    lut = [black] * 128 + [white] * 128
+    return pack_indexed(img.convert('P').point(lut), bits)
+
+
+_palettes = {}
+
+
+def palette_image(palette):
+    '''
+    function : Palette image for Image.quantize(), built once per palette
+    parameter:
+        palette : flat (r, g, b, r, g, b, ...) tuple of the colors the panel
+                  supports, in controller index order: the PALETTE of the
+                  color drivers
+    '''
+    pal_image = _palettes.get(palette)
+    if pal_image is None:
+        pal_image = Image.new("P", (1, 1))
+        pal_image.putpalette(palette + (0, 0, 0) * (256 - len(palette) // 3))
+        _palettes[palette] = pal_image
+    return pal_image
+
+
+def pack_color(image, width, height, palette, bits, dither=True):
+    '''
+    function : Build a buffer for the multi-color panels: the image is
+               converted to the panel colors and 8 / bits pixels are packed
+               into each byte
+    parameter:
+        image   : PIL image in any mode, landscape or portrait
+        palette : flat rgb tuple of the panel colors, see palette_image()
+        bits    : bits per pixel of the panel (2 or 4)
+        dither  : Floyd-Steinberg dithering, only worth it for photos, UI
+                  frames look better without it
+    return   : bytearray, None if the image does not fit the panel. The
+               drivers then send a white frame, the white index repeated
+               in every pixel (0x55 for 2 bits, 0x11 for 4 bits).
+    '''
+    img = to_panel(image, width, height, 'RGB')
+    if img is None:
+        return None
+    img = img.quantize(palette=palette_image(palette),
+                       dither=Image.FLOYDSTEINBERG if dither else Image.NONE)
+    return pack_indexed(img, bits)
+
+
+def window_bytes(x0, x1):
+    # byte columns [bx0, bx1) holding pixel columns [x0, x1)
+    return x0 // 8, (x1 + 7) // 8
+
+
+def region(buf, linewidth, x0, y0, x1, y1):
+    '''
+    function : Cut a window out of a 1 bit frame buffer
+    parameter:
+        buf       : frame buffer from getbuffer(), linewidth bytes per row
+        x0, y0    : top left corner, in panel orientation
+        x1, y1    : bottom right corner, excluded
+    return   : rows of the window back to back, widened to whole bytes.
+               A zero-copy memoryview when the window spans full rows.
+    '''
+    if not isinstance(buf, (bytes, bytearray, memoryview)):
+        buf = bytes(buf)
+    view = memoryview(buf)
+    bx0, bx1 = window_bytes(x0, x1)
+    if bx0 == 0 and bx1 == linewidth:
+        return view[y0 * linewidth:y1 * linewidth]
+    return b''.join([view[row + bx0:row + bx1]
+                     for row in range(y0 * linewidth, y1 * linewidth, linewidth)])
+
+
+def put_region(buf, linewidth, x0, y0, x1, y1, data):
+    '''
+    function : Write a window cut by region() back into a frame buffer
+    parameter:
+        buf  : bytearray frame buffer, linewidth bytes per row
+        data : window rows back to back
+    '''
+    bx0, bx1 = window_bytes(x0, x1)
+    n = bx1 - bx0
+    view = memoryview(data)
+    for i, row in enumerate(range(y0 * linewidth, y1 * linewidth, linewidth)):
+        buf[row + bx0:row + bx1] = view[i * n:(i + 1) * n]
+
+
+def dirty_rects(old, new, width, height, gap=0):
+    '''
+    function : Compare two frame buffers and list what changed
+    parameter:
+        old, new : frame buffers from getbuffer(), old may be None
+        width    : panel width, height : panel height
+        gap      : changed rows at most this far apart share a rectangle
+    return   : list of (x0, y0, x1, y1), x1 and y1 excluded, x0 and x1 on
+               the 8 pixel column grid. Empty when nothing changed.
+               Buffers with more than 1 bit per pixel (gray, color) are
+               only compared as a whole: any change is the full frame.
+    '''
+    if old is None or len(old) != len(new):
+        return [(0, 0, width, height)]
+    lw = linewidth(width)
+    oldv = memoryview(old if isinstance(old, (bytes, bytearray)) else bytes(old))
+    newv = memoryview(new if isinstance(new, (bytes, bytearray)) else bytes(new))
+    if oldv == newv:
+        return []
+    if len(newv) != lw * height:
+        return [(0, 0, width, height)]
+    rects = []
+    cur = None
+    for y in range(height):
+        o = oldv[y * lw:(y + 1) * lw]
+        n = newv[y * lw:(y + 1) * lw]
+        if o == n:
+            continue
+        # bits set where the row changed, first byte in the high bits
+        x = int.from_bytes(o, 'big') ^ int.from_bytes(n, 'big')
+        bx0 = lw - (x.bit_length() + 7) // 8
+        bx1 = lw - ((x & -x).bit_length() - 1) // 8
+        if cur is not None and y - cur[3] <= gap:
+            cur[0] = min(cur[0], bx0)
+            cur[2] = max(cur[2], bx1)
+            cur[3] = y + 1
+        else:
+            cur = [bx0, y, bx1, y + 1]
+            rects.append(cur)
+    return [(bx0 * 8, y0, min(bx1 * 8, width), y1) for bx0, y0, bx1, y1 in rects]
+
+
+def bounds(rects):
+    # smallest rectangle holding all of `rects`
+    return (min(r[0] for r in rects), min(r[1] for r in rects),
+            max(r[2] for r in rects), max(r[3] for r in rects))
+
+
+def panel_rect(box, size, width, height):
+    '''
+    function : Where a box of an image lands once pack_1bit() turned the
+               image to the panel (ROTATE_90 for the other orientation)
+    parameter:
+        box    : (x0, y0, x1, y1) on the image, x1 and y1 excluded
+        size   : image size
+        width, height : panel size
+    return   : (x0, y0, x1, y1) in panel orientation, None on wrong sizes
+    '''
+    x0, y0, x1, y1 = box
+    if size == (width, height):
+        return box
+    if size == (height, width):
+        # ROTATE_90: x, y -> y, W - 1 - x with W the image width
+        return (y0, size[0] - x1, y1, size[0] - x0)
+    return None
+
+
+def image_box(rect, size, width, height):
+    # panel_rect() the other way around
+    x0, y0, x1, y1 = rect
+    if size == (width, height):
+        return rect
+    return (size[0] - y1, x0, size[0] - y0, x1)
+
+
+def pack_1bit_region(image, width, height, box, invert=False):
+    '''
+    function : Pack one box of an image the way pack_1bit() packs it all
+    parameter:
+        image  : mode '1' image, landscape or portrait
+        box    : (x0, y0, x1, y1) on the image
+        invert : True for panels where 1 = black
+    return   : (rect, data): rect the panel window, widened to whole bytes
+               like dirty_rects(), and data its rows like region() cuts
+               them. None on wrong dimensions.
+    '''
+    rect = panel_rect(box, image.size, width, height)
+    if rect is None:
+        return None
+    bx0, bx1 = window_bytes(max(rect[0], 0), min(rect[2], width))
+    rect = (bx0 * 8, max(rect[1], 0), min(bx1 * 8, width), min(rect[3], height))
+    part = image.crop(image_box(rect, image.size, width, height))
+    if image.size != (width, height):
+        part = part.transpose(Image.ROTATE_90)
+    buf = pack_1bit_image(part)
+    if invert:
+        buf = buf.translate(INVERT_TABLE)
+    return rect, buf
+
+
+def merge(a, b, invert=False):
+    '''
+    function : Ink of two 1 bit buffers of the same size
+    parameter:
+        invert : True for panels where 1 = black (OR), else 1 = white (AND)
+    return   : bytes
+    '''
+    x = int.from_bytes(a, 'big')
+    y = int.from_bytes(b, 'big')
+    return ((x | y) if invert else (x & y)).to_bytes(len(a), 'big')
+
+
+# 'L' value -> 2 bit gray level (0 black, 1 gray2, 2 gray1, 3 white).
+# 0xC0 and 0x80 are moved down one step first, like the drivers always did.
+GRAY4_LEVELS = [((0x80 if v == 0xC0 else 0x40 if v == 0x80 else v) & 0xC0) >> 6
+                for v in range(256)]
+
+
+def levels_4gray(image, width, height, rotate=Image.ROTATE_90):
+    '''
+    function : Map an image to the 4 gray levels, in panel orientation
+    parameter:
+        image  : PIL image in any mode, landscape or portrait
+        rotate : transpose used for landscape images
+    return   : mode 'P' image of levels 0..3, None on wrong dimensions
+    '''
+    img = to_panel(image, width, height, 'L', rotate)
+    if img is None:
+        return None
+    return img.convert('P').point(GRAY4_LEVELS)
+
+
+def pack_4gray(image, width, height, rotate=Image.ROTATE_90):
+    '''
+    function : Build a 2 bit per pixel buffer for display_4Gray()
+    return   : bytearray, None on wrong dimensions
+    '''
+    levels = levels_4gray(image, width, height, rotate)
+    if levels is None:
+        return None
+    return pack_indexed(levels, 2)
+
+
+def planes_4gray(levels, *luts):
+    '''
+    function : Split a level image into 1 bit RAM planes
+    parameter:
+        levels : mode 'P' image of levels 0..3
+        luts   : one (black, gray2, gray1, white) tuple of bits per plane
+    return   : list of bytearray, one per lut
+    '''
+    return [pack_indexed(levels.point(list(lut) + [0] * 252), 1) for lut in luts]
+
+
+def split_4gray(buf, width, height, *luts):
+    '''
+    function : Split a getbuffer_4Gray() buffer into 1 bit RAM planes
+    parameter:
+        buf   : 2 bit per pixel buffer, width * height / 4 bytes
+        luts  : one tuple per RAM plane, the bit sent to that RAM for each
+                level (black, gray2, gray1, white)
+    return   : list of bytearray, one per lut
+    '''
+    levels = Image.frombytes('P', (width, height), bytes(buf), 'raw', 'P;2')
+    return planes_4gray(levels, *luts)
+
+### END OF FILE ###
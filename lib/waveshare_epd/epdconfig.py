@@ -31,14 +31,333 @@ import os
 import logging
 import sys
 import time
-import subprocess
+import struct
 
 from ctypes import *
 
 logger = logging.getLogger(__name__)
 
+# Longest time a refresh may hold BUSY before wait_busy() gives up, in ms
+BUSY_TIMEOUT = 60000
 
-class RaspberryPi:
+
+def _wait_busy(read, wait_edge, level, timeout, poll, poll_ms):
+    # Shared body of wait_busy(): sleep on the BUSY edge instead of polling.
+    # wait_edge(seconds) must return early once the pin leaves `level`.
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout / 1000.0
+    while read() == level:
+        if poll is not None:
+            poll()
+        wait = None if poll is None else poll_ms / 1000.0
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning("e-Paper busy timeout after %d ms", timeout)
+                break
+            wait = remaining if wait is None else min(wait, remaining)
+        wait_edge(wait)
+    busy_ms = (time.monotonic() - start) * 1000.0
+    logger.debug("e-Paper busy for %.1f ms", busy_ms)
+    return busy_ms
+
+
+# SPI clock used by module_init(), EPD_SPI_HZ overrides it. Most panels are
+# fine well above the 4 MHz the vendor code used, spi_stats() shows the gain.
+SPI_SPEED_HZ = int(os.environ.get('EPD_SPI_HZ', 4000000))
+
+# How the Raspberry Pi backend moves bytes: 'spidev' (kernel SPI) or
+# 'devconfig' (DEV_Config_*.so, software SPI through lgpio). The drivers
+# calling module_init(cleanup=True) always get 'devconfig'.
+SPI_TRANSPORT = os.environ.get('EPD_SPI_TRANSPORT', 'spidev')
+
+
+def _spidev_bufsiz(default=4096):
+    # Largest transfer the spidev kernel driver accepts in one ioctl
+    try:
+        with open('/sys/module/spidev/parameters/bufsiz') as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return default
+
+
+def _as_bytes(data):
+    # bytes, bytearray and memoryview are used in place. Lists of ints are
+    # converted once in C instead of element by element by spidev.
+    if isinstance(data, memoryview):
+        return data if data.format == 'B' else data.cast('B')
+    if isinstance(data, (bytes, bytearray)):
+        return memoryview(data)
+    try:
+        return memoryview(bytes(data))
+    except ValueError:
+        # some drivers send ~x, spidev always kept just the low byte
+        return memoryview(bytes([x & 0xFF for x in data]))
+
+
+# Opcodes of the scripts built by compile_script()
+SCRIPT_WRITE = 0x01     # command, length (2 bytes, LE), data
+SCRIPT_DELAY = 0x02     # milliseconds (2 bytes, LE)
+SCRIPT_BUSY = 0x03      # level BUSY sits at while busy
+
+
+def compile_script(steps):
+    '''
+    function : Pack an init / LUT sequence into a flat script for run_script()
+    parameter:
+        steps : list of (command, data) like send_sequence(), plus
+                ('delay', ms) and ('busy', level) to wait in between
+    return   : bytes, to build once and keep
+    '''
+    script = bytearray()
+    for step, arg in steps:
+        if step == 'delay':
+            script += struct.pack('<BH', SCRIPT_DELAY, arg)
+        elif step == 'busy':
+            script += struct.pack('<BB', SCRIPT_BUSY, arg)
+        else:
+            if isinstance(arg, int):
+                arg = (arg,)
+            data = bytes(_as_bytes(arg)) if arg is not None else b''
+            script += struct.pack('<BBH', SCRIPT_WRITE, step & 0xFF, len(data))
+            script += data
+    return bytes(script)
+
+
+class _Sequence:
+    # send_sequence(), shared by every backend on top of its own
+    # digital_write() / spi_writebyte2()
+
+    def send_sequence(self, seq):
+        '''
+        function : Send a run of register writes in as few transfers as possible
+        parameter:
+            seq : list of (command, data). command is a byte, or None to go
+                  on with the data of the previous entry. data is bytes, a
+                  list of ints, a single int or None.
+        note     : DC only changes between a command and its data, and all
+                   bytes of the same kind in a row go out in one transfer.
+                   CS is held low for the whole sequence.
+        '''
+        runs = []
+        for command, data in seq:
+            if command is not None:
+                self._sequence_add(runs, 0, (command & 0xFF,))
+            if isinstance(data, int):
+                data = (data & 0xFF,)
+            if data is not None and len(data):
+                self._sequence_add(runs, 1, _as_bytes(data))
+        self.digital_write(self.CS_PIN, 0)
+        dc = None
+        for level, buf in runs:
+            if level != dc:
+                self.digital_write(self.DC_PIN, level)
+                dc = level
+            self.spi_writebyte2(buf)
+        self.digital_write(self.CS_PIN, 1)
+
+    def run_script(self, script, busy=None):
+        '''
+        function : Play a script from compile_script()
+        parameter:
+            script : bytes
+            busy   : callable for the busy steps, the driver's ReadBusy;
+                     wait_busy(level) when None
+        note     : the writes between two waits go out as one send_sequence()
+        '''
+        view = memoryview(script)
+        seq = []
+        i = 0
+        while i < len(view):
+            op = view[i]
+            if op == SCRIPT_WRITE:
+                size = view[i + 2] | view[i + 3] << 8
+                seq.append((view[i + 1], view[i + 4:i + 4 + size]))
+                i += 4 + size
+                continue
+            if seq:
+                self.send_sequence(seq)
+                seq = []
+            if op == SCRIPT_DELAY:
+                self.delay_ms(view[i + 1] | view[i + 2] << 8)
+                i += 3
+            elif op == SCRIPT_BUSY:
+                if busy is not None:
+                    busy()
+                else:
+                    self.wait_busy(view[i + 1])
+                i += 2
+            else:
+                raise ValueError("bad script opcode 0x%02x at %d" % (op, i))
+        if seq:
+            self.send_sequence(seq)
+
+    @staticmethod
+    def _sequence_add(runs, level, data):
+        if runs and runs[-1][0] == level:
+            runs[-1][1].extend(data)
+        else:
+            runs.append((level, bytearray(data)))
+
+
+class _SPIStream(_Sequence):
+    # Chunked bulk writes plus throughput accounting, shared by the backends
+    # talking to /dev/spidev.
+
+    def _spi_stream(self, data):
+        view = _as_bytes(data)
+        size = len(view)
+        chunk = self.spi_chunk
+        write = self.SPI.writebytes2
+        start = time.perf_counter()
+        if size <= chunk:
+            write(view)
+        else:
+            for i in range(0, size, chunk):
+                write(view[i:i + chunk])
+        self.spi_bytes += size
+        self.spi_time += time.perf_counter() - start
+
+    def spi_writebyte2(self, data):
+        self._spi_stream(data)
+
+    def spi_set_speed(self, hz):
+        '''
+        function : Change the SPI clock, also while the bus is open
+        parameter:
+            hz : clock in Hz, the panel datasheets allow up to 10-20 MHz
+        '''
+        self.spi_speed = int(hz)
+        if self.spi_open:
+            self.SPI.max_speed_hz = self.spi_speed
+
+    def spi_stats(self, reset=False):
+        '''
+        function : Bulk SPI throughput since the last reset
+        return   : (bytes sent, seconds spent sending, bytes per second)
+        '''
+        rate = self.spi_bytes / self.spi_time if self.spi_time else 0.0
+        stats = (self.spi_bytes, self.spi_time, rate)
+        if reset:
+            self.spi_bytes = 0
+            self.spi_time = 0.0
+        return stats
+
+    def _spi_reset(self):
+        self.spi_speed = SPI_SPEED_HZ
+        self.spi_chunk = _spidev_bufsiz()
+        self.spi_open = False
+        self.spi_bytes = 0
+        self.spi_time = 0.0
+
+
+# Output pins (RST, DC, PWR) of the Raspberry Pi backend: 'gpiozero', or
+# one of the direct layers below, 'lgpio', 'gpiomem' or 'auto' for the
+# first that works. gpiozero stays the fallback.
+GPIO_DRIVER = os.environ.get('EPD_GPIO', 'gpiozero')
+
+
+class _GpiomemPin:
+    # BCM2835..2711 GPIO registers through the /dev/gpiomem mmap, a toggle
+    # is one 32 bit store to GPSET0 / GPCLR0. Same on/off/value/close as a
+    # gpiozero LED.
+    GPSET0 = 0x1C // 4
+    GPCLR0 = 0x28 // 4
+    GPLEV0 = 0x34 // 4
+
+    def __init__(self, regs, pin):
+        self.regs = regs
+        self.mask = 1 << pin
+        # GPFSELn: 3 bits per pin, 001 = output
+        reg, shift = pin // 10, (pin % 10) * 3
+        regs[reg] = (regs[reg] & ~(7 << shift)) | (1 << shift)
+        self.off()
+
+    def on(self):
+        self.regs[self.GPSET0] = self.mask
+
+    def off(self):
+        self.regs[self.GPCLR0] = self.mask
+
+    @property
+    def value(self):
+        return 1 if self.regs[self.GPLEV0] & self.mask else 0
+
+    def close(self):
+        pass
+
+
+class _LgpioPin:
+    # Same as _GpiomemPin through lgpio, which also works on the Pi 5
+
+    def __init__(self, lgpio, handle, pin):
+        self.lgpio = lgpio
+        self.handle = handle
+        self.pin = pin
+        lgpio.gpio_claim_output(handle, pin, 0)
+
+    def on(self):
+        self.lgpio.gpio_write(self.handle, self.pin, 1)
+
+    def off(self):
+        self.lgpio.gpio_write(self.handle, self.pin, 0)
+
+    @property
+    def value(self):
+        return self.lgpio.gpio_read(self.handle, self.pin)
+
+    def close(self):
+        self.lgpio.gpio_free(self.handle, self.pin)
+
+
+_gpio_handles = {}
+
+
+def _lgpio_outputs(pins):
+    import lgpio
+    if 'lgpio' not in _gpio_handles:
+        # the header is on gpiochip4 on a Pi 5 with older kernels
+        chip = 4 if ('Raspberry Pi 5' in _read('/proc/device-tree/model')
+                     and os.path.exists('/dev/gpiochip4')) else 0
+        _gpio_handles['lgpio'] = lgpio.gpiochip_open(chip)
+    handle = _gpio_handles['lgpio']
+    return {pin: _LgpioPin(lgpio, handle, pin) for pin in pins}
+
+
+def _gpiomem_outputs(pins):
+    import mmap
+    if 'Raspberry Pi 5' in _read('/proc/device-tree/model'):
+        raise OSError('no BCM GPIO block on the Pi 5')
+    if 'gpiomem' not in _gpio_handles:
+        with open('/dev/gpiomem', 'r+b') as f:
+            _gpio_handles['gpiomem'] = memoryview(mmap.mmap(f.fileno(), 4096)).cast('I')
+    regs = _gpio_handles['gpiomem']
+    return {pin: _GpiomemPin(regs, pin) for pin in pins}
+
+
+def fast_outputs(pins, driver=None):
+    '''
+    function : Output pins driven without gpiozero
+    parameter:
+        pins   : BCM pin numbers
+        driver : 'lgpio', 'gpiomem', 'auto' or 'gpiozero', GPIO_DRIVER by default
+    return   : {pin: object with on() / off() / value / close()},
+               None when gpiozero should be used
+    '''
+    driver = driver or GPIO_DRIVER
+    layers = {'lgpio': [_lgpio_outputs], 'gpiomem': [_gpiomem_outputs],
+              'auto': [_lgpio_outputs, _gpiomem_outputs]}.get(driver, [])
+    for layer in layers:
+        try:
+            return layer(pins)
+        except (ImportError, OSError, RuntimeError) as e:
+            logger.debug("%s GPIO not available: %r", layer.__name__, e)
+    if layers:
+        logger.warning("fast GPIO '%s' not available, using gpiozero", driver)
+    return None
+
+
+class RaspberryPi(_SPIStream):
     # Pin definition
     RST_PIN  = 17
     DC_PIN   = 25
@@ -48,61 +367,102 @@ class RaspberryPi:
     MOSI_PIN = 10
     SCLK_PIN = 11
 
-    def __init__(self):
-        import spidev
+    def __init__(self, spi=None):
         import gpiozero
         
-        self.SPI = spidev.SpiDev()
-        self.GPIO_RST_PIN    = gpiozero.LED(self.RST_PIN)
-        self.GPIO_DC_PIN     = gpiozero.LED(self.DC_PIN)
+        # spidev.SpiDev, made by module_init() unless one is passed in
+        self.SPI = spi
+        outputs = fast_outputs([self.RST_PIN, self.DC_PIN, self.PWR_PIN])
+        if outputs is None:
+            outputs = {pin: gpiozero.LED(pin) for pin in (self.RST_PIN, self.DC_PIN, self.PWR_PIN)}
+        self.GPIO_RST_PIN    = outputs[self.RST_PIN]
+        self.GPIO_DC_PIN     = outputs[self.DC_PIN]
         # self.GPIO_CS_PIN     = gpiozero.LED(self.CS_PIN)
-        self.GPIO_PWR_PIN    = gpiozero.LED(self.PWR_PIN)
+        self.GPIO_PWR_PIN    = outputs[self.PWR_PIN]
         self.GPIO_BUSY_PIN   = gpiozero.Button(self.BUSY_PIN, pull_up = False)
+        # pin -> (off, on), one lookup per digital_write()
+        self.outputs = {pin: (out.off, out.on) for pin, out in outputs.items()}
+        self.DEV_SPI = None
+        self.dev_open = False
+        self.transport = SPI_TRANSPORT
+        self._spi_reset()
 
         
 
     def digital_write(self, pin, value):
-        if pin == self.RST_PIN:
-            if value:
-                self.GPIO_RST_PIN.on()
-            else:
-                self.GPIO_RST_PIN.off()
-        elif pin == self.DC_PIN:
-            if value:
-                self.GPIO_DC_PIN.on()
-            else:
-                self.GPIO_DC_PIN.off()
-        # elif pin == self.CS_PIN:
-        #     if value:
-        #         self.GPIO_CS_PIN.on()
-        #     else:
-        #         self.GPIO_CS_PIN.off()
-        elif pin == self.PWR_PIN:
-            if value:
-                self.GPIO_PWR_PIN.on()
-            else:
-                self.GPIO_PWR_PIN.off()
+        # CS is left to spidev, writes to it are ignored
+        out = self.outputs.get(pin)
+        if out is not None:
+            out[1 if value else 0]()
 
     def digital_read(self, pin):
         if pin == self.BUSY_PIN:
             return self.GPIO_BUSY_PIN.value
         elif pin == self.RST_PIN:
-            return self.RST_PIN.value
+            return self.GPIO_RST_PIN.value
         elif pin == self.DC_PIN:
-            return self.DC_PIN.value
+            return self.GPIO_DC_PIN.value
         # elif pin == self.CS_PIN:
         #     return self.CS_PIN.value
         elif pin == self.PWR_PIN:
-            return self.PWR_PIN.value
+            return self.GPIO_PWR_PIN.value
 
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy(self, level, timeout=BUSY_TIMEOUT, poll=None, poll_ms=100):
+        '''
+        function : Block until the BUSY pin leaves `level`
+        parameter:
+            level   : pin value meaning busy (1 or 0, depends on the panel)
+            timeout : give up after this many ms, None waits forever
+            poll    : optional callable run every poll_ms while busy,
+                      for panels that want a 0x71 status read
+        return   : time spent busy in ms
+        '''
+        # gpiozero wakes the waiter from its edge callback, no polling
+        if level:
+            wait_edge = self.GPIO_BUSY_PIN.wait_for_release
+        else:
+            wait_edge = self.GPIO_BUSY_PIN.wait_for_press
+        return _wait_busy(lambda: self.GPIO_BUSY_PIN.value, wait_edge,
+                          level, timeout, poll, poll_ms)
+
     def spi_writebyte(self, data):
-        self.SPI.writebytes(data)
+        if self.transport == 'devconfig':
+            for byte in data:
+                self.DEV_SPI.DEV_SPI_SendData(byte & 0xFF)
+        else:
+            self.SPI.writebytes(data)
 
     def spi_writebyte2(self, data):
-        self.SPI.writebytes2(data)
+        if self.transport == 'devconfig':
+            self._dev_stream(data)
+        else:
+            self._spi_stream(data)
+
+    def _dev_stream(self, data):
+        # DEV_SPI_SendnData() sends sizeof(UBYTE *) bytes from the pointer
+        # it gets: 8 with DEV_Config_64.so, 4 with DEV_Config_32.so. Walk
+        # one ctypes view of the frame in steps of that size and send the
+        # tail byte by byte. The frame is not copied when it is a bytearray.
+        view = _as_bytes(data)
+        size = len(view)
+        start = time.perf_counter()
+        if view.readonly:
+            buf = (c_ubyte * size).from_buffer_copy(view)
+        else:
+            buf = (c_ubyte * size).from_buffer(view)
+        send_n = self.DEV_SPI.DEV_SPI_SendnData
+        send = self.DEV_SPI.DEV_SPI_SendData
+        step = sizeof(c_void_p)
+        tail = size - size % step
+        for i in range(0, tail, step):
+            send_n(byref(buf, i))
+        for i in range(tail, size):
+            send(buf[i])
+        self.spi_bytes += size
+        self.spi_time += time.perf_counter() - start
 
     def DEV_SPI_write(self, data):
         self.DEV_SPI.DEV_SPI_SendData(data)
@@ -116,38 +476,47 @@ class RaspberryPi:
     def module_init(self, cleanup=False):
         self.GPIO_PWR_PIN.on()
         
-        if cleanup:
-            find_dirs = [
-                os.path.dirname(os.path.realpath(__file__)),
-                '/usr/local/lib',
-                '/usr/lib',
-            ]
-            self.DEV_SPI = None
-            for find_dir in find_dirs:
-                val = int(os.popen('getconf LONG_BIT').read())
-                logging.debug("System is %d bit"%val)
-                if val == 64:
-                    so_filename = os.path.join(find_dir, 'DEV_Config_64.so')
-                else:
-                    so_filename = os.path.join(find_dir, 'DEV_Config_32.so')
-                if os.path.exists(so_filename):
-                    self.DEV_SPI = CDLL(so_filename)
-                    break
+        if cleanup or self.transport == 'devconfig':
+            self.transport = 'devconfig'
             if self.DEV_SPI is None:
-                RuntimeError('Cannot find DEV_Config.so')
-
-            self.DEV_SPI.DEV_Module_Init()
+                find_dirs = [
+                    os.path.dirname(os.path.realpath(__file__)),
+                    '/usr/local/lib',
+                    '/usr/lib',
+                ]
+                val = long_bit()
+                logging.debug("System is %d bit"%val)
+                for find_dir in find_dirs:
+                    so_filename = os.path.join(find_dir, 'DEV_Config_%d.so' % val)
+                    if os.path.exists(so_filename):
+                        self.DEV_SPI = CDLL(so_filename)
+                        break
+                if self.DEV_SPI is None:
+                    raise RuntimeError('Cannot find DEV_Config.so')
+            # the library stays loaded, only the module is set up again
+            if not self.dev_open:
+                self.DEV_SPI.DEV_Module_Init()
+                self.dev_open = True
 
         else:
+            if self.SPI is None:
+                import spidev
+                self.SPI = spidev.SpiDev()
             # SPI device, bus = 0, device = 0
             self.SPI.open(0, 0)
-            self.SPI.max_speed_hz = 4000000
+            self.SPI.max_speed_hz = self.spi_speed
             self.SPI.mode = 0b00
+            self.spi_open = True
         return 0
 
     def module_exit(self, cleanup=False):
         logger.debug("spi end")
-        self.SPI.close()
+        if self.spi_open:
+            self.SPI.close()
+            self.spi_open = False
+        if self.dev_open:
+            self.DEV_SPI.DEV_Module_Exit()
+            self.dev_open = False
 
         self.GPIO_RST_PIN.off()
         self.GPIO_DC_PIN.off()
@@ -165,7 +534,7 @@ class RaspberryPi:
 
 
 
-class JetsonNano:
+class JetsonNano(_SPIStream):
     # Pin definition
     RST_PIN  = 17
     DC_PIN   = 25
@@ -173,26 +542,42 @@ class JetsonNano:
     BUSY_PIN = 24
     PWR_PIN  = 18
 
+    # SPI1 on the 40 pin header, present once spidev is enabled in the
+    # pinmux. Without it the frame is bit-banged by sysfs_software_spi.so.
+    SPI_DEVICE = '/dev/spidev0.0'
+
     def __init__(self):
-        import ctypes
-        find_dirs = [
-            os.path.dirname(os.path.realpath(__file__)),
-            '/usr/local/lib',
-            '/usr/lib',
-        ]
-        self.SPI = None
-        for find_dir in find_dirs:
-            so_filename = os.path.join(find_dir, 'sysfs_software_spi.so')
-            if os.path.exists(so_filename):
-                self.SPI = ctypes.cdll.LoadLibrary(so_filename)
-                break
-        if self.SPI is None:
-            raise RuntimeError('Cannot find sysfs_software_spi.so')
+        self._spi_reset()
+        self.hw_spi = os.path.exists(self.SPI_DEVICE)
+        if self.hw_spi:
+            import spidev
+            self.SPI = spidev.SpiDev()
+        else:
+            import ctypes
+            find_dirs = [
+                os.path.dirname(os.path.realpath(__file__)),
+                '/usr/local/lib',
+                '/usr/lib',
+            ]
+            self.SPI = None
+            for find_dir in find_dirs:
+                so_filename = os.path.join(find_dir, 'sysfs_software_spi.so')
+                if os.path.exists(so_filename):
+                    self.SPI = ctypes.cdll.LoadLibrary(so_filename)
+                    break
+            if self.SPI is None:
+                raise RuntimeError('Cannot find sysfs_software_spi.so')
+            # bulk entry point of newer builds, one FFI call per frame
+            # instead of one per byte
+            self.transfer_buffer = getattr(self.SPI, 'SYSFS_software_spi_transfer_buffer', None)
 
         import Jetson.GPIO
         self.GPIO = Jetson.GPIO
 
     def digital_write(self, pin, value):
+        if pin == self.CS_PIN and self.hw_spi:
+            # the kernel drives CS, the pin is not set up as a GPIO
+            return
         self.GPIO.output(pin, value)
 
     def digital_read(self, pin):
@@ -201,40 +586,87 @@ class JetsonNano:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def _wait_edge(self, level, seconds):
+        # wait_for_edge() can miss an edge that happens just before it is
+        # armed, so never block for more than 100 ms at a time
+        ms = 100 if seconds is None else max(1, min(100, int(seconds * 1000)))
+        edge = self.GPIO.FALLING if level else self.GPIO.RISING
+        self.GPIO.wait_for_edge(self.BUSY_PIN, edge, timeout=ms)
+
+    def wait_busy(self, level, timeout=BUSY_TIMEOUT, poll=None, poll_ms=100):
+        return _wait_busy(lambda: self.GPIO.input(self.BUSY_PIN),
+                          lambda seconds: self._wait_edge(level, seconds),
+                          level, timeout, poll, poll_ms)
+
     def spi_writebyte(self, data):
-        self.SPI.SYSFS_software_spi_transfer(data[0])
+        if self.hw_spi:
+            self.SPI.writebytes(data)
+        else:
+            self.SPI.SYSFS_software_spi_transfer(data[0])
 
     def spi_writebyte2(self, data):
-        for i in range(len(data)):
-            self.SPI.SYSFS_software_spi_transfer(data[i])
+        if self.hw_spi:
+            self._spi_stream(data)
+            return
+        view = _as_bytes(data)
+        size = len(view)
+        start = time.perf_counter()
+        if self.transfer_buffer is not None:
+            if view.readonly:
+                buf = (c_ubyte * size).from_buffer_copy(view)
+            else:
+                buf = (c_ubyte * size).from_buffer(view)
+            self.transfer_buffer(buf, size)
+        else:
+            transfer = self.SPI.SYSFS_software_spi_transfer
+            for byte in view:
+                transfer(byte)
+        self.spi_bytes += size
+        self.spi_time += time.perf_counter() - start
 
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.DC_PIN, self.GPIO.OUT)
-        self.GPIO.setup(self.CS_PIN, self.GPIO.OUT)
+        if not self.hw_spi:
+            # with spidev the kernel drives CS
+            self.GPIO.setup(self.CS_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.PWR_PIN, self.GPIO.OUT)
         self.GPIO.setup(self.BUSY_PIN, self.GPIO.IN)
         
         self.GPIO.output(self.PWR_PIN, 1)
         
-        self.SPI.SYSFS_software_spi_begin()
+        if self.hw_spi:
+            # SPI device, bus = 0, device = 0
+            self.SPI.open(0, 0)
+            self.SPI.max_speed_hz = self.spi_speed
+            self.SPI.mode = 0b00
+            self.spi_open = True
+        else:
+            self.SPI.SYSFS_software_spi_begin()
         return 0
 
     def module_exit(self):
         logger.debug("spi end")
-        self.SPI.SYSFS_software_spi_end()
+        if self.hw_spi:
+            self.SPI.close()
+            self.spi_open = False
+        else:
+            self.SPI.SYSFS_software_spi_end()
 
         logger.debug("close 5V, Module enters 0 power consumption ...")
         self.GPIO.output(self.RST_PIN, 0)
         self.GPIO.output(self.DC_PIN, 0)
         self.GPIO.output(self.PWR_PIN, 0)
 
-        self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN, self.PWR_PIN])
+        pins = [self.RST_PIN, self.DC_PIN, self.BUSY_PIN, self.PWR_PIN]
+        if not self.hw_spi:
+            pins.append(self.CS_PIN)
+        self.GPIO.cleanup(pins)
 
 
-class SunriseX3:
+class SunriseX3(_SPIStream):
     # Pin definition
     RST_PIN  = 17
     DC_PIN   = 25
@@ -249,6 +681,7 @@ class SunriseX3:
 
         self.GPIO = Hobot.GPIO
         self.SPI = spidev.SpiDev()
+        self._spi_reset()
 
     def digital_write(self, pin, value):
         self.GPIO.output(pin, value)
@@ -259,14 +692,20 @@ class SunriseX3:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def _wait_edge(self, level, seconds):
+        # same as JetsonNano, Hobot.GPIO follows the Jetson.GPIO API
+        ms = 100 if seconds is None else max(1, min(100, int(seconds * 1000)))
+        edge = self.GPIO.FALLING if level else self.GPIO.RISING
+        self.GPIO.wait_for_edge(self.BUSY_PIN, edge, timeout=ms)
+
+    def wait_busy(self, level, timeout=BUSY_TIMEOUT, poll=None, poll_ms=100):
+        return _wait_busy(lambda: self.GPIO.input(self.BUSY_PIN),
+                          lambda seconds: self._wait_edge(level, seconds),
+                          level, timeout, poll, poll_ms)
+
     def spi_writebyte(self, data):
         self.SPI.writebytes(data)
 
-    def spi_writebyte2(self, data):
-        # for i in range(len(data)):
-        #     self.SPI.writebytes([data[i]])
-        self.SPI.xfer3(data)
-
     def module_init(self):
         if self.Flag == 0:
             self.Flag = 1
@@ -282,8 +721,9 @@ class SunriseX3:
         
             # SPI device, bus = 0, device = 0
             self.SPI.open(2, 0)
-            self.SPI.max_speed_hz = 4000000
+            self.SPI.max_speed_hz = self.spi_speed
             self.SPI.mode = 0b00
+            self.spi_open = True
             return 0
         else:
             return 0
@@ -291,6 +731,7 @@ class SunriseX3:
     def module_exit(self):
         logger.debug("spi end")
         self.SPI.close()
+        self.spi_open = False
 
         logger.debug("close 5V, Module enters 0 power consumption ...")
         self.Flag = 0
@@ -301,22 +742,356 @@ class SunriseX3:
         self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN], self.PWR_PIN)
 
 
-if sys.version_info[0] == 2:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE)
-else:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE, text=True)
-output, _ = process.communicate()
-if sys.version_info[0] == 2:
-    output = output.decode(sys.stdout.encoding)
+class Virtual(_Sequence):
+    # Stand-in for a panel on a machine without one, chosen with
+    # EPD_BACKEND=virtual. It keeps every byte sent, models how long BUSY
+    # would stay asserted, and can save what the panel would show as PNG.
+    #   EPD_VIRTUAL_PNG      : file to write on every refresh, may hold %d
+    #   EPD_VIRTUAL_SIZE     : panel size as WIDTHxHEIGHT, guessed otherwise
+    #   EPD_VIRTUAL_REALTIME : 1 to really sleep in delay_ms() and wait_busy()
+
+    # Pin definition
+    RST_PIN  = 17
+    DC_PIN   = 25
+    CS_PIN   = 8
+    BUSY_PIN = 24
+    PWR_PIN  = 18
+
+    # Modeled BUSY time of each controller operation, in ms
+    BUSY_MS = {
+        'full'    : 2000,
+        'fast'    : 1500,
+        'partial' : 300,
+        'power'   : 50,
+        'setup'   : 10,
+    }
+
+    def __init__(self):
+        self.realtime = os.environ.get('EPD_VIRTUAL_REALTIME') == '1'
+        self.png = os.environ.get('EPD_VIRTUAL_PNG')
+        size = os.environ.get('EPD_VIRTUAL_SIZE')
+        self.size = tuple(int(v) for v in size.lower().split('x')) if size else None
+        self.pins = dict.fromkeys([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN, self.PWR_PIN], 0)
+        self.frames = 0
+        self.ram = {}           # kept over resets, like the real RAM
+        self.ssd = False        # SSD16xx command set seen
+        self.reset_log()
+        self._controller_reset()
+
+    def reset_log(self):
+        # (dc, bytes) per SPI transfer, dc 0 for commands, 1 for data
+        self.log = []
+        self.busy_total = 0.0
+        self.delay_total = 0.0
+        self.refreshes = {mode: [0, 0.0] for mode in ('full', 'fast', 'partial')}
+        self.spi_bytes = 0
+        self.spi_time = 0.0
+
+    def _controller_reset(self):
+        self.cmd = None
+        self.params = bytearray()
+        self.written = 0
+        self.option = 0         # last 0x22 parameter
+        self.fast = False
+        self.partial = False
+        self.frame_written = False
+        self.busy_pending = 0.0
+        self.window = None
+        self.cursor = None
+
+    def digital_write(self, pin, value):
+        if pin == self.RST_PIN and self.pins[pin] and not value:
+            self._controller_reset()
+        self.pins[pin] = value
+
+    def digital_read(self, pin):
+        return self.pins.get(pin, 0)
+
+    def delay_ms(self, delaytime):
+        self.delay_total += delaytime
+        if self.realtime:
+            time.sleep(delaytime / 1000.0)
+
+    def wait_busy(self, level, timeout=BUSY_TIMEOUT, poll=None, poll_ms=100):
+        busy_ms = self.busy_pending
+        if timeout is not None:
+            busy_ms = min(busy_ms, timeout)
+        self.busy_pending = 0.0
+        self.busy_total += busy_ms
+        if self.realtime:
+            time.sleep(busy_ms / 1000.0)
+        return busy_ms
+
+    def spi_writebyte(self, data):
+        self._transfer(data)
+
+    def spi_writebyte2(self, data):
+        self._transfer(data)
+
+    def DEV_SPI_write(self, data):
+        self._transfer([data])
+
+    def DEV_SPI_nwrite(self, data):
+        self._transfer(data)
+
+    def DEV_SPI_read(self):
+        return 0
+
+    def spi_set_speed(self, hz):
+        pass
+
+    def spi_stats(self, reset=False):
+        rate = self.spi_bytes / self.spi_time if self.spi_time else 0.0
+        stats = (self.spi_bytes, self.spi_time, rate)
+        if reset:
+            self.spi_bytes = 0
+            self.spi_time = 0.0
+        return stats
+
+    def module_init(self, cleanup=False):
+        self.pins[self.PWR_PIN] = 1
+        return 0
+
+    def module_exit(self, cleanup=False):
+        logger.debug("virtual panel: %d transfers, %.0f ms busy, %d frames",
+                     len(self.log), self.busy_total, self.frames)
+        self.pins[self.RST_PIN] = self.pins[self.DC_PIN] = self.pins[self.PWR_PIN] = 0
+
+    def _transfer(self, data):
+        start = time.perf_counter()
+        data = bytes(_as_bytes(data))
+        dc = self.pins[self.DC_PIN]
+        self.log.append((dc, data))
+        if dc:
+            self._data(data)
+        else:
+            for command in data:
+                self._command(command)
+        self.spi_bytes += len(data)
+        self.spi_time += time.perf_counter() - start
+
+    # Controller model. It follows the two command sets the drivers use:
+    # SSD16xx (RAM 0x24/0x26, window 0x44/0x45, update 0x22 + 0x20) and
+    # UC81xx (RAM 0x10/0x13, resolution 0x61, window 0x90, refresh 0x12).
+
+    def _command(self, command):
+        self._finish()
+        self.cmd = command
+        self.params = bytearray()
+        self.written = 0
+        if command in (0x44, 0x4E):
+            self.ssd = True
+        if command in self._ram_commands():
+            self.pos = self._home()
+        elif command == 0x20 and self.ssd:
+            if not self.option & 0x04:
+                self._busy('setup')
+            elif self.option & 0x08:
+                self._refresh('partial')
+            else:
+                self._refresh('fast' if self.fast else 'full')
+        elif command == 0x12:
+            if self.frame_written:
+                self._refresh('partial' if self.partial else 'full')
+            else:
+                self._busy('setup')
+        elif command in (0x04, 0x02) and not self.ssd:
+            self._busy('power')
+        elif command == 0x91:
+            self.partial = True
+        elif command == 0x92:
+            self.partial = False
+            self.window = None
+
+    def _ram_commands(self):
+        # on UC81xx 0x24 and 0x26 are LUT registers, not RAM
+        return (0x24, 0x26) if self.ssd else (0x10, 0x13)
+
+    def _data(self, data):
+        if self.cmd in self._ram_commands():
+            self._ram_write(data)
+        elif len(self.params) < 16:
+            self.params += data[:16]
+
+    def _finish(self):
+        # act on the parameters of the command that just ended
+        p = self.params
+        if self.cmd == 0x22 and p:
+            self.option = p[0]
+        elif self.cmd == 0x1A:
+            self.fast = True
+        elif self.cmd == 0x44 and len(p) >= 2:
+            if len(p) >= 4:
+                x = ((p[0] | p[1] << 8) // 8, (p[2] | p[3] << 8) // 8)
+            else:
+                x = (p[0], p[1])
+            self.window = (x, self.window[1] if self.window else (0, 0))
+            self._learn(max(x) + 1, None)
+        elif self.cmd == 0x45 and len(p) >= 4:
+            y = (p[0] | p[1] << 8, p[2] | p[3] << 8)
+            self.window = (self.window[0] if self.window else (0, 0), y)
+            self._learn(None, max(y) + 1)
+        elif self.cmd == 0x4E and p:
+            x = (p[0] | p[1] << 8) // 8 if len(p) >= 2 else p[0]
+            self.cursor = (x, self.cursor[1] if self.cursor else 0)
+        elif self.cmd == 0x4F and len(p) >= 2:
+            self.cursor = (self.cursor[0] if self.cursor else 0, p[0] | p[1] << 8)
+        elif self.cmd == 0x61 and len(p) >= 3:
+            if len(p) >= 4:
+                self._learn((p[0] << 8 | p[1]) // 8, p[2] << 8 | p[3])
+            else:
+                self._learn(p[0] // 8, p[1] << 8 | p[2])
+        elif self.cmd == 0x90 and len(p) >= 8:
+            self.window = (((p[0] << 8 | p[1]) // 8, (p[2] << 8 | p[3]) // 8),
+                           (p[4] << 8 | p[5], p[6] << 8 | p[7]))
+        elif self.cmd in (0x10, 0x13) and not self.ssd and self.written > 1:
+            self.frame_written = True
+        self.cmd = None
+
+    def _learn(self, linewidth, height):
+        if self.size:
+            return
+        lw, h = getattr(self, 'geometry', (0, 0))
+        self.geometry = (max(lw, linewidth or 0), max(h, height or 0))
+
+    def _linewidth(self):
+        if self.size:
+            return (self.size[0] + 7) // 8, self.size[1]
+        return getattr(self, 'geometry', (0, 0))
+
+    def _home(self):
+        if self.cursor is not None and self.ssd:
+            return self.cursor
+        if self.window is None:
+            return (0, 0)
+        return (self.window[0][0], self.window[1][0])
+
+    def _ram_write(self, data):
+        self.written += len(data)
+        lw, height = self._linewidth()
+        if not lw or not height:
+            # size still unknown, keep the stream as it comes
+            if self.written == len(data):
+                self.ram[self.cmd] = bytearray()
+            self.ram[self.cmd] += data
+            return
+        ram = self.ram.get(self.cmd)
+        if not isinstance(ram, bytearray) or len(ram) != lw * height:
+            ram = self.ram[self.cmd] = bytearray(b'\xff' * (lw * height))
+        if self.window is None:
+            (xs, xe), (ys, ye) = (0, lw - 1), (0, height - 1)
+        else:
+            (xs, xe), (ys, ye) = self.window
+        x, y = self.pos
+        xstep = 1 if xe >= xs else -1
+        ystep = 1 if ye >= ys else -1
+        i = 0
+        while i < len(data) and 0 <= y < height:
+            n = min(len(data) - i, abs(xe - x) + 1)
+            row = y * lw
+            if xstep > 0:
+                ram[row + x:row + x + n] = data[i:i + n]
+            else:
+                ram[row + x - n + 1:row + x + 1] = data[i:i + n][::-1]
+            i += n
+            x += n * xstep
+            if x == xe + xstep:
+                x = xs
+                y += ystep
+        self.pos = (x, y)
+
+    def _busy(self, mode):
+        self.busy_pending += self.BUSY_MS[mode]
+
+    def _refresh(self, mode):
+        self._busy(mode)
+        self.refreshes[mode][0] += 1
+        self.refreshes[mode][1] += self.BUSY_MS[mode]
+        self.frame_written = False
+        self.frames += 1
+        if self.png:
+            self.save_png(self.png % self.frames if '%d' in self.png else self.png)
+
+    def save_png(self, path):
+        '''
+        function : Write the new-data RAM of a 1 bit panel as an image, 1 = white
+        parameter:
+            path : PNG file name
+        '''
+        from PIL import Image
+        ram = self.ram.get(0x24 if self.ssd else 0x13)
+        lw, height = self._linewidth()
+        if ram is None or not lw or len(ram) < lw * height:
+            logger.warning("virtual panel: nothing to save yet")
+            return
+        width = self.size[0] if self.size else lw * 8
+        image = Image.frombytes('1', (lw * 8, height), bytes(ram[:lw * height]))
+        image.crop((0, 0, width, height)).save(path)
+
+
+def long_bit():
+    # Word size of this Python, which is what decides the DEV_Config_*.so
+    # that can be loaded. Replaces a `getconf LONG_BIT` fork per lookup.
+    return struct.calcsize('P') * 8
+
+
+_board = None
+
+
+def _read(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read().decode('ascii', 'replace')
+    except OSError:
+        return ''
+
+
+def detect():
+    '''
+    function : Find out which board this runs on, read once and cached.
+               Only files are read, nothing is spawned.
+    return   : 'virtual', 'raspberrypi', 'sunrise' or 'jetson'
+    '''
+    global _board
+    if _board is None:
+        if os.environ.get('EPD_BACKEND', '').lower() == 'virtual':
+            _board = 'virtual'
+        elif ('Raspberry' in _read('/proc/device-tree/model')
+              or 'Raspberry' in _read('/proc/cpuinfo')):
+            _board = 'raspberrypi'
+        elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
+            _board = 'sunrise'
+        else:
+            _board = 'jetson'
+    return _board
+
+
+BACKENDS = {
+    'virtual'     : Virtual,
+    'raspberrypi' : RaspberryPi,
+    'sunrise'     : SunriseX3,
+    'jetson'      : JetsonNano,
+}
+
+
+def _init_backend():
+    # Build the backend of this board and publish its methods as module
+    # functions, so later lookups no longer go through __getattr__
+    global implementation
+    implementation = BACKENDS[detect()]()
+    for func in [x for x in dir(implementation) if not x.startswith('_')]:
+        setattr(sys.modules[__name__], func, getattr(implementation, func))
 
-if "Raspberry" in output:
-    implementation = RaspberryPi()
-elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
-    implementation = SunriseX3()
-else:
-    implementation = JetsonNano()
 
-for func in [x for x in dir(implementation) if not x.startswith('_')]:
-    setattr(sys.modules[__name__], func, getattr(implementation, func))
+def __getattr__(name):
+    # Importing epdconfig touches no hardware, the backend is only created
+    # when a driver first calls into it
+    if name.startswith('_') or 'implementation' in globals():
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    _init_backend()
+    try:
+        return globals()[name]
+    except KeyError:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name)) from None
 
 ### END OF FILE ###
@@ -4,19 +4,20 @@
 import os
 import sys
 import time
+import asyncio
 import logging
 import subprocess
 import glob
 import csv
-import threading
 import re
 import signal
+from concurrent.futures import ThreadPoolExecutor
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import ImageFont
 from gpiozero import Button
 
 # Your pentest actions
-from scripts.pentests import scan_wifi, deauth, probe_request_flood, beacon_flood
+from scripts.pentests import scan_wifi_async, probe_request_flood_async
 
 BASE_DIR = os.path.dirname(os.path.realpath(__file__))
 FONT_PATH = os.path.join(BASE_DIR, "fonts", "Font.ttc")
@@ -26,12 +27,30 @@ DATA_SCANS = os.path.join(BASE_DIR, "data", "scans")
 if os.path.exists(LIB_DIR):
     sys.path.append(LIB_DIR)
 
-from lib.waveshare_epd import epd2in13_V4
+from lib import waveshare_epd, ui
+from lib.waveshare_epd import epdbuffer
 from scapy.all import Dot11, Dot11Beacon, Dot11Elt, RadioTap, sendp
 import random
 
 logging.basicConfig(level=logging.INFO, filename='/var/log/epaper.log')
 
+# Panel driver module, see lib/waveshare_epd/__init__.py for the list
+EPD_PANEL = os.environ.get("EPD_PANEL", waveshare_epd.DEFAULT_PANEL)
+
+# Refresh policy per driver module, see RefreshPolicy.
+#   max_partials : partial refreshes before a full one clears the ghosting
+#   max_age      : seconds before a full refresh is forced anyway
+#   fast_area    : share of the panel changed above which fast refresh is
+#                  used instead of partial
+REFRESH_POLICY = {
+    "epd2in13_V4": {"max_partials": 30, "max_age": 600, "fast_area": 0.4},
+}
+DEFAULT_REFRESH_POLICY = {"max_partials": 10, "max_age": 300, "fast_area": 0.4}
+
+# Seconds without a frame before the panel goes to deep sleep, 0 keeps it
+# awake. See IdleManager.
+IDLE_TIMEOUT = float(os.environ.get("EPD_IDLE_TIMEOUT", 60))
+
 # GPIO BCM
 BTN_SELECT_PIN = 5
 BTN_UP_PIN     = 6
@@ -47,12 +66,30 @@ menu_items = [
 
 current_index = 0
 epd = None
+panel = None
+refresh_policy = None
+idle = None
+# Last frame buffer sent to the panel RAM, None when unknown
+last_frame = None
+# Event loop, see run()
+loop = None
+# Frames and jobs for the display task, see display_task()
+display_queue = None
+# The one thread that talks to the panel
+display_executor = None
+# Running handler tasks, see spawn()
+tasks = set()
 font_menu = None
 font_small = None
+# Frame every screen is drawn into and its packer, see lib/ui.py
+canvas = None
+packer = None
 
 btn_up = None
 btn_down = None
 btn_select = None
+# Current handler of each button, swapped by the views, see set_keys()
+keys = {"up": None, "down": None, "select": None}
 
 
 def load_airodump_aps(csv_path):
@@ -96,38 +133,333 @@ def load_airodump_aps(csv_path):
     return aps
 
 
-# Display update helpers
+# Display service
+#
+# One task on the event loop owns the panel. Screens only queue frames and
+# return at once. The blocking SPI and BUSY work runs on a single worker
+# thread and the task awaits it, so frames queued during a refresh are
+# coalesced and only the newest one gets drawn. When nothing comes for
+# IDLE_TIMEOUT seconds the task puts the panel to sleep, see IdleManager.
 
 def display_full(image):
-    epd.display(epd.getbuffer(image))
+    display_queue.put_nowait(("frame", image, True))
 
 
 def display_partial(image):
-    epd.displayPartial(epd.getbuffer(image))
+    display_queue.put_nowait(("frame", image, False))
 
 
-def draw_menu_image(index):
-    image = Image.new('1', (epd.height, epd.width), 255)
-    draw = ImageDraw.Draw(image)
+async def run_on_display(fn, *args):
+    """Run fn on the display thread after the frames queued so far and
+    wait for it to finish.
+    """
+    done = loop.create_future()
+    display_queue.put_nowait(("call", (fn, args), done))
+    await done
+
+
+def on_display(fn, *args):
+    return loop.run_in_executor(display_executor, fn, *args)
+
+
+async def display_task():
+    while True:
+        try:
+            batch = [await asyncio.wait_for(display_queue.get(), idle.remaining())]
+        except asyncio.TimeoutError:
+            try:
+                await on_display(idle.sleep)
+            except Exception:
+                logging.exception("Display sleep failed")
+            finally:
+                # a failed sleep is tried again after a full timeout
+                idle.touch()
+            continue
+        while not display_queue.empty():
+            batch.append(display_queue.get_nowait())
+
+        frame = None
+        for kind, arg, extra in batch:
+            if kind == "frame":
+                # a skipped full refresh still makes the next frame full
+                frame = (arg, extra or (frame is not None and frame[1]))
+                continue
+            if frame is not None:
+                await on_display(show_frame, *frame)
+                frame = None
+            fn, args = arg
+            try:
+                await on_display(fn, *args)
+            except Exception:
+                logging.exception("Display job failed")
+            finally:
+                if not extra.done():
+                    extra.set_result(None)
+        if frame is not None:
+            await on_display(show_frame, *frame)
+
+
+# Events
+#
+# Everything the UI reacts to arrives on the event loop: button edges are
+# handed over from the gpiozero thread, subprocess output is read with
+# async for, waits are asyncio.sleep(). Between events nothing runs.
+
+def set_keys(up=None, down=None, select=None):
+    """Install the button handlers of a view and return the previous ones
+    for keys.update(). A handler may be a coroutine function.
+    """
+    old = dict(keys)
+    keys.update(up=up, down=down, select=select)
+    return old
+
+
+def dispatch(key):
+    handler = keys.get(key)
+    if handler is None:
+        return
+    result = handler()
+    if asyncio.iscoroutine(result):
+        spawn(result)
+
+
+def spawn(coro):
+    # the loop only keeps weak references to tasks
+    task = loop.create_task(coro)
+    tasks.add(task)
+    task.add_done_callback(task_done)
+    return task
+
+
+def task_done(task):
+    tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error("Handler failed", exc_info=task.exception())
+
+
+async def stop_process(proc, group=False):
+    """Terminate proc, kill it when it does not exit within 2 s. With
+    `group` the whole process group is signalled (sudo + the tool).
+    """
+    def kill(sig):
+        try:
+            if group:
+                os.killpg(proc.pid, sig)
+            else:
+                proc.send_signal(sig)
+        except (ProcessLookupError, PermissionError):
+            pass
 
-    draw.text((10, 5), "Menu", font=font_menu, fill=0)
+    kill(signal.SIGTERM)
+    try:
+        await asyncio.wait_for(proc.wait(), 2)
+    except asyncio.TimeoutError:
+        kill(signal.SIGKILL)
+        await proc.wait()
+
+
+def show_frame(image, full):
+    """Refresh the panel with only what changed since the last frame.
+    Nothing is sent when the frame is identical. `full` marks a screen
+    switch, the policy then prefers a fast refresh over a partial one.
+    `image` is a PIL image or a buffer already packed by ui.Screen.
+    """
+    global last_frame
+    try:
+        buf = image if isinstance(image, (bytes, bytearray)) else epd.getbuffer(image)
+        rects = epdbuffer.dirty_rects(last_frame, buf, panel.width, panel.height)
+        if not rects:
+            if not full:
+                return
+            # a screen switch still gets its refresh
+            rects = [(0, 0, panel.width, panel.height)]
+        idle.wake(last_frame)
+        refresh_policy.refresh(buf, rects, full)
+        last_frame = buf
+    except Exception:
+        logging.exception("Display refresh failed")
+    finally:
+        idle.touch()
+
+
+class RefreshPolicy:
+    """Choose partial, fast or full refresh for each frame.
+
+    Small changes get a partial refresh of their window. Big changes get a
+    fast refresh when the driver has one. A full refresh is done after
+    max_partials partial refreshes or max_age seconds, and it also loads
+    the base image partial refresh diffs against. Partial refresh needs
+    display_region() and the part base image methods, fast refresh also
+    init_fast() and display_fast(), and the Panel has to list the mode as
+    well; other panels only get full refreshes through display(). Time
+    spent in each mode is kept in `stats` as [count, seconds].
+    """
+
+    def __init__(self, epd, panel, max_partials=10, max_age=300, fast_area=0.4):
+        self.epd = epd
+        self.panel = panel
+        self.max_partials = max_partials
+        self.max_age = max_age
+        self.fast_area = fast_area
+        self.can_partial = panel.partial and all(hasattr(epd, name) for name in
+                               ("display_region", "displayPartBaseImage", "loadPartBaseImage"))
+        self.can_fast = (self.can_partial and panel.fast
+                         and hasattr(epd, "init_fast") and hasattr(epd, "display_fast"))
+        self.partials = 0
+        self.last_full = None
+        self.mode = None
+        self.stats = {"partial": [0, 0.0], "fast": [0, 0.0], "full": [0, 0.0]}
+
+    @classmethod
+    def for_driver(cls, epd, panel):
+        return cls(epd, panel, **REFRESH_POLICY.get(panel.name, DEFAULT_REFRESH_POLICY))
+
+    def choose(self, rects, big):
+        if (not self.can_partial or self.last_full is None or self.partials >= self.max_partials
+                or time.monotonic() - self.last_full >= self.max_age):
+            return "full"
+        area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rects)
+        if self.can_fast and (big or area >= self.fast_area * self.epd.width * self.epd.height):
+            return "fast"
+        return "partial"
+
+    def refresh(self, buf, rects, big=False):
+        mode = self.choose(rects, big)
+        start = time.monotonic()
+        getattr(self, "refresh_" + mode)(buf, rects)
+        spent = time.monotonic() - start
+        self.stats[mode][0] += 1
+        self.stats[mode][1] += spent
+        self.mode = mode
+        logging.debug("%s refresh in %.2f s", mode, spent)
+
+    def refresh_partial(self, buf, rects):
+        # one refresh covers the whole panel, so send a single window
+        self.epd.display_region(buf, *epdbuffer.bounds(rects))
+        self.partials += 1
+
+    def refresh_fast(self, buf, rects):
+        self.epd.init_fast()
+        self.epd.display_fast(buf)
+        # back to the normal waveforms, with the new frame as partial base
+        self.epd.init()
+        self.epd.loadPartBaseImage(buf)
+
+    def refresh_full(self, buf, rects):
+        if self.mode is not None:
+            self.epd.init()
+        if self.can_partial:
+            self.epd.displayPartBaseImage(buf)
+        else:
+            self.display(buf)
+        self.partials = 0
+        self.last_full = time.monotonic()
+
+    def display(self, buf):
+        if self.panel.colors == 3:
+            # the UI only draws black, the red / yellow layer stays white
+            self.epd.display(buf, epdbuffer.fill(0xFF, len(buf)))
+        else:
+            self.epd.display(buf)
+
+    def reset(self):
+        # the panel was just initialised: the next refresh is a full one
+        # and needs no init() of its own
+        self.mode = None
+        self.last_full = None
+
+    def report(self):
+        for mode, (count, spent) in self.stats.items():
+            logging.info("%s refresh: %d in %.1f s", mode, count, spent)
+
+
+class IdleManager:
+    """Put the panel into deep sleep after `timeout` seconds without a
+    frame and wake it up before the next one.
+
+    Everything runs on the display thread, so callers never wait for it.
+    Only drivers with deep_sleep() / wake() are put to sleep: they stay
+    powered and come back with a reset pulse, their registers and the
+    partial base image instead of a full init(). Wake latency is kept in
+    `stats` as [count, seconds, worst seconds].
+    """
+
+    def __init__(self, epd, policy, timeout=IDLE_TIMEOUT):
+        self.epd = epd
+        self.policy = policy
+        self.can_sleep = hasattr(epd, "deep_sleep") and hasattr(epd, "wake")
+        self.timeout = timeout if self.can_sleep else 0
+        # awake, asleep (deep_sleep(), module powered) or off (sleep())
+        self.state = "awake"
+        self.last_active = time.monotonic()
+        self.stats = [0, 0.0, 0.0]
+
+    def remaining(self):
+        """Seconds until sleep(), None when there is nothing to wait for."""
+        if self.state != "awake" or not self.timeout:
+            return None
+        return max(0.0, self.last_active + self.timeout - time.monotonic())
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def sleep(self):
+        self.epd.deep_sleep()
+        self.state = "asleep"
+        logging.debug("panel asleep after %.0f s idle", self.timeout)
+
+    def power_off(self):
+        # epd.sleep() was called, only init() brings the module back
+        self.state = "off"
+
+    def wake(self, base):
+        """Get the panel ready for a refresh. `base` is the frame in its
+        RAM, reloaded as partial base; None forces a full refresh.
+        """
+        if self.state == "awake":
+            return
+        start = time.monotonic()
+        if self.state == "asleep" and base is not None:
+            self.epd.wake(base)
+        else:
+            self.epd.init()
+            self.policy.reset()
+        spent = time.monotonic() - start
+        self.state = "awake"
+        self.stats[0] += 1
+        self.stats[1] += spent
+        self.stats[2] = max(self.stats[2], spent)
+        logging.debug("panel awake in %.1f ms", spent * 1000)
+
+    def report(self):
+        count, spent, worst = self.stats
+        if count:
+            logging.info("wake: %d in %.1f s, %.1f ms average, %.1f ms worst",
+                         count, spent, spent * 1000 / count, worst * 1000)
+
+
+def draw_menu_image(index):
+    with canvas:
+        canvas.clear()
 
-    y = 35
-    for i, item in enumerate(menu_items):
-        prefix = "> " if i == index else "  "
-        draw.text((10, y), prefix + item, font=font_small, fill=0)
-        y += 18
+        canvas.text((10, 5), "Menu", font_menu)
 
-    return image
+        y = 35
+        for i, item in enumerate(menu_items):
+            prefix = "> " if i == index else "  "
+            canvas.text((10, y), prefix + item, font_small)
+            y += 18
+        return canvas.frame()
 
 
 def draw_text_screen(lines, full=True):
-    image = Image.new('1', (epd.height, epd.width), 255)
-    draw = ImageDraw.Draw(image)
-    y = 5
-    for line in lines:
-        draw.text((10, y), line, font=font_small, fill=0)
-        y += 14
+    with canvas:
+        canvas.clear()
+        y = 5
+        for line in lines:
+            canvas.text((10, y), line, font_small)
+            y += 14
+        image = canvas.frame()
 
     if full:
         display_full(image)
@@ -135,17 +467,25 @@ def draw_text_screen(lines, full=True):
         display_partial(image)
 
 
-def clear_screen():
+async def clear_screen():
+    await run_on_display(show_clear)
+
+
+def show_clear():
+    global last_frame
     epd.init()
-    epd.Clear(0xFF)
+    epd.Clear()  # the drivers clear to white by default
     epd.sleep()
+    idle.power_off()
+    last_frame = None
 
 
-def power_off():
+async def power_off():
     draw_text_screen(["Power off..."], full=True)
-    time.sleep(1)
-    clear_screen()
-    subprocess.run(['sudo', 'poweroff'])
+    await asyncio.sleep(1)
+    await clear_screen()
+    proc = await asyncio.create_subprocess_exec('sudo', 'poweroff')
+    await proc.wait()
 
 
 def render_menu(full=False):
@@ -156,17 +496,62 @@ def render_menu(full=False):
         display_partial(image)
 
 
-def scan_wifi_view():
+def show_screen(screen, full=False):
+    """Redraw what changed on `screen` and queue the frame. Nothing is
+    queued when no widget changed.
+    """
+    image, boxes = screen.render(full)
+    if full:
+        display_full(image)
+    elif boxes:
+        display_partial(image)
+
+
+def screen_layout(top=25):
+    """Header, body and footer boxes of a list screen on this panel."""
+    width, height = panel.size
+    return (0, 0, width, top), (0, top, width, height - 16), (0, height - 16, width, height)
+
+
+def list_screen(title, items, footer, fmt=str):
+    header_box, body_box, footer_box = screen_layout()
+    items = ui.ListView(body_box, font_small, items, fmt=fmt)
+    static = [ui.Label(header_box, font_small, title, offset=(10, 5))]
+    if footer:
+        static.append(ui.Label(footer_box, font_small, footer))
+    return ui.Screen(canvas, items, static=static, packer=packer), items
+
+
+def log_screen(title, lines, footer):
+    header_box, body_box, footer_box = screen_layout(top=20)
+    static = [ui.Label(header_box, font_small, title, offset=(10, 5)),
+              ui.Label(footer_box, font_small, footer)]
+    return ui.Screen(canvas, ui.LogView(body_box, font_small, lines, max_lines=6),
+                     static=static, packer=packer)
+
+
+def format_ap(ap):
+    essid = (ap["essid"] or "<hidden>")[:14]
+    ch = ap["channel"] or "?"
+    priv = (ap["privacy"] or "?")[:6]
+    return f"{essid} ch{ch} {priv}"
+
+
+async def scan_wifi_view():
     draw_text_screen(["Scanning WiFi...", "wait 30s"], full=True)
 
     # Note: scan_wifi must write to data/scans/*.csv
-    scan_wifi("wlan0mon")
+    old_keys = set_keys()  # buttons do nothing while scanning
+    try:
+        await scan_wifi_async("wlan0mon")
+    finally:
+        keys.update(old_keys)
 
     os.makedirs(DATA_SCANS, exist_ok=True)
     csv_files = glob.glob(os.path.join(DATA_SCANS, "*.csv"))
     if not csv_files:
         draw_text_screen(["No CSV in", "data/scans"], full=True)
-        time.sleep(2)
+        await asyncio.sleep(2)
         render_menu(full=True)
         return
 
@@ -174,73 +559,38 @@ def scan_wifi_view():
     aps = load_airodump_aps(latest_csv)
     if not aps:
         draw_text_screen(["No AP in CSV"], full=True)
-        time.sleep(2)
+        await asyncio.sleep(2)
         render_menu(full=True)
         return
 
-    old_up, old_down, old_select = btn_up.when_pressed, btn_down.when_pressed, btn_select.when_pressed
-
-    state = {"cursor": 0, "start": 0}
-    PER_PAGE = 5
+    old_keys = dict(keys)
 
-    def draw(full=False):
-        image = Image.new('1', (epd.height, epd.width), 255)
-        draw = ImageDraw.Draw(image)
-        draw.text((10, 5), "AP list", font=font_small, fill=0)
-
-        start = state["start"]
-        end = min(start + PER_PAGE, len(aps))
-        y = 25
-
-        for idx in range(start, end):
-            ap = aps[idx]
-            prefix = "> " if idx == state["cursor"] else "  "
-            essid = (ap["essid"] or "<hidden>")[:14]
-            ch = ap["channel"] or "?"
-            priv = (ap["privacy"] or "?")[:6]
-            line = f"{essid} ch{ch} {priv}"
-            draw.text((10, y), prefix + line, font=font_small, fill=0)
-            y += 18
-
-        draw.text((10, epd.width - 16), "SELECT: back", font=font_small, fill=0)
-
-        if full:
-            display_full(image)
-        else:
-            display_partial(image)
+    screen, ap_list = list_screen("AP list", aps, "SELECT: back", fmt=format_ap)
 
     def up():
-        if state["cursor"] > 0:
-            state["cursor"] -= 1
-        if state["cursor"] < state["start"]:
-            state["start"] = state["cursor"]
-        draw(full=False)
+        ap_list.move(-1)
+        show_screen(screen)
 
     def down():
-        if state["cursor"] < len(aps) - 1:
-            state["cursor"] += 1
-        if state["cursor"] >= state["start"] + PER_PAGE:
-            state["start"] = state["cursor"] - PER_PAGE + 1
-        draw(full=False)
+        ap_list.move(1)
+        show_screen(screen)
 
     def back_to_menu():
-        btn_up.when_pressed, btn_down.when_pressed, btn_select.when_pressed = old_up, old_down, old_select
+        keys.update(old_keys)
         render_menu(full=True)
 
-    btn_up.when_pressed = up
-    btn_down.when_pressed = down
-    btn_select.when_pressed = back_to_menu
+    set_keys(up=up, down=down, select=back_to_menu)
 
     # full refresh on entering new screen
-    draw(full=True)
+    show_screen(screen, full=True)
 
 
-def deauth_view():
+async def deauth_view():
     os.makedirs(DATA_SCANS, exist_ok=True)
     csv_files = glob.glob(os.path.join(DATA_SCANS, "*.csv"))
     if not csv_files:
         draw_text_screen(["No scans in", "data/scans"], full=True)
-        time.sleep(2)
+        await asyncio.sleep(2)
         render_menu(full=True)
         return
 
@@ -248,174 +598,113 @@ def deauth_view():
     aps = load_airodump_aps(latest_csv)
     if not aps:
         draw_text_screen(["No AP in CSV"], full=True)
-        time.sleep(2)
+        await asyncio.sleep(2)
         render_menu(full=True)
         return
 
-    old_up, old_down, old_select = btn_up.when_pressed, btn_down.when_pressed, btn_select.when_pressed
+    old_keys = dict(keys)
 
-    state = {"screen": "mode", "cursor": 0, "start": 0}
+    state = {"screen": "mode"}
     proc = {"p": None}
     output = []
 
+    mode_screen, modes = list_screen("Deauth:", ["Single AP", "Deauth All", "Back"], None)
+    ap_screen, ap_list = list_screen("Pick AP:", aps, "SEL: start", fmt=format_ap)
+    output_screen = log_screen("Deauth running", output, "SELECT: stop")
+
     def restore_menu():
-        btn_up.when_pressed, btn_down.when_pressed, btn_select.when_pressed = old_up, old_down, old_select
+        state["screen"] = "menu"
+        keys.update(old_keys)
         render_menu(full=True)
 
-    def draw_mode(full=False):
-        image = Image.new('1', (epd.height, epd.width), 255)
-        draw = ImageDraw.Draw(image)
-        draw.text((10, 5), "Deauth:", font=font_small, fill=0)
-        opts = ["Single AP", "Deauth All", "Back"]
-        y = 25
-        for i, txt in enumerate(opts):
-            prefix = "> " if i == state["cursor"] else "  "
-            draw.text((10, y), prefix + txt, font=font_small, fill=0)
-            y += 18
-
-        if full:
-            display_full(image)
-        else:
-            display_partial(image)
-
-    def draw_ap_list(full=False):
-        image = Image.new('1', (epd.height, epd.width), 255)
-        draw = ImageDraw.Draw(image)
-        draw.text((10, 5), "Pick AP:", font=font_small, fill=0)
-
-        PER_PAGE = 5
-        start = state["start"]
-        end = min(start + PER_PAGE, len(aps))
-        y = 25
-
-        for idx in range(start, end):
-            ap = aps[idx]
-            prefix = "> " if idx == state["cursor"] else "  "
-            essid = (ap["essid"] or "<hidden>")[:14]
-            ch = ap["channel"] or "?"
-            priv = (ap["privacy"] or "?")[:6]
-            draw.text((10, y), prefix + f"{essid} ch{ch} {priv}", font=font_small, fill=0)
-            y += 18
-
-        draw.text((10, epd.width - 16), "SEL: start", font=font_small, fill=0)
-
-        if full:
-            display_full(image)
-        else:
-            display_partial(image)
-
-    def draw_output(full=False):
-        image = Image.new('1', (epd.height, epd.width), 255)
-        draw = ImageDraw.Draw(image)
-        draw.text((10, 5), "Deauth running", font=font_small, fill=0)
-        y = 20
-        for line in output[-6:]:
-            draw.text((10, y), line[:40], font=font_small, fill=0)
-            y += 12
-        draw.text((10, epd.width - 16), "SELECT: stop", font=font_small, fill=0)
-
-        if full:
-            display_full(image)
-        else:
-            display_partial(image)
-
-    def stop_deauth():
+    async def stop_deauth():
         p = proc["p"]
         proc["p"] = None
         if p:
-            p.terminate()
-            try:
-                p.wait(timeout=2)
-            except Exception:
-                pass
+            await stop_process(p)
         restore_menu()
 
-    def start_deauth(cmd):
+    async def start_deauth(cmd):
         output.clear()
-        proc["p"] = subprocess.Popen(
-            cmd,
+        p = proc["p"] = await asyncio.create_subprocess_exec(
+            *cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1
         )
 
-        def reader():
-            for line in proc["p"].stdout:
-                output.append(line.strip())
-        threading.Thread(target=reader, daemon=True).start()
-
         state["screen"] = "output"
-        btn_up.when_pressed = None
-        btn_down.when_pressed = None
-        btn_select.when_pressed = stop_deauth
+        set_keys(select=stop_deauth)
 
         # Full refresh on screen switch
-        draw_output(full=True)
+        show_screen(output_screen, full=True)
 
-        # Periodic refresh so it doesn't look frozen
-        def refresher():
-            while state["screen"] == "output" and proc["p"] is not None:
-                draw_output(full=False)
-                time.sleep(0.25)
-
-        threading.Thread(target=refresher, daemon=True).start()
+        # Every line is redrawn as it comes, only new lines are drawn
+        async for line in p.stdout:
+            output.append(line.decode(errors="replace").strip())
+            if state["screen"] == "output":
+                show_screen(output_screen)
+        await p.wait()
 
     def up():
         if state["screen"] == "mode":
-            state["cursor"] = (state["cursor"] - 1) % 3
-            draw_mode(full=False)
+            modes.move(-1, wrap=True)
+            show_screen(mode_screen)
         elif state["screen"] == "list":
-            if state["cursor"] > 0:
-                state["cursor"] -= 1
-            if state["cursor"] < state["start"]:
-                state["start"] = state["cursor"]
-            draw_ap_list(full=False)
+            ap_list.move(-1)
+            show_screen(ap_screen)
 
     def down():
         if state["screen"] == "mode":
-            state["cursor"] = (state["cursor"] + 1) % 3
-            draw_mode(full=False)
+            modes.move(1, wrap=True)
+            show_screen(mode_screen)
         elif state["screen"] == "list":
-            if state["cursor"] < len(aps) - 1:
-                state["cursor"] += 1
-            PER_PAGE = 5
-            if state["cursor"] >= state["start"] + PER_PAGE:
-                state["start"] = state["cursor"] - PER_PAGE + 1
-            draw_ap_list(full=False)
-
-    def select():
+            ap_list.move(1)
+            show_screen(ap_screen)
+
+    async def select():
         if state["screen"] == "mode":
-            if state["cursor"] == 0:
+            if modes.cursor == 0:
                 state["screen"] = "list"
-                state["cursor"] = 0
-                state["start"] = 0
-                draw_ap_list(full=True)
-            elif state["cursor"] == 1:
-                start_deauth(["mdk4", "wlan0mon", "d"])
+                ap_list.set_items(aps)
+                show_screen(ap_screen, full=True)
+            elif modes.cursor == 1:
+                await start_deauth(["mdk4", "wlan0mon", "d"])
             else:
                 restore_menu()
 
         elif state["screen"] == "list":
-            ap = aps[state["cursor"]]
-            start_deauth(["mdk4", "wlan0mon", "d", "-b", ap["bssid"]])
+            ap = ap_list.selected()
+            await start_deauth(["mdk4", "wlan0mon", "d", "-b", ap["bssid"]])
 
-    btn_up.when_pressed = up
-    btn_down.when_pressed = down
-    btn_select.when_pressed = select
+    set_keys(up=up, down=down, select=select)
 
     # Full refresh on entering mode menu
-    draw_mode(full=True)
+    show_screen(mode_screen, full=True)
 
 
 def main():
-    global epd, font_menu, font_small, current_index, btn_up, btn_down, btn_select
+    asyncio.run(run())
 
-    epd = epd2in13_V4.EPD()
-    epd.init()
+
+async def run():
+    global loop, display_queue, display_executor
+    global epd, panel, refresh_policy, idle, canvas, packer, font_menu, font_small, current_index, btn_up, btn_down, btn_select
+
+    loop = asyncio.get_running_loop()
+    display_queue = asyncio.Queue()
+    display_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="display")
+
+    panel = waveshare_epd.panel(EPD_PANEL)
+    epd = waveshare_epd.create(EPD_PANEL)
+    await on_display(epd.init)
+    refresh_policy = RefreshPolicy.for_driver(epd, panel)
+    idle = IdleManager(epd, refresh_policy)
+    display = loop.create_task(display_task())
 
     font_menu = ImageFont.truetype(FONT_PATH, 16)
     font_small = ImageFont.truetype(FONT_PATH, 10)
+    packer = ui.Packer(epd, panel.size)
+    canvas = ui.Canvas(panel.size, packer=packer)
 
     os.makedirs(DATA_SCANS, exist_ok=True)
 
@@ -433,23 +722,27 @@ def main():
         current_index = (current_index + 1) % len(menu_items)
         render_menu(full=False)
 
-    def on_select():
+    async def on_select():
         item = menu_items[current_index]
         logging.info("Selected: %s", item)
 
         if item == "Scan WiFi":
-            scan_wifi_view()
+            await scan_wifi_view()
             return
 
         if item == "Deauth":
-            deauth_view()
+            await deauth_view()
             return
 
         if item == "Probe Request Flood":
             draw_text_screen(["Probe flood..."], full=True)
-            probe_request_flood("", "wlan0mon")
+            old_keys = set_keys()
+            try:
+                await probe_request_flood_async("wlan0mon")
+            finally:
+                keys.update(old_keys)
             draw_text_screen(["Done"], full=True)
-            time.sleep(1)
+            await asyncio.sleep(1)
             render_menu(full=True)
             return
 
@@ -457,86 +750,68 @@ def main():
             draw_text_screen(["Beacon flood...", "SELECT: stop"], full=True)
             output = []
 
-            proc = subprocess.Popen(
-                ['sudo', 'mdk4', 'wlan0mon', 'b', '-a'],
+            proc = await asyncio.create_subprocess_exec(
+                'sudo', 'mdk4', 'wlan0mon', 'b', '-a',
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                preexec_fn=os.setsid,   # ważne: osobna grupa procesów
+                start_new_session=True,   # ważne: osobna grupa procesów
             )
 
-            def reader():
-                for line in proc.stdout:
-                    output.append(line.strip())
-            threading.Thread(target=reader, daemon=True).start()
-
-            old_select = btn_select.when_pressed
-
-            def draw_beacon_output(full=False):
-                image = Image.new('1', (epd.height, epd.width), 255)
-                draw = ImageDraw.Draw(image)
-                draw.text((10, 5), "Beacon flood", font=font_small, fill=0)
-                y = 20
-                for line in output[-6:]:
-                    draw.text((10, y), line[:40], font=font_small, fill=0)
-                    y += 12
-                draw.text((10, epd.width - 16), "SELECT: stop", font=font_small, fill=0)
-
-                if full:
-                    display_full(image)
-                else:
-                    display_partial(image)
-
-            def stop_beacon():
+            old_keys = dict(keys)
+
+            beacon_screen = log_screen("Beacon flood", output, "SELECT: stop")
+
+            async def stop_beacon():
+                set_keys()
                 # ubij całą grupę (sudo + mdk4), a nie tylko wrappera
-                try:
-                    os.killpg(proc.pid, signal.SIGTERM)
-                except Exception:
-                    pass
-                try:
-                    proc.wait(timeout=2)
-                except Exception:
-                    try:
-                        os.killpg(proc.pid, signal.SIGKILL)
-                    except Exception:
-                        pass
-
-                btn_select.when_pressed = old_select
+                await stop_process(proc, group=True)
+
+                keys.update(old_keys)
                 draw_text_screen(["Done"], full=True)
-                time.sleep(1)
+                await asyncio.sleep(1)
                 render_menu(full=True)
 
-            btn_select.when_pressed = stop_beacon
-            draw_beacon_output(full=True)
-
-            def refresher():
-                while proc.poll() is None:
-                    draw_beacon_output(full=False)
-                    time.sleep(0.25)
-            threading.Thread(target=refresher, daemon=True).start()
+            set_keys(up=old_keys["up"], down=old_keys["down"], select=stop_beacon)
+            show_screen(beacon_screen, full=True)
 
+            async for line in proc.stdout:
+                output.append(line.decode(errors="replace").strip())
+                if keys["select"] is stop_beacon:
+                    show_screen(beacon_screen)
             return
 
         if item == "Power Off":
-            power_off()
+            await power_off()
             return
 
-    btn_up.when_pressed = on_up
-    btn_down.when_pressed = on_down
-    btn_select.when_pressed = on_select
+    # gpiozero calls these on its own thread, the handlers run on the loop
+    btn_up.when_pressed = lambda: loop.call_soon_threadsafe(dispatch, "up")
+    btn_down.when_pressed = lambda: loop.call_soon_threadsafe(dispatch, "down")
+    btn_select.when_pressed = lambda: loop.call_soon_threadsafe(dispatch, "select")
+    set_keys(up=on_up, down=on_down, select=on_select)
 
     # Full refresh on first menu
     render_menu(full=True)
 
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
     try:
-        while True:
-            time.sleep(0.1)
-    except KeyboardInterrupt:
-        pass
+        await stop.wait()
     finally:
-        clear_screen()
-        epd2in13_V4.epdconfig.module_exit(cleanup=True)
+        for task in list(tasks):
+            task.cancel()
+        # let them stop their tools before the panel is cleared
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await clear_screen()
+        display.cancel()
+        refresh_policy.report()
+        idle.report()
+        logging.info("text cache: %s", canvas.cache.stats())
+        epdconfig = waveshare_epd.load(EPD_PANEL).epdconfig
+        await on_display(lambda: epdconfig.module_exit(cleanup=True))
+        display_executor.shutdown()
 
 
 if __name__ == "__main__":
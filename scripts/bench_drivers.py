@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark the display pipeline of every driver in lib/waveshare_epd.
+
+Each driver runs against a recording stand-in for SPI and GPIO (the
+virtual epdconfig backend with the RAM model switched off) and is fed the
+standard test frames: the text menu, the AP list and a photo. For
+getbuffer, display, the partial display, Clear and display_4Gray it reports
+
+    ms       best host time of the call, the stand-in itself excluded
+    bytes    bytes sent over SPI
+    xfers    SPI transactions (spi_writebyte / spi_writebyte2 calls)
+    busy_ms  BUSY time the panel would add, from the virtual model
+    alloc    peak bytes allocated by Python during the call (tracemalloc)
+
+and with --json also writes everything to a JSON file, to compare
+between releases.
+
+    python3 scripts/bench_drivers.py [--repeat N] [--json FILE] [driver ...]
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import random
+import inspect
+import argparse
+import platform
+import importlib
+import tracemalloc
+
+os.environ['EPD_BACKEND'] = 'virtual'
+os.environ.pop('EPD_VIRTUAL_PNG', None)
+os.environ.pop('EPD_VIRTUAL_REALTIME', None)
+
+import PIL
+from PIL import Image, ImageDraw, ImageFont
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from lib.waveshare_epd import epdconfig
+
+FONT_PATH = os.path.join(BASE_DIR, "fonts", "Font.ttc")
+
+# init() / Clear() arguments of the drivers that need some
+INIT_ARGS = {
+    "epd1in54": lambda epd: (epd.lut_full_update,),
+    "epd2in13": lambda epd: (epd.lut_full_update,),
+    "epd2in9": lambda epd: (epd.lut_full_update,),
+    "epd1in54_V2": lambda epd: (False,),
+    "epd2in13_V2": lambda epd: (epd.FULL_UPDATE,),
+    "epd2in66": lambda epd: (0,),
+    "epd3in7": lambda epd: (1,),
+}
+INIT_4GRAY_ARGS = {
+    "epd3in7": lambda epd: (0,),
+}
+CLEAR_ARGS = {
+    "epd3in7": lambda epd: (0xFF, 1),
+}
+
+PARTIAL_METHODS = ("displayPartial", "display_Partial", "display_partial")
+INIT_4GRAY_METHODS = ("init_4Gray", "init_4GRAY")
+
+
+class Recorder(epdconfig.Virtual):
+    # Virtual without the log and the RAM copy, so they do not show up in
+    # the time and allocation figures. Commands still go through the model
+    # for the BUSY times.
+
+    def reset_log(self):
+        super().reset_log()
+        self.xfers = 0
+
+    def _transfer(self, data):
+        start = time.perf_counter()
+        view = epdconfig._as_bytes(data)
+        self.xfers += 1
+        self.spi_bytes += len(view)
+        if self.pins[self.DC_PIN]:
+            self._data(view)
+        else:
+            for command in bytes(view):
+                self._command(command)
+        self.spi_time += time.perf_counter() - start
+
+    def _ram_write(self, data):
+        self.written += len(data)
+
+
+def install_recorder():
+    recorder = Recorder()
+    for func in [x for x in dir(recorder) if not x.startswith('_')]:
+        setattr(epdconfig, func, getattr(recorder, func))
+    epdconfig.implementation = recorder
+    return recorder
+
+
+def load_fonts():
+    try:
+        return ImageFont.truetype(FONT_PATH, 16), ImageFont.truetype(FONT_PATH, 10)
+    except OSError:
+        font = ImageFont.load_default()
+        return font, font
+
+
+def menu_frame(size, fonts):
+    # draw_menu_image() of main.py
+    font_menu, font_small = fonts
+    image = Image.new('1', size, 255)
+    draw = ImageDraw.Draw(image)
+    draw.text((10, 5), "Menu", font=font_menu, fill=0)
+    items = ["Scan WiFi", "Deauth", "Probe flood", "Beacon flood", "Clear", "Power off"]
+    for i, item in enumerate(items):
+        draw.text((10, 35 + i * 18), ("> " if i == 1 else "  ") + item, font=font_small, fill=0)
+    return image
+
+
+def ap_list_frame(size, fonts):
+    # draw() of scan_wifi_view() in main.py
+    font_small = fonts[1]
+    image = Image.new('1', size, 255)
+    draw = ImageDraw.Draw(image)
+    draw.text((10, 5), "AP list", font=font_small, fill=0)
+    for i in range(size[1] // 18 - 2):
+        line = "%s ch%d %s" % (("Livebox-%04X" % (i * 7919 & 0xFFFF))[:14], 1 + i * 5 % 13,
+                               ("WPA2", "WPA3", "OPN")[i % 3])
+        draw.text((10, 25 + i * 18), ("> " if i == 2 else "  ") + line, font=font_small, fill=0)
+    draw.text((10, size[1] - 16), "SELECT: back", font=font_small, fill=0)
+    return image
+
+
+def photo_frame(size, fonts):
+    # smooth gradients with sensor noise, the worst case for dithering.
+    # The noise is seeded so the figures stay comparable between runs.
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.frombytes('L', size, random.Random(0).randbytes(size[0] * size[1]))
+    return Image.merge('RGB', (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+
+
+FRAMES = (("menu", menu_frame), ("ap_list", ap_list_frame), ("photo", photo_frame))
+
+
+def measure(recorder, fn, repeat):
+    best = None
+    for _ in range(repeat):
+        recorder.reset_log()
+        recorder.busy_pending = 0.0
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start - recorder.spi_time
+        best = elapsed if best is None else min(best, elapsed)
+
+    recorder.reset_log()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    fn()
+    alloc = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    return out, {
+        "ms": round(best * 1000, 3),
+        "bytes": recorder.spi_bytes,
+        "xfers": recorder.xfers,
+        "busy_ms": recorder.busy_total,
+        "alloc": alloc,
+    }
+
+
+def positional(fn):
+    return [p for p in inspect.signature(fn).parameters.values()
+            if p.default is p.empty and p.kind == p.POSITIONAL_OR_KEYWORD]
+
+
+def bench_driver(name, recorder, fonts, repeat):
+    module = importlib.import_module('lib.waveshare_epd.' + name)
+    epd = module.EPD()
+    init_args = INIT_ARGS.get(name, lambda epd: ())(epd)
+    epd.init(*init_args)
+
+    size = (max(epd.width, epd.height), min(epd.width, epd.height))
+    blank = epd.getbuffer(Image.new('1', size, 255))
+    result = {"size": [epd.width, epd.height], "calls": {}}
+    calls = result["calls"]
+
+    def record(call, frame, stats):
+        calls.setdefault(call, {})[frame] = stats
+
+    for frame_name, make in FRAMES:
+        image = make(size, fonts)
+        buf, stats = measure(recorder, lambda: epd.getbuffer(image), repeat)
+        record("getbuffer", frame_name, stats)
+
+        display = getattr(epd, "display", None) or getattr(epd, "display_1Gray")
+        # the second plane of the b/c panels stays blank
+        args = [buf] + [blank] * (len(positional(display)) - 1)
+        _, stats = measure(recorder, lambda: display(*args), repeat)
+        record("display", frame_name, stats)
+
+        for method in PARTIAL_METHODS:
+            partial = getattr(epd, method, None)
+            if partial is not None:
+                args = [buf, 0, 0, epd.width, epd.height][:len(positional(partial))]
+                _, stats = measure(recorder, lambda: partial(*args), repeat)
+                record("displayPartial", frame_name, stats)
+                epd.init(*init_args)
+                break
+
+        if hasattr(epd, "display_4Gray") and frame_name == "photo":
+            for method in INIT_4GRAY_METHODS:
+                if hasattr(epd, method):
+                    getattr(epd, method)()
+                    break
+            else:
+                epd.init(*INIT_4GRAY_ARGS.get(name, lambda epd: init_args)(epd))
+            gray, stats = measure(recorder, lambda: epd.getbuffer_4Gray(image), repeat)
+            record("getbuffer_4Gray", frame_name, stats)
+            _, stats = measure(recorder, lambda: epd.display_4Gray(gray), repeat)
+            record("display_4Gray", frame_name, stats)
+            epd.init(*init_args)
+
+    clear_args = CLEAR_ARGS.get(name, lambda epd: ())(epd)
+    _, stats = measure(recorder, lambda: epd.Clear(*clear_args), repeat)
+    record("Clear", "-", stats)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("drivers", nargs="*", help="driver modules, all by default")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    names = args.drivers or sorted(
+        os.path.basename(f)[:-3]
+        for f in glob.glob(os.path.join(BASE_DIR, "lib", "waveshare_epd", "epd[0-9]*.py")))
+    fonts = load_fonts()
+
+    report = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+        },
+        "drivers": {},
+        "errors": {},
+    }
+
+    print("%-16s %-15s %-8s %9s %9s %6s %8s %10s" % (
+        "driver", "call", "frame", "ms", "bytes", "xfers", "busy_ms", "alloc"))
+    for name in names:
+        # a fresh panel per driver, the command set seen is sticky
+        recorder = install_recorder()
+        try:
+            result = bench_driver(name, recorder, fonts, args.repeat)
+        except Exception as e:
+            report["errors"][name] = repr(e)
+            print("%-16s error: %r" % (name, e))
+            continue
+        report["drivers"][name] = result
+        for call, frames in result["calls"].items():
+            for frame, s in frames.items():
+                print("%-16s %-15s %-8s %9.2f %9d %6d %8.0f %10d" % (
+                    name, call, frame, s["ms"], s["bytes"], s["xfers"], s["busy_ms"], s["alloc"]))
+
+    print("%d driver(s), %d error(s)" % (len(report["drivers"]), len(report["errors"])))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+        print("written to %s" % args.json)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
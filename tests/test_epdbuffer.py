@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""dirty_rects() on 1 bit and multi-bit frame buffers.
+
+    python3 -m pytest tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from lib.waveshare_epd import epdbuffer
+
+
+class DirtyRectsTest(unittest.TestCase):
+
+    def test_1bit_window(self):
+        width, height = 122, 250
+        old = bytearray(epdbuffer.fill(0xFF, epdbuffer.linewidth(width) * height))
+        new = bytearray(old)
+        new[epdbuffer.linewidth(width) * 40 + 3] = 0x00
+        self.assertEqual(epdbuffer.dirty_rects(old, new, width, height), [(24, 40, 32, 41)])
+        self.assertEqual(epdbuffer.dirty_rects(old, bytes(old), width, height), [])
+
+    def test_4bpp_change_past_1bit_size(self):
+        # epd7in3f and the other ACeP panels pack 2 pixels per byte
+        width, height = 800, 480
+        old = bytearray(epdbuffer.fill(0x11, width * height // 2))
+        new = bytearray(old)
+        new[-1] = 0x00
+        self.assertEqual(epdbuffer.dirty_rects(old, new, width, height), [(0, 0, width, height)])
+        self.assertEqual(epdbuffer.dirty_rects(old, bytes(old), width, height), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
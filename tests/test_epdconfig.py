@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The Raspberry Pi backend against gpiozero's mock pins: wait_busy() and the
+DEV_Config.so life cycle.
+
+    python3 -m pytest tests
+"""
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from gpiozero import Device
+from gpiozero.pins.mock import MockFactory
+
+from lib.waveshare_epd import epdconfig
+
+
+class WaitBusyTest(unittest.TestCase):
+
+    def setUp(self):
+        Device.pin_factory = MockFactory()
+        self.epd = epdconfig.RaspberryPi()
+        self.busy = Device.pin_factory.pin(epdconfig.RaspberryPi.BUSY_PIN)
+
+    def tearDown(self):
+        Device.pin_factory.close()
+        Device.pin_factory = None
+
+    def release_after(self, seconds, high):
+        # move BUSY back to idle from another thread, like the panel does
+        def drive():
+            time.sleep(seconds)
+            if high:
+                self.busy.drive_high()
+            else:
+                self.busy.drive_low()
+        thread = threading.Thread(target=drive)
+        thread.start()
+        return thread
+
+    def test_idle_returns_at_once(self):
+        self.busy.drive_low()
+        self.assertLess(self.epd.wait_busy(1, timeout=1000), 50)
+
+    def test_wakes_on_falling_edge(self):
+        self.busy.drive_high()
+        thread = self.release_after(0.2, high=False)
+        start = time.monotonic()
+        busy_ms = self.epd.wait_busy(1, timeout=5000)
+        elapsed = (time.monotonic() - start) * 1000
+        thread.join()
+        self.assertGreaterEqual(busy_ms, 180)
+        self.assertLess(busy_ms, 1000)
+        # the returned figure is the time actually spent waiting
+        self.assertAlmostEqual(busy_ms, elapsed, delta=20)
+
+    def test_wakes_on_rising_edge(self):
+        # panels that hold BUSY low while refreshing
+        self.busy.drive_low()
+        thread = self.release_after(0.2, high=True)
+        busy_ms = self.epd.wait_busy(0, timeout=5000)
+        thread.join()
+        self.assertGreaterEqual(busy_ms, 180)
+        self.assertLess(busy_ms, 1000)
+
+    def test_timeout(self):
+        self.busy.drive_high()
+        with self.assertLogs(epdconfig.logger, 'WARNING'):
+            busy_ms = self.epd.wait_busy(1, timeout=150)
+        self.assertGreaterEqual(busy_ms, 150)
+        self.assertLess(busy_ms, 1000)
+
+    def test_poll_runs_while_busy(self):
+        self.busy.drive_high()
+        polls = []
+        thread = self.release_after(0.3, high=False)
+        self.epd.wait_busy(1, timeout=5000, poll=lambda: polls.append(1), poll_ms=50)
+        thread.join()
+        self.assertGreaterEqual(len(polls), 3)
+
+
+class DevConfigTest(unittest.TestCase):
+
+    class Library:
+        # stands in for the loaded DEV_Config.so
+        def __init__(self):
+            self.calls = []
+
+        def DEV_Module_Init(self):
+            self.calls.append('init')
+
+        def DEV_Module_Exit(self):
+            self.calls.append('exit')
+
+    def setUp(self):
+        Device.pin_factory = MockFactory()
+        self.epd = epdconfig.RaspberryPi()
+        self.epd.transport = 'devconfig'
+        self.epd.DEV_SPI = self.lib = self.Library()
+
+    def tearDown(self):
+        Device.pin_factory.close()
+        Device.pin_factory = None
+
+    def test_library_kept_across_sleep(self):
+        for _ in range(2):
+            self.epd.module_init()
+            self.epd.module_init()
+            self.epd.module_exit()
+        self.assertIs(self.epd.DEV_SPI, self.lib)
+        self.assertEqual(self.lib.calls, ['init', 'exit', 'init', 'exit'])
+
+
+if __name__ == '__main__':
+    unittest.main()
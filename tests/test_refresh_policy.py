@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""RefreshPolicy of main.py on the virtual backend, for panels other than
+the default epd2in13_V4.
+
+    python3 -m pytest tests
+"""
+
+import os
+import sys
+import importlib.util
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+os.environ['EPD_BACKEND'] = 'virtual'
+
+from lib import waveshare_epd
+from lib.waveshare_epd import epdbuffer
+
+
+@unittest.skipUnless(importlib.util.find_spec('scapy'), "main.py needs scapy")
+class RefreshPolicyTest(unittest.TestCase):
+
+    def policy(self, name):
+        import main
+        panel = waveshare_epd.panel(name)
+        epd = waveshare_epd.create(name)
+        epd.init()
+        return main.RefreshPolicy.for_driver(epd, panel), panel
+
+    def frames(self, panel, count):
+        size = epdbuffer.linewidth(panel.width) * panel.height
+        blank = epdbuffer.fill(0xFF, size)
+        for i in range(count):
+            buf = bytearray(blank)
+            buf[i % size] = 0x00
+            yield buf, [(0, 0, 8, 1)]
+
+    def run_frames(self, name, count=4):
+        policy, panel = self.policy(name)
+        modes = []
+        for buf, rects in self.frames(panel, count):
+            policy.refresh(buf, rects)
+            modes.append(policy.mode)
+        return policy, modes
+
+    def test_display_region_panels_refresh_partially(self):
+        for name in ('epd4in2', 'epd13in3k', 'epd13in3b'):
+            policy, modes = self.run_frames(name)
+            self.assertTrue(policy.can_partial, name)
+            self.assertEqual(modes, ['full', 'partial', 'partial', 'partial'], name)
+
+    def test_full_only_panel(self):
+        policy, modes = self.run_frames('epd2in7b')
+        self.assertFalse(policy.can_partial)
+        self.assertEqual(modes, ['full'] * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()